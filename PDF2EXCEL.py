@@ -2,101 +2,17 @@ import os
 import subprocess
 import sys
 import re
+import time
+from collections import deque
+from itertools import groupby
 from tkinter import *
 from tkinter import filedialog, messagebox, ttk, font, scrolledtext
-from pdf2image import convert_from_path
-import pytesseract
-import openpyxl
-from openpyxl import Workbook
-import webbrowser
 from threading import Thread
 import logging
 import tkinter as tk
-import glob
-from openpyxl.styles import Alignment, PatternFill, Font
-import csv
-import tempfile
-import shutil
-from PIL import Image, ImageTk # Necessário para carregar e exibir imagens .ico
-
-# *** Configuração de Logging ***
-log_dir = os.path.join(os.environ['APPDATA'], 'PDF2EXCEL')
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-log_file_path = os.path.join(log_dir, 'PDF2EXCEL.log')
-
-# Configuração do logger global para ser manipulado pela GUI
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
-# Limpa handlers existentes para evitar duplicação em re-execuções (útil para desenvolvimento)
-if logger.handlers:
-    for handler in logger.handlers[:]: # Itera sobre uma cópia para permitir modificação
-        logger.removeHandler(handler)
-        if isinstance(handler, logging.FileHandler):
-            handler.close() # Garante que o arquivo seja fechado
-
-# Adiciona handler de arquivo
-file_handler = logging.FileHandler(log_file_path, mode='w', encoding='utf-8')
-file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-logger.addHandler(file_handler)
-
-logger.info("Programa PDF2EXCEL iniciado.") # Primeiro log ao iniciar
-
-# *** Configuração do Filtro de CNPJ ***
-filtro_config_path = os.path.join(log_dir, 'Filtro.config')
-ignored_cnpjs_list = []
-DEFAULT_IGNORED_CNPJ = "82.519.190/0001-12" # CNPJ da OAB como padrão
-
-def load_ignored_cnpjs():
-    global ignored_cnpjs_list
-    try:
-        if os.path.exists(filtro_config_path):
-            with open(filtro_config_path, 'r', encoding='utf-8') as f:
-                content = f.read().strip()
-                if content:
-                    ignored_cnpjs_list = [cnpj.strip() for cnpj in content.split(',') if cnpj.strip()]
-                else:
-                    # Se o arquivo existe mas está vazio, usa o padrão e salva
-                    ignored_cnpjs_list = [DEFAULT_IGNORED_CNPJ]
-                    save_cnpjs_to_config(DEFAULT_IGNORED_CNPJ) # Salva o padrão se o arquivo estiver vazio
-        else:
-            # Se o arquivo não existe, cria com o padrão
-            ignored_cnpjs_list = [DEFAULT_IGNORED_CNPJ]
-            save_cnpjs_to_config(DEFAULT_IGNORED_CNPJ) # Salva o padrão se o arquivo não existir
-    except Exception as e:
-        logger.error(f"Erro ao carregar CNPJs ignorados: {e}")
-        ignored_cnpjs_list = [DEFAULT_IGNORED_CNPJ] # Fallback para o padrão em caso de erro
-    logger.info(f"CNPJs ignorados carregados: {ignored_cnpjs_list}")
-
-def save_cnpjs_to_config(cnpjs_string):
-    global ignored_cnpjs_list
-    try:
-        with open(filtro_config_path, 'w', encoding='utf-8') as f:
-            f.write(cnpjs_string)
-        # Recarrega a lista após salvar
-        load_ignored_cnpjs()
-        logger.info(f"CNPJs ignorados salvos em {filtro_config_path}: {cnpjs_string}")
-        return True
-    except Exception as e:
-        logger.error(f"Erro ao salvar CNPJs no arquivo de configuração: {e}")
-        messagebox.showerror("Erro", f"Não foi possível salvar o arquivo de configuração de CNPJs: {e}", icon="error")
-        return False
-
-# Carrega os CNPJs ignorados na inicialização
-load_ignored_cnpjs()
-
-# Definir o caminho do Poppler (apenas para a versão .exe)
-poppler_path = os.path.join(sys._MEIPASS, 'poppler', 'bin') if getattr(sys, 'frozen', False) else r"C:\Program Files\poppler\bin"
-
-# Se o Poppler não estiver na pasta padrão do executável, verifica se está instalado em C:\Program Files\poppler\bin
-if getattr(sys, 'frozen', False) and not os.path.exists(poppler_path):
-    poppler_path = r"C:\Program Files\poppler\bin"  # Define o caminho alternativo
-
-# Definir o caminho do Tesseract OCR (apenas para a versão .exe)
-pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-
-# Variável global para controle de processamento (usada para cancelar a thread)
-processing = False
+import pdf2excel_core as core
+from pdf2excel_core import (logger, log_file_path, filtro_config_path, save_cnpjs_to_config, poppler_path,
+                            DEFAULT_OCR_WORKERS, BatchConfig, BatchProcessor)
 
 # Centraliza o programa na tela
 def center_window(window):
@@ -109,74 +25,10 @@ def center_window(window):
     y = (screen_height // 2) - (height // 2)
     window.geometry(f'+{x}+{y}')
 
-def ocr_pdf(pdf_path, temp_dir):
-    """
-    Realiza OCR em cada página do PDF e retorna uma lista de textos, um para cada página.
-    Também retorna o número total de páginas.
-    """
-    try:
-        images = convert_from_path(pdf_path, poppler_path=poppler_path, output_folder=temp_dir, paths_only=False, fmt='jpeg')
-        num_pages_in_pdf = len(images)
-        texts_per_page = []
-        for image_idx, image in enumerate(images):
-            if not processing: # Checa a flag global de cancelamento
-                logger.info(f"Processamento OCR de {os.path.basename(pdf_path)} cancelado na página {image_idx+1}.")
-                break
-            page_text = pytesseract.image_to_string(image, lang='por')
-            texts_per_page.append(page_text)
-        return texts_per_page, num_pages_in_pdf
-    except Exception as e:
-        logger.exception(f"Erro ao processar OCR do PDF: {pdf_path}")
-        return [], 0 # Retorna lista vazia e 0 páginas em caso de erro
-
-def extract_info(text):
-    global ignored_cnpjs_list
-    cnpj = None
-    linhas_digitaveis = []
-    valores_monetarios = []
-    numero_guia = None
-    valor = None
-
-    cnpj_matches = re.findall(r'(\d{2}\.\d{3}\.\d{3}\/\d{4}\-\d{2})', text)
-    valid_cnpjs = [cnp for cnp in cnpj_matches if cnp not in ignored_cnpjs_list]
-    if valid_cnpjs:
-        cnpj = valid_cnpjs[0]
-    else:
-        cnpj = 'N/A'
-
-    if "GUIA ÚNICA DE CUSTAS" in text:
-        numero_guia_match = re.search(r"Nº da Guia\s*([\d\.]+/\d+)", text)
-        if numero_guia_match:
-            numero_guia = numero_guia_match.group(1)
-        valor_match = re.search(r"R\$\s*([\d,.]+)", text)
-        if valor_match:
-            valor = valor_match.group(1)
-        return {
-            'cnpj': cnpj,
-            'numero_guia': numero_guia,
-            'valor': valor,
-            'linhas_digitaveis': [],
-            'valores': [],
-            'tipo': 'guia_custas'
-        }
-    else:
-        # A linha abaixo remove padrões como "123-4" que podem confundir o OCR em linhas digitáveis.
-        text = re.sub(r'\d{3}-\d', '', text)
-        for line in text.splitlines():
-            cleaned_line = re.sub(r'[^0-9]', '', line) # Remove tudo que não é número
-            if 47 <= len(cleaned_line) <= 48: # Procura por linhas de 47 ou 48 dígitos
-                linhas_digitaveis.append(cleaned_line)
-                # Extrai o valor monetário dos últimos 10 dígitos (considerando os 2 decimais)
-                valor_monetario = f"{cleaned_line[-10:-2]},{cleaned_line[-2:]}"
-                valores_monetarios.append(valor_monetario)
-        return {
-            'cnpj': cnpj,
-            'linhas_digitaveis': linhas_digitaveis,
-            'valores': valores_monetarios,
-            'numero_guia': None,
-            'valor': None,
-            'tipo': 'boleto'
-        }
+# Abre a planilha, o log ou um PDF no programa padrão (webbrowser importado só quando usado)
+def open_in_browser(path):
+    import webbrowser
+    webbrowser.open_new_tab(f"file://{path}")
 
 # Funções globais auxiliares que ainda podem ser chamadas.
 def create_rounded_button(parent, text, command, width=20, height=20, bg_color=None):
@@ -203,6 +55,7 @@ class PDF2EXCEL:
         # Tenta carregar e definir o ícone da janela principal
         self.icon_image = None
         try:
+            from PIL import Image, ImageTk # Necessário para carregar e exibir imagens .ico
             self.icon_image = ImageTk.PhotoImage(Image.open("correios_icon.ico"))
             self.root.iconphoto(True, self.icon_image) # Define o ícone para a janela principal e popups futuros
         except FileNotFoundError:
@@ -237,6 +90,8 @@ class PDF2EXCEL:
         self.save_csv_var = tk.BooleanVar()
         self.total_pages_to_process = 0
         self.processed_pages_count = 0
+        self.processing = False # True enquanto um lote está em andamento e não foi cancelado
+        self.batch_processor = None # BatchProcessor do lote atual
 
         main_frame = ttk.Frame(self.root, padding=10)
         main_frame.pack(fill=tk.BOTH, expand=True)
@@ -275,6 +130,14 @@ class PDF2EXCEL:
         self.custas_entry.pack(side=tk.LEFT, padx=5)
         self.custas_entry.bind("<KeyRelease>", self.limit_custas_entry)
 
+        # Quantidade de PDFs processados em paralelo pelo OCR
+        workers_group_frame = ttk.Frame(combined_param_options_frame)
+        workers_group_frame.pack(side=tk.LEFT, padx=(0, 20))
+        ttk.Label(workers_group_frame, text="PDFs em Paralelo:").pack(side=tk.LEFT, padx=5)
+        self.ocr_workers_var = tk.StringVar(value=str(DEFAULT_OCR_WORKERS))
+        self.ocr_workers_spinbox = ttk.Spinbox(workers_group_frame, from_=1, to=max(DEFAULT_OCR_WORKERS, 32), width=4, textvariable=self.ocr_workers_var)
+        self.ocr_workers_spinbox.pack(side=tk.LEFT, padx=5)
+
         # Checkbox para CSV
         self.save_csv_check = ttk.Checkbutton(combined_param_options_frame, text="Gerar Relatório em CSV?", variable=self.save_csv_var) # Texto do checkbox alterado
         self.save_csv_check.pack(side=tk.LEFT, padx=10)
@@ -339,12 +202,7 @@ class PDF2EXCEL:
 
     def log_message(self, message, level="INFO"):
         """Adiciona uma mensagem ao log (thread-safe via after) e também ao arquivo de log."""
-        if level == "INFO": logger.info(message)
-        elif level == "WARNING": logger.warning(message)
-        elif level == "ERROR": logger.error(message)
-        elif level == "CRITICAL_ERROR": logger.critical(message)
-        elif level == "DEBUG": logger.debug(message)
-        elif level == "SUCCESS": logger.info(message) # SUCCESS é tratado como INFO no arquivo de log
+        core.log_message(message, level)
 
     def update_progress_ocr_page(self, pages_processed):
         """Este método não é mais usado para a barra de progresso principal,
@@ -358,14 +216,13 @@ class PDF2EXCEL:
 
     def _update_main_button_state(self, state):
         """Atualiza o texto, comando e estilo do botão principal de processamento."""
-        global processing # Acessa a flag global para sincronização
 
         if state == 'initial': # Estado inicial ou após conclusão/cancelamento
             self.process_button.config(text="             Iniciar Processamento             ",
                                     command=self.start_processing,
                                     style="Process.TButton",
                                     state=tk.NORMAL)
-            processing = False # Garante que a flag global esteja False
+            self.processing = False # Garante que a flag esteja False
             self.status_label.config(text="Aguardando configuração...")
             self.progress_bar.config(value=0)
             self.set_progress_bar_style("Default.Horizontal.TProgressbar")
@@ -376,7 +233,7 @@ class PDF2EXCEL:
                                     command=self.cancel_processing_gui,
                                     style="Cancel.TButton", # Usar o estilo de cancelamento
                                     state=tk.NORMAL) # Botão habilitado para permitir o cancelamento
-            processing = True # Define a flag global para iniciar
+            self.processing = True # Define a flag para iniciar
 
         elif state == 'cancelling_pending': # Após clicar em cancelar, antes da thread terminar
             self.process_button.config(text="             Cancelando... Aguarde             ",
@@ -385,300 +242,58 @@ class PDF2EXCEL:
                                     state=tk.DISABLED) # Desabilita para evitar múltiplos cliques
             self.status_label.config(text="Cancelando... Por favor, aguarde.")
             self.set_progress_bar_style("Error.Horizontal.TProgressbar")
-            processing = False # Sinaliza o cancelamento na flag global
-
-    def _actual_processing_task(self, input_files_list, output_dir_str, result_file_str, custas_str, save_csv_bool):
-        """Contém o loop principal de processamento de PDF, executa em uma thread separada."""
-        global processing # Acessa a variável global 'processing'
+            self.processing = False # Sinaliza o cancelamento na flag
 
+    def _actual_processing_task(self, batch_processor):
+        """Executa o lote (pdf2excel_core.BatchProcessor) em uma thread separada,
+        repassando os eventos de progresso para a GUI via root.after."""
         self.log_message("Thread de processamento iniciada.", "DEBUG")
 
-        self.total_pages_to_process = len(input_files_list) # Maximo da barra é o número de PDFs
+        self.total_pages_to_process = len(batch_processor.input_files) # Maximo da barra é o número de PDFs
         self.root.after(0, lambda: self.progress_bar.config(maximum=self.total_pages_to_process))
         self.root.after(0, lambda: self.status_label.config(text=f"Iniciando processamento de {self.total_pages_to_process} documentos..."))
         self.root.after(0, lambda: self.set_progress_bar_style("Default.Horizontal.TProgressbar"))
-
-        error_messages = []
-        arquivos_com_paginas_a_mais = set()
-        arquivos_com_dados_incompletos = set()
-        linhas_digitaveis_processadas = set() # Inicializado por execução da thread para evitar duplicatas entre PDFs
-
-        temp_dir_obj = tempfile.TemporaryDirectory()
-        temp_dir = temp_dir_obj.name
-        self.log_message(f"Pasta temporária criada para OCR: {temp_dir}", "DEBUG")
-
+        self.processed_pages_count = 0 # Reinicia o contador para a nova execução
+
+        def on_batch_event(event, data):
+            if event == 'file_started':
+                self.root.after(0, lambda p=data['name']: self.status_label.config(text=f"Processando: {p}"))
+            elif event == 'file_done':
+                count, total, name = data['processed'], data['total'], data['name']
+                self.processed_pages_count = count
+                self.root.after(0, lambda: self.progress_bar.config(value=count))
+                self.root.after(0, lambda: self.status_label.config(text=f"Processando documento {count}/{total}: {name}"))
+
+        batch_processor.add_listener(on_batch_event)
+        result = {'error_messages': [], 'arquivos_com_paginas_a_mais': [], 'arquivos_com_dados_incompletos': [], 'num_registros_extraidos': 0, 'fatal_error': None, 'critical_error': None, 'desempenho': []}
         try:
-            wb = None
-            ws = None
-            custas_seq_counter = 0 # NOVO: Contador sequencial para a coluna "Nome do Titulo"
-
-            if not os.path.exists(result_file_str):
-                wb = Workbook()
-                ws = wb.active
-                ws.title = "Boletos"
-                ws.append(['Obeservação', 'Fornecedor', 'Código de Barras', 'Valor', 'Nome do Titulo'])
-                ws.freeze_panes = 'A2' # Congela a primeira linha (cabeçalho)
-                self.log_message("Novo arquivo Excel criado para resultados.", "INFO")
-                # custas_seq_counter já é 0, será incrementado para 1 no primeiro dado
-            else:
-                try:
-                    wb = openpyxl.load_workbook(result_file_str)
-                    ws = wb.active
-                    ws.freeze_panes = 'A2' # Garante o congelamento da primeira linha ao abrir
-                    self.log_message(f"Arquivo Excel existente carregado: {result_file_str}", "INFO")
-                    # Se o arquivo existe, tentar encontrar o último número da sequência de "Custas"
-                    if ws.max_row > 1: # Se tiver mais que o cabeçalho
-                        max_existing_custas_num = 0
-                        for row_idx in range(2, ws.max_row + 1): # Começa da linha 2 (ignora o cabeçalho)
-                            cell_value = ws.cell(row=row_idx, column=5).value # Coluna 'Nome do Titulo'
-                            if isinstance(cell_value, str):
-                                match = re.search(r':(\d+)$', cell_value) # Procura o número após o ':' no final
-                                if match:
-                                    try:
-                                        num = int(match.group(1))
-                                        if num > max_existing_custas_num:
-                                            max_existing_custas_num = num
-                                    except ValueError:
-                                        pass # Ignorar valores não numéricos se o regex casar
-                        custas_seq_counter = max_existing_custas_num
-                        self.log_message(f"Contador de custas reiniciado de {custas_seq_counter} (baseado em arquivo existente).", "DEBUG")
-
-                except Exception as e:
-                    self.log_message(f"Erro ao abrir arquivo Excel existente: {result_file_str} - {e}", "ERROR")
-                    messagebox.showerror("Erro", f"Não foi possível abrir o arquivo Excel: {e}", icon="error")
-                    processing = False # Define a flag global para parar
-                    return # Sai da thread
-
-            self.processed_pages_count = 0 # Reinicia o contador para a nova execução
-
-            for pdf_path in input_files_list:
-                if not processing: # Checa a flag global de cancelamento para o PDF
-                    self.log_message("Processamento cancelado antes de concluir todos os PDFs.", "INFO")
-                    break
-
-                n_processo = os.path.basename(pdf_path)
-                base_name_for_excel = os.path.splitext(n_processo)[0]
-
-                if not n_processo.lower().endswith('.pdf'):
-                    self.log_message(f"Pulando arquivo não PDF: {n_processo}", "INFO")
-                    # Atualiza o progresso mesmo para arquivos pulados para não travar a barra
-                    self.processed_pages_count += 1
-                    self.root.after(0, lambda count=self.processed_pages_count, total=self.total_pages_to_process, name=n_processo: self.progress_bar.config(value=count))
-                    self.root.after(0, lambda count=self.processed_pages_count, total=self.total_pages_to_process, name=n_processo: self.status_label.config(text=f"Processando documento {count}/{total}: {name}"))
-                    self.root.update_idletasks()
-                    continue
-
-                self.log_message(f"Processando documento: {n_processo}", "INFO")
-                self.root.after(0, lambda p=n_processo: self.status_label.config(text=f"Processando: {p}"))
-                self.root.update_idletasks() # Força a atualização da GUI
-
-                # Altera a chamada para ocr_pdf para obter textos por página e o número de páginas
-                texts_per_page, num_pages_in_current_pdf = ocr_pdf(pdf_path, temp_dir)
-
-                if not processing: # Checa a flag global de cancelamento novamente após OCR
-                    self.log_message(f"Processamento de {n_processo} cancelado durante o OCR.", "INFO")
-                    break
-
-                # Caso o OCR falhe ou o PDF esteja vazio/inválido
-                if num_pages_in_current_pdf == 0 or not texts_per_page:
-                    error_messages.append(f"Arquivo {n_processo}: Falha no processamento do OCR ou PDF vazio.")
-                    arquivos_com_dados_incompletos.add(base_name_for_excel) # Adiciona à lista de incompletos
-                    
-                    custas_seq_counter += 1 # Incrementa o contador mesmo para linhas sem dados
-                    ws.append([base_name_for_excel, '', '', '', f"Custas{custas_str}:{custas_seq_counter:02}"]) # Adiciona linha para o PDF
-                    
-                    for cell in ws[ws.max_row]: # Pinta de amarelo
-                        cell.fill = PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid')
-                        cell.font = Font(color='000000')
-                    self.log_message(f"Arquivo {n_processo}: Falha no processamento do OCR ou PDF vazio.", "ERROR")
-                    # Atualiza progresso e continua para o próximo PDF
-                    self.processed_pages_count += 1
-                    self.root.after(0, lambda count=self.processed_pages_count, total=self.total_pages_to_process, name=n_processo: self.progress_bar.config(value=count))
-                    self.root.after(0, lambda count=self.processed_pages_count, total=self.total_pages_to_process, name=n_processo: self.status_label.config(text=f"Processando documento {count}/{total}: {name}"))
-                    self.root.update_idletasks()
-                    continue # Pula para o próximo PDF na lista
-
-                # Adiciona à lista de arquivos com mais de uma página se aplicável
-                if num_pages_in_current_pdf > 1:
-                    arquivos_com_paginas_a_mais.add(base_name_for_excel)
-                    self.log_message(f"Arquivo {n_processo}: Possui {num_pages_in_current_pdf} páginas.", "WARNING")
-
-                pdf_extracted_any_data = False # Flag para verificar se algum dado foi extraído deste PDF
-
-                # Itera sobre o texto de cada página
-                for page_idx, page_text in enumerate(texts_per_page):
-                    if not processing: # Checa cancelamento entre páginas
-                        self.log_message(f"Processamento de {n_processo} cancelado na página {page_idx+1}.", "INFO")
-                        break # Sai do loop de páginas
-
-                    info = extract_info(page_text)
-                    
-                    # Define o nome da observação na planilha, adicionando o número da página se for multi-página
-                    excel_obs_name = base_name_for_excel
-                    if num_pages_in_current_pdf > 1:
-                        excel_obs_name = f"{base_name_for_excel} - Página {page_idx + 1}"
-
-                    row_needs_yellow_due_to_data_issue = False # Flag para problemas de dados nesta linha/página
-
-                    if not any(info.values()) and info['cnpj'] == 'N/A' and not info['linhas_digitaveis']:
-                        row_needs_yellow_due_to_data_issue = True
-                        self.log_message(f"Arquivo {n_processo}, Página {page_idx+1}: Nenhuma informação encontrada.", "WARNING")
-                        custas_seq_counter += 1 # Incrementa o contador
-                        ws.append([excel_obs_name, '', '', '', f"Custas{custas_str}:{custas_seq_counter:02}"])
-                    elif info['tipo'] == 'guia_custas':
-                        custas_seq_counter += 1 # Incrementa o contador
-                        if info['cnpj'] != 'N/A' and info['numero_guia'] and info['valor']:
-                            ws.append([excel_obs_name, info['cnpj'], info['numero_guia'], info['valor'], f"Custas{custas_str}:{custas_seq_counter:02}"])
-                            self.log_message(f"Arquivo {n_processo}, Página {page_idx+1}: Guia de Custas processada com sucesso.", "INFO")
-                            pdf_extracted_any_data = True
-                        else:
-                            row_needs_yellow_due_to_data_issue = True
-                            ws.append([excel_obs_name, info['cnpj'] if info['cnpj'] else '', info['numero_guia'] if info['numero_guia'] else '', info['valor'] if info['valor'] else '', f"Custas{custas_str}:{custas_seq_counter:02}"])
-                            self.log_message(f"Arquivo {n_processo}, Página {page_idx+1}: Guia de Custas com dados incompletos.", "WARNING")
-                    else: # Tipo boleto
-                        num_linhas_digitaveis = len(info['linhas_digitaveis'])
-                        if num_linhas_digitaveis == 0:
-                            row_needs_yellow_due_to_data_issue = True
-                            custas_seq_counter += 1 # Incrementa o contador
-                            ws.append([excel_obs_name, info['cnpj'] if info['cnpj'] != 'N/A' else '', '', '', f"Custas{custas_str}:{custas_seq_counter:02}"])
-                            self.log_message(f"Arquivo {n_processo}, Página {page_idx+1}: Nenhuma linha digitável encontrada.", "WARNING")
-                        else:
-                            page_extracted_any_data = False # Flag para esta página
-                            for i in range(num_linhas_digitaveis):
-                                linha_digitavel = info['linhas_digitaveis'][i]
-                                valor_monetario = info['valores'][i]
-                                if linha_digitavel in linhas_digitaveis_processadas:
-                                    self.log_message(f"Linha digitável duplicada encontrada para {n_processo}, Página {page_idx+1}: {linha_digitavel}", "DEBUG")
-                                    continue
-                                linhas_digitaveis_processadas.add(linha_digitavel)
-                                try:
-                                    valor_float = float(valor_monetario.replace(',', '.'))
-                                    valor_formatado = "{:,.2f}".format(valor_float).replace(',', '*').replace('.', ',').replace('*', '.')
-                                except ValueError:
-                                    valor_formatado = valor_monetario
-                                    error_messages.append(f"Arquivo {n_processo}, Página {page_idx+1}: Valor monetário inválido '{valor_monetario}' na linha digitável '{linha_digitavel}'.")
-                                    self.log_message(f"Arquivo {n_processo}, Página {page_idx+1}: Valor monetário inválido '{valor_monetario}'.", "WARNING")
-                                    row_needs_yellow_due_to_data_issue = True
-
-                                # Adapta a observação para múltiplas linhas digitáveis na mesma página
-                                obs_for_row = excel_obs_name
-                                if num_linhas_digitaveis > 1:
-                                    obs_for_row = f"{excel_obs_name} (Linha {i + 1})"
-                                
-                                custas_seq_counter += 1 # Incrementa para cada linha digitável
-                                ws.append([obs_for_row, info['cnpj'] if info['cnpj'] != 'N/A' else '', linha_digitavel, valor_formatado, f"Custas{custas_str}:{custas_seq_counter:02}"])
-                                page_extracted_any_data = True
-                                pdf_extracted_any_data = True
-
-                            if not page_extracted_any_data: # Se não extraiu nenhuma linha válida/nova desta página
-                                row_needs_yellow_due_to_data_issue = True
-                                custas_seq_counter += 1 # Incrementa mesmo se não extraiu linha válida
-                                ws.append([excel_obs_name, info['cnpj'] if info['cnpj'] != 'N/A' else '', '', '', f"Custas{custas_str}:{custas_seq_counter:02}"])
-                                self.log_message(f"Arquivo {n_processo}, Página {page_idx+1}: Nenhuma linha digitável válida/nova encontrada.", "WARNING")
-
-                    if info['cnpj'] == 'N/A':
-                        arquivos_com_dados_incompletos.add(base_name_for_excel)
-                        row_needs_yellow_due_to_data_issue = True
-                        error_messages.append(f"Arquivo {n_processo}, Página {page_idx+1}: CNPJ não encontrado ou ignorado.")
-                        self.log_message(f"Arquivo {n_processo}, Página {page_idx+1}: CNPJ não encontrado ou ignorado.", "WARNING")
-
-                    # Aplica a cor amarela às linhas recém-adicionadas desta página
-                    # Se houver problema de dados OU se o PDF tiver múltiplas páginas
-                    if row_needs_yellow_due_to_data_issue or num_pages_in_current_pdf > 1:
-                        # Itera sobre as linhas adicionadas para esta página
-                        # A partir da linha que acabou de ser adicionada (ws.max_row) até a linha anterior,
-                        # dependendo de quantas linhas foram adicionadas para esta página.
-                        # Para simplificar, aplicaremos à última linha adicionada por esta iteração de página.
-                        # NOTA: Se uma página gerar múltiplas linhas (ex: 2 linhas digitáveis),
-                        # a última linha adicionada é ws.max_row. Para colorir todas as linhas
-                        # geradas por uma única página, precisaríamos saber o ws.max_row ANTES e DEPOIS.
-                        # O comportamento atual é colorir a(s) última(s) linha(s) adicionada(s) por essa "ação".
-                        for cell in ws[ws.max_row]: 
-                            cell.fill = PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid')
-                            cell.font = Font(color='000000')
-
-                # Após processar todas as páginas do PDF atual, verifica se algum dado foi extraído.
-                if not pdf_extracted_any_data:
-                    arquivos_com_dados_incompletos.add(base_name_for_excel)
-
-                # Atualiza a barra de progresso e o status label por PDF processado
-                self.processed_pages_count += 1
-                self.root.after(0, lambda count=self.processed_pages_count, total=self.total_pages_to_process, name=n_processo: self.progress_bar.config(value=count))
-                self.root.after(0, lambda count=self.processed_pages_count, total=self.total_pages_to_process, name=n_processo: self.status_label.config(text=f"Processando documento {count}/{total}: {name}"))
-                self.root.update_idletasks()
-
-            # --- Formatação e Verificações Finais na Planilha ---
-            # Ajusta a largura das colunas
-            for col in range(1, ws.max_column + 1):
-                column_letter = openpyxl.utils.get_column_letter(col)
-                # Calcula a largura máxima baseada no conteúdo, com um mínimo de 10
-                column_width = max(len(str(cell.value)) if cell.value else 0 for cell in ws[column_letter]) + 2
-                ws.column_dimensions[column_letter].width = max(column_width, 10)
-
-            # Formata a coluna "Valor" como moeda e alinha à direita
-            for cell in ws['D']:
-                cell.number_format = 'R$ #,##0.00'
-                cell.alignment = Alignment(horizontal='right')
-            ws['D1'].alignment = Alignment(horizontal='left') # Garante que o cabeçalho não alinhe à direita
-
-            # Verifica valores de boleto acima de R$ 2000
-            for row_idx in range(2, ws.max_row + 1): # Começa da linha 2 (após o cabeçalho)
-                valor_boleto_cell = ws.cell(row_idx, 4)
-                valor_boleto = valor_boleto_cell.value
-                if valor_boleto and isinstance(valor_boleto, str):
-                    try:
-                        # Remove pontos e substitui vírgula por ponto para conversão para float
-                        valor_boleto_float = float(valor_boleto.replace('.', '').replace(',', '.'))
-                        if valor_boleto_float > 2000:
-                            # Adiciona mensagem de erro e pinta a linha de amarelo
-                            error_messages.append(f"Arquivo {ws.cell(row_idx, 1).value}: Valor do boleto (R$ {valor_boleto}) acima de R$ 2000. Verificar manual.")
-                            self.log_message(f"Arquivo {ws.cell(row_idx, 1).value}: Valor do boleto (R$ {valor_boleto}) acima de R$ 2000. Verificar manual.", "WARNING")
-                            for cell in ws[row_idx]:
-                                cell.fill = PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid')
-                                cell.font = Font(color='000000')
-                    except ValueError:
-                        pass # Erros de valor inválido já são tratados no loop de extração
-
-            # Salva o arquivo final
-            wb.save(result_file_str)
-            self.log_message(f"Arquivo Excel salvo em: {result_file_str}", "INFO")
-
-            num_erros_reportados = len(error_messages) + len(arquivos_com_paginas_a_mais) + len(arquivos_com_dados_incompletos)
-            num_registros_extraidos = ws.max_row - 1
-
-            if save_csv_bool and num_erros_reportados == 0 and num_registros_extraidos > 0:
-                self.save_to_csv_method(result_file_str, ws) # Chama o método da classe
-                self.log_message(f"Arquivo CSV salvo em: {os.path.splitext(result_file_str)[0] + '.csv'}", "INFO")
-            elif save_csv_bool:
-                self.log_message("CSV automático não criado devido a divergências ou falta de dados.", "WARNING")
-
+            result = batch_processor.run()
+            if result['fatal_error']:
+                self.processing = False # A planilha não pôde ser aberta: finaliza como cancelado
+                self.root.after(0, lambda: messagebox.showerror("Erro", result['fatal_error'], icon="error"))
         except Exception as e:
             logger.exception("Erro crítico durante o processamento dos PDFs na thread")
             self.log_message(f"Erro crítico durante o processamento: {e}", "CRITICAL_ERROR")
-            error_messages.append(f"Erro crítico: {e}")
+            result['error_messages'].append(f"Erro crítico: {e}")
         finally:
-            temp_dir_obj.cleanup()
-            self.log_message("Pasta temporária de OCR removida.", "DEBUG")
-
             # Garante que a barra chegue a 100% mesmo se a contagem inicial for imprecisa
             # Se o processamento não foi cancelado, ela deve atingir o valor máximo do documento.
-            if processing: # Se a flag global ainda é True, significa que terminou com sucesso (não foi cancelado)
+            if self.processing: # Se a flag ainda é True, significa que terminou com sucesso (não foi cancelado)
                 self.root.after(0, lambda: self.progress_bar.config(value=self.total_pages_to_process, maximum=self.total_pages_to_process))
                 self.root.after(100, lambda: self.status_label.config(text=f"Processamento concluído! Gerando relatório..."))
 
             # Chama a função de finalização na thread principal
             self.root.after(150, lambda: self._processing_complete(
-                error_messages, list(arquivos_com_paginas_a_mais), list(arquivos_com_dados_incompletos)
+                result['error_messages'], result['arquivos_com_paginas_a_mais'], result['arquivos_com_dados_incompletos'],
+                result['num_registros_extraidos'], result.get('desempenho', [])
             ))
 
 
-    def _processing_complete(self, error_messages, arquivos_com_paginas_a_mais_list, arquivos_com_dados_incompletos_list):
+    def _processing_complete(self, error_messages, arquivos_com_paginas_a_mais_list, arquivos_com_dados_incompletos_list, num_registros_extraidos, desempenho=None):
         """Finaliza o processamento, atualiza a GUI e mostra popups."""
-        global processing # Acessa a flag global
-
-        # Se o processamento foi cancelado explicitamente (flag global `processing` é False NO INÍCIO DESTA FUNÇÃO)
-        # O `processing` é definido como False em `cancel_processing_gui` ou em `_actual_processing_task` em caso de erro crítico.
-        if not processing: # Esta condição deve ser a primeira para tratar o cancelamento.
+        # Se o processamento foi cancelado explicitamente (flag `self.processing` é False NO INÍCIO DESTA FUNÇÃO)
+        # O `self.processing` é definido como False em `cancel_processing_gui` ou em `_actual_processing_task` se a planilha não abrir.
+        if not self.processing: # Esta condição deve ser a primeira para tratar o cancelamento.
             self.log_message("Processamento cancelado pelo usuário ou finalizado por erro.", "INFO")
             self.show_cancelled_popup_gui()
             self.status_label.config(text="Processamento cancelado.")
@@ -689,30 +304,21 @@ class PDF2EXCEL:
         # Se não foi cancelado, verifica o resultado
         num_erros_reportados = len(error_messages) + len(arquivos_com_paginas_a_mais_list) + len(arquivos_com_dados_incompletos_list)
 
-        num_registros_extraidos = 0
-        if os.path.exists(self.result_file): # Usa self.result_file
-            try:
-                wb_final = openpyxl.load_workbook(self.result_file)
-                ws_final = wb_final.active
-                num_registros_extraidos = ws_final.max_row - 1
-            except Exception as e:
-                self.log_message(f"Erro ao contar registros no arquivo final: {e}", "WARNING")
-
         if num_erros_reportados == 0 and num_registros_extraidos > 0:
             self.set_progress_bar_style("Success.Horizontal.TProgressbar")
             self.status_label.config(text="Concluído com sucesso!")
             self.log_message("Processamento concluído com sucesso!", "SUCCESS")
-            self.show_success_popup_gui(self.result_file, self.save_csv_var.get())
+            self.show_success_popup_gui(self.result_file, self.save_csv_var.get(), desempenho)
         elif num_registros_extraidos == 0 and num_erros_reportados == 0:
             self.set_progress_bar_style("Error.Horizontal.TProgressbar")
             self.status_label.config(text="Concluído (Sem dados extraídos).")
             self.log_message("Processamento concluído, mas nenhum dado foi extraído.", "WARNING")
-            self.show_divergencia_popup_gui(error_messages, self.result_file, arquivos_com_paginas_a_mais_list, arquivos_com_dados_incompletos_list, self.save_csv_var.get(), no_data=True)
+            self.show_divergencia_popup_gui(error_messages, self.result_file, arquivos_com_paginas_a_mais_list, arquivos_com_dados_incompletos_list, self.save_csv_var.get(), no_data=True, desempenho=desempenho)
         elif num_erros_reportados > 0:
             self.set_progress_bar_style("Error.Horizontal.TProgressbar")
             self.status_label.config(text="Concluído com ERROS/DIVERGÊNCIAS.")
             self.log_message(f"Processamento concluído com {num_erros_reportados} problemas/erros.", "WARNING")
-            self.show_divergencia_popup_gui(error_messages, self.result_file, arquivos_com_paginas_a_mais_list, arquivos_com_dados_incompletos_list, self.save_csv_var.get(), no_data=False)
+            self.show_divergencia_popup_gui(error_messages, self.result_file, arquivos_com_paginas_a_mais_list, arquivos_com_dados_incompletos_list, self.save_csv_var.get(), no_data=False, desempenho=desempenho)
         else:
             self.set_progress_bar_style("Default.Horizontal.TProgressbar")
             self.status_label.config(text="Processamento finalizado.")
@@ -784,6 +390,15 @@ class PDF2EXCEL:
                 messagebox.showerror("Erro", "Digite um valor válido para as custas (apenas números, '.', ':', '/', '\\') com até 5 caracteres.", icon="error")
                 return
 
+            try:
+                ocr_workers = int(self.ocr_workers_var.get())
+                if ocr_workers < 1:
+                    raise ValueError
+            except ValueError:
+                self.log_message(f"Quantidade de PDFs em paralelo inválida: {self.ocr_workers_var.get()}", "WARNING")
+                messagebox.showerror("Erro", "Digite uma quantidade válida de PDFs em paralelo (número inteiro maior que zero).", icon="error")
+                return
+
             # Atualiza o estado do botão para "Cancelar" e habilita
             self._update_main_button_state('processing_start')
             self.log_message("Configurações validadas. Preparando para processar.", "INFO")
@@ -791,7 +406,10 @@ class PDF2EXCEL:
             output_dir = self.input_dir if self.input_dir else os.getcwd()
             self.log_message(f"Pasta de saída para arquivos temporários: {output_dir}", "DEBUG")
 
-            thread = Thread(target=self._actual_processing_task, args=(self.input_files, output_dir, self.result_file, custas, self.save_csv_var.get()))
+            # Cada lote tem a sua configuração; o filtro de CNPJs é copiado no momento do início
+            config = BatchConfig(custas=custas, save_csv=self.save_csv_var.get(), ocr_workers=ocr_workers)
+            self.batch_processor = BatchProcessor(self.input_files, self.result_file, config)
+            thread = Thread(target=self._actual_processing_task, args=(self.batch_processor,))
             thread.start()
 
         except Exception as e:
@@ -801,12 +419,12 @@ class PDF2EXCEL:
 
     def cancel_processing_gui(self):
         """Função para cancelar o processamento, chamada pelo botão principal quando está em modo 'cancelar'."""
-        global processing # Acessa a variável global de controle de processamento
-        if processing: # Só envia o sinal se o processamento estiver ativo
-            processing = False # Define a flag global para parar a thread
+        if self.processing: # Só envia o sinal se o processamento estiver ativo
+            if self.batch_processor:
+                self.batch_processor.cancel() # Sinaliza o cancelamento ao lote (threads de OCR inclusive)
             self._update_main_button_state('cancelling_pending') # Atualiza o botão para "Cancelando..." e o desabilita
 
-    def show_divergencia_popup_gui(self, error_messages, result_file, arquivos_com_paginas_a_mais, arquivos_com_dados_incompletos, save_csv, no_data=False):
+    def show_divergencia_popup_gui(self, error_messages, result_file, arquivos_com_paginas_a_mais, arquivos_com_dados_incompletos, save_csv, no_data=False, desempenho=None):
         popup_div = Toplevel(self.root)
         popup_div.title("Processamento Concluído com Divergências")
         popup_div.transient(self.root)
@@ -868,23 +486,31 @@ class PDF2EXCEL:
             label_csv_nao_criado = Label(popup_div, text="(CSV automático não criado, por falta de confiabilidade)", font=("Segoe UI Bold", 10), fg="#FF0000")
             label_csv_nao_criado.pack(pady=5)
 
+        self.show_desempenho_label(popup_div, desempenho)
+
         button_frame = Frame(popup_div)
         button_frame.pack(pady=10)
 
-        ok_button = self.create_button(button_frame, "OK", lambda: [popup_div.destroy(), webbrowser.open_new_tab(f"file://{result_file}")], is_default=True, fg_color="#000000")
+        ok_button = self.create_button(button_frame, "OK", lambda: [popup_div.destroy(), open_in_browser(result_file)], is_default=True, fg_color="#000000")
         ok_button.pack(side=LEFT, padx=10)
 
         todos_arquivos_para_conferir = list(set(arquivos_com_paginas_a_mais + arquivos_com_dados_incompletos))
 
         if todos_arquivos_para_conferir:
             conferir_pdfs_button = self.create_button(button_frame, "Conferir PDFs",
-                                    command=lambda: [popup_div.destroy(), self.abrir_arquivos_pdf(todos_arquivos_para_conferir), webbrowser.open_new_tab(f"file://{result_file}")],
+                                    command=lambda: [popup_div.destroy(), self.abrir_arquivos_pdf(todos_arquivos_para_conferir), open_in_browser(result_file)],
                                     fg_color="#0000FF")
             conferir_pdfs_button.pack(side=LEFT, padx=10)
 
         center_window(popup_div)
 
-    def show_success_popup_gui(self, result_file, save_csv):
+    def show_desempenho_label(self, popup, desempenho):
+        """Resumo do relatório de desempenho (tempo total, etapas e PDFs mais lentos) no rodapé do popup."""
+        if desempenho:
+            label_desempenho = Label(popup, text="\n".join(desempenho), font=("Segoe UI", 8), fg="#555555", justify=LEFT, wraplength=420)
+            label_desempenho.pack(pady=5, padx=10)
+
+    def show_success_popup_gui(self, result_file, save_csv, desempenho=None):
         popup_success = Toplevel(self.root)
         popup_success.title("Processamento Concluído com Sucesso")
         popup_success.transient(self.root)
@@ -901,10 +527,12 @@ class PDF2EXCEL:
             label_csv_criado = Label(popup_success, text="(CSV automático também foi criado)", font=("Segoe UI Bold", 10), fg="green")
             label_csv_criado.pack(pady=5)
 
+        self.show_desempenho_label(popup_success, desempenho)
+
         button_frame = Frame(popup_success)
         button_frame.pack(pady=10)
 
-        ok_button = self.create_button(button_frame, "OK", lambda: [popup_success.destroy(), webbrowser.open_new_tab(f"file://{result_file}")], is_default=True, fg_color="#000000")
+        ok_button = self.create_button(button_frame, "OK", lambda: [popup_success.destroy(), open_in_browser(result_file)], is_default=True, fg_color="#000000")
         ok_button.pack(side=LEFT, padx=10)
 
         center_window(popup_success)
@@ -962,6 +590,14 @@ class PDF2EXCEL:
         c_debug_button = Button(button_frame, text="🗑️Excluir Debug", command=self.delete_log_file, font=("Segoe UI Bold", 10), bg="#F32121", fg="white", relief=FLAT, padx=10, pady=5)
         c_debug_button.pack(side=LEFT, padx=5)
 
+        # Botão Limpar Cache do OCR (laranja)
+        cache_button = Button(button_frame, text="🧹 Limpar Cache", command=self.clear_ocr_cache, font=("Segoe UI Bold", 10), bg="#FF9800", fg="white", relief=FLAT, padx=10, pady=5)
+        cache_button.pack(side=LEFT, padx=5)
+
+        # Botão Limpar Índice de Duplicatas (marrom)
+        duplicates_button = Button(button_frame, text="🧾 Limpar Duplicatas", command=self.clear_duplicate_index, font=("Segoe UI Bold", 10), bg="#795548", fg="white", relief=FLAT, padx=10, pady=5)
+        duplicates_button.pack(side=LEFT, padx=5)
+
         # Botão Filtro CNPJ (cinza azulado)
         config_button = Button(button_frame, text="🛠️ Filtro", command=lambda: self.show_filtro_cnpj_config_popup(info_popup), font=("Segoe UI Bold", 10), bg="#607D8B", fg="white", relief=FLAT, padx=10, pady=5)
         config_button.pack(side=LEFT, padx=5)
@@ -987,7 +623,7 @@ class PDF2EXCEL:
             caminho_completo = next((f for f in self.input_files if os.path.splitext(os.path.basename(f))[0] == original_base_name), None)
             if caminho_completo:
                 try:
-                    webbrowser.open_new_tab(f"file://{caminho_completo}")
+                    open_in_browser(caminho_completo)
                     arquivos_abertos +=1
                 except Exception as e:
                     self.log_message(f"Erro ao tentar abrir PDF {caminho_completo}: {e}", "ERROR")
@@ -1016,7 +652,7 @@ class PDF2EXCEL:
 
     def open_log_file(self):
         try:
-            webbrowser.open_new_tab(f"file://{log_file_path}")
+            open_in_browser(log_file_path)
             self.log_message("Arquivo de log aberto.", "INFO")
         except Exception as e:
             messagebox.showerror("Erro", f"Não foi possível abrir o arquivo de log: {e}", icon="error")
@@ -1024,16 +660,14 @@ class PDF2EXCEL:
 
     def delete_log_file(self):
         try:
-            # Primeiro, remova o handler de arquivo existente
-            for handler in logger.handlers[:]:
-                if isinstance(handler, logging.FileHandler):
-                    logger.removeHandler(handler)
-                    handler.close()
-
-            logging.shutdown()
+            # Primeiro, grava o que estiver na fila e fecha os arquivos de log
+            core.stop_logging()
 
             if os.path.exists(log_file_path):
                 os.remove(log_file_path)
+                for backup_index in range(1, core.LOG_BACKUP_COUNT + 1): # Arquivos antigos da rotação
+                    if os.path.exists(f"{log_file_path}.{backup_index}"):
+                        os.remove(f"{log_file_path}.{backup_index}")
                 self.log_message("Arquivo de log deletado pelo usuário.", "INFO")
                 messagebox.showinfo("Sucesso", "Arquivo de log deletado com sucesso.", icon="info")
                 self.log_text.config(state=tk.NORMAL)
@@ -1043,11 +677,6 @@ class PDF2EXCEL:
                 messagebox.showerror("Erro", "Arquivo de log não encontrado para deletar.", icon="error")
                 self.log_message("Arquivo de log não encontrado para deletar (após tentativa de remoção).", "ERROR")
 
-            # Recria o handler de arquivo APÓS deletar e confirmar
-            file_handler = logging.FileHandler(log_file_path, mode='w', encoding='utf-8')
-            file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-            logger.addHandler(file_handler)
-
         except FileNotFoundError:
             messagebox.showerror("Erro", "Arquivo de log não encontrado para deletar.", icon="error")
             self.log_message("Arquivo de log não encontrado para deletar (após tentativa de remoção).", "ERROR")
@@ -1057,10 +686,47 @@ class PDF2EXCEL:
         except Exception as e:
             messagebox.showerror("Erro", f"Erro ao deletar o arquivo de log: {e}", icon="error")
             self.log_message(f"Erro inesperado ao deletar arquivo de log: {e}", "ERROR")
+        finally:
+            # Recria o log em arquivo APÓS deletar e confirmar (ou após a falha, para não perder os próximos registros)
+            core.setup_logging(json_lines=not core.perf_logger.disabled)
 
-    def show_filtro_cnpj_config_popup(self, parent_window):
-        global ignored_cnpjs_list
+    def clear_ocr_cache(self):
+        if self.processing:
+            messagebox.showwarning("Aviso", "Aguarde o fim do processamento para limpar o cache de OCR.", icon="warning")
+            return
+        ocr_cache = core.get_ocr_cache()
+        if not ocr_cache:
+            messagebox.showerror("Erro", "O cache de OCR está desativado (veja o arquivo de log).", icon="error")
+            return
+        if not messagebox.askyesno("Limpar Cache", "Deseja apagar o cache de OCR? Os próximos processamentos refarão o OCR de todas as páginas.", icon="warning"):
+            return
+        try:
+            ocr_cache.clear()
+            self.log_message("Cache de OCR limpo pelo usuário.", "INFO")
+            messagebox.showinfo("Sucesso", "Cache de OCR limpo com sucesso.", icon="info")
+        except Exception as e:
+            messagebox.showerror("Erro", f"Erro ao limpar o cache de OCR: {e}", icon="error")
+            self.log_message(f"Erro ao limpar o cache de OCR: {e}", "ERROR")
 
+    def clear_duplicate_index(self):
+        if self.processing:
+            messagebox.showwarning("Aviso", "Aguarde o fim do processamento para limpar o índice de duplicatas.", icon="warning")
+            return
+        duplicate_index = core.get_duplicate_index()
+        if not duplicate_index:
+            messagebox.showerror("Erro", "A verificação de duplicatas está desativada (veja o arquivo de log).", icon="error")
+            return
+        if not messagebox.askyesno("Limpar Duplicatas", "Deseja apagar o histórico de linhas digitáveis e guias já exportadas? Boletos já pagos deixarão de ser sinalizados como duplicados.", icon="warning"):
+            return
+        try:
+            duplicate_index.clear()
+            self.log_message("Índice de duplicatas limpo pelo usuário.", "INFO")
+            messagebox.showinfo("Sucesso", "Índice de duplicatas limpo com sucesso.", icon="info")
+        except Exception as e:
+            messagebox.showerror("Erro", f"Erro ao limpar o índice de duplicatas: {e}", icon="error")
+            self.log_message(f"Erro ao limpar o índice de duplicatas: {e}", "ERROR")
+
+    def show_filtro_cnpj_config_popup(self, parent_window):
         config_popup = Toplevel(parent_window)
         config_popup.title("Configurar Filtro de CNPJ")
         config_popup.transient(parent_window)
@@ -1077,7 +743,7 @@ class PDF2EXCEL:
         Label(main_frame, text="CNPJs a serem ignorados (separados por vírgula):", font=("Segoe UI", 10), bg=main_frame.cget("bg")).pack(pady=(0,5), anchor="w")
 
         cnpj_entry_var = StringVar()
-        cnpj_entry_var.set(",".join(ignored_cnpjs_list))
+        cnpj_entry_var.set(",".join(core.get_ignored_cnpjs()))
 
         cnpj_entry = Entry(main_frame, textvariable=cnpj_entry_var, width=60, font=("Segoe UI", 10))
         cnpj_entry.pack(pady=5, fill=X)
@@ -1106,6 +772,8 @@ class PDF2EXCEL:
                 messagebox.showinfo("Sucesso", "Filtro de CNPJs salvo com sucesso!", parent=config_popup)
                 self.log_message("Filtro de CNPJs salvo via GUI.", "INFO")
                 config_popup.destroy()
+            else:
+                messagebox.showerror("Erro", "Não foi possível salvar o arquivo de configuração de CNPJs (veja o arquivo de log).", icon="error", parent=config_popup)
 
         def on_open_config_file():
             try:
@@ -1142,42 +810,89 @@ class PDF2EXCEL:
         self.save_csv_var.set(not self.save_csv_var.get())
         self.log_message(f"Opção 'CSV ponto e vírgula' {'ativada' if self.save_csv_var.get() else 'desativada'}.", "INFO")
 
-    def save_to_csv_method(self, result_file, ws):
-        csv_file = os.path.splitext(result_file)[0] + ".csv"
-        with open(csv_file, 'w', newline='', encoding='utf-8-sig') as file:
-            writer = csv.writer(file, delimiter=';')
-            for row in ws.iter_rows(values_only=True):
-                writer.writerow(row)
+
+# Log da janela: as threads de trabalho só enfileiram as mensagens; a cada LOG_FLUSH_INTERVAL_MS a
+# thread da interface insere todas as pendentes no widget de uma vez.
+LOG_FLUSH_INTERVAL_MS = 100
+LOG_MAX_LINES = 2000 # Linhas mantidas na janela; as mais antigas são descartadas (o arquivo de log tem tudo)
+LOG_REPEAT_SECONDS = 5.0 # Mensagens idênticas dentro deste intervalo aparecem uma vez, com a contagem no fim
 
 class TextLogHandler(logging.Handler):
     def __init__(self, text_widget):
         super().__init__()
         self.text_widget = text_widget
-        self.queue = []
-        self.text_widget.after(100, self.periodic_check)
+        # Fila circular: num pico de mensagens só as LOG_MAX_LINES mais recentes chegam à janela
+        self.queue = deque(maxlen=LOG_MAX_LINES)
+        self.dropped = 0
+        self.repeats = {} # (mensagem, nível) -> [instante da primeira exibição, repetições suprimidas]
+        self.text_widget.after(LOG_FLUSH_INTERVAL_MS, self.periodic_check)
 
     def emit(self, record):
+        # Chamado com o lock do handler (logging.Handler.handle), inclusive pelas threads de OCR
         msg = self.format(record)
         level_name = record.levelname.upper()
-        self.queue.append((msg, level_name))
+        now = time.monotonic()
+        repeat = self.repeats.get((msg, level_name))
+        if repeat and now - repeat[0] < LOG_REPEAT_SECONDS:
+            repeat[1] += 1
+            return
+        if repeat and repeat[1]:
+            self._enqueue(self._repeat_summary(msg, level_name, repeat[1]))
+        self.repeats[(msg, level_name)] = [now, 0]
+        self._enqueue((msg, level_name))
+
+    def _enqueue(self, item):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(item)
+
+    @staticmethod
+    def _repeat_summary(msg, level_name, count):
+        return (f"(repetida {count} {'vez' if count == 1 else 'vezes'} nos últimos {LOG_REPEAT_SECONDS:g}s) {msg}", level_name)
+
+    def _take_pending(self):
+        """Retira as mensagens pendentes, incluindo o resumo das repetições cujo intervalo terminou."""
+        self.acquire()
+        try:
+            now = time.monotonic()
+            for key, (first_shown, count) in list(self.repeats.items()):
+                if now - first_shown >= LOG_REPEAT_SECONDS:
+                    del self.repeats[key]
+                    if count:
+                        self._enqueue(self._repeat_summary(*key, count))
+            pending = list(self.queue)
+            self.queue.clear()
+            dropped, self.dropped = self.dropped, 0
+        finally:
+            self.release()
+        return pending, dropped
 
     def periodic_check(self):
-        while self.queue:
-            msg, level_name = self.queue.pop(0)
+        pending, dropped = self._take_pending()
+        if pending:
+            # Uma única chamada ao Tk: insert aceita vários pares (texto, tag); mensagens seguidas do
+            # mesmo nível vão juntas no mesmo trecho
+            chunks = []
+            for level_name, group in groupby(pending, key=lambda item: item[1]):
+                chunks += [''.join(f"{msg}\n" for msg, _ in group), level_name]
             self.text_widget.config(state=tk.NORMAL)
-            self.text_widget.insert(tk.END, f"{msg}\n", level_name)
+            self.text_widget.mark_set('inicio_lote', 'end-1c')
+            self.text_widget.mark_gravity('inicio_lote', tk.LEFT) # Fica antes do texto inserido agora
+            self.text_widget.insert(tk.END, *chunks)
+            num_lines = int(self.text_widget.index('end-1c').split('.')[0]) - 1
+            if num_lines > LOG_MAX_LINES:
+                self.text_widget.delete('1.0', f'{num_lines - LOG_MAX_LINES + 1}.0')
+            if dropped: # Aviso antes das mensagens que sobraram do pico
+                self.text_widget.insert('inicio_lote', f"... {dropped} mensagens não exibidas aqui (veja o arquivo de log)\n", "WARNING")
             self.text_widget.config(state=tk.DISABLED)
             self.text_widget.see(tk.END)
-        self.text_widget.after(100, self.periodic_check)
+        self.text_widget.after(LOG_FLUSH_INTERVAL_MS, self.periodic_check)
 
 if __name__ == "__main__":
+    core.setup_logging()
     root = tk.Tk()
     app = PDF2EXCEL(root) # Cria a instância da aplicação
 
-    # Variável global `processing` para ser usada por funções que não são métodos da classe
-    # como `ocr_pdf` para permitir o cancelamento.
-    processing = False # Inicializado aqui e controlado por `_update_main_button_state`
-
     # Garante que o botão principal esteja no estado "Iniciar" ao iniciar a aplicação
     app._update_main_button_state('initial')
 
@@ -1185,4 +900,6 @@ if __name__ == "__main__":
         startupinfo = subprocess.STARTUPINFO()
         startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
 
+    # pdf2image/openpyxl/configurações carregados em segundo plano depois que a janela já apareceu
+    root.after(500, core.warm_up)
     root.mainloop()
\ No newline at end of file
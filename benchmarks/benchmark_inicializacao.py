@@ -0,0 +1,125 @@
+"""
+Benchmark da inicialização: quanto custa importar os módulos do programa (como `python -X importtime`).
+
+    python benchmarks/benchmark_inicializacao.py
+    python benchmarks/benchmark_inicializacao.py -o inicializacao.json
+    python benchmarks/benchmark_inicializacao.py --comparar inicializacao.json --limite-ms 150
+
+Cada importação roda num processo novo (com um APPDATA temporário), várias vezes; vale a mediana.
+Mostra o tempo de importação de cada módulo, o tempo total do processo e os módulos que mais pesam.
+Termina com código 1 se algum módulo pesado (openpyxl, pdf2image, pytesseract, numpy...) for carregado
+na importação, se a importação criar arquivos no APPDATA (log, configurações, cache de OCR, índice de
+duplicatas) ou se o tempo passar de --limite-ms, para a regressão aparecer antes de chegar ao executável.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULOS = ['pdf2excel_core', 'pdf2excel_cli', 'PDF2EXCEL']
+# Devem ser importados só no primeiro uso ou pelo warm_up, nunca na importação dos módulos do programa
+MODULOS_PESADOS = ['openpyxl', 'pdf2image', 'pytesseract', 'tesserocr', 'numpy', 'PIL']
+
+def importar(modulo, appdata):
+    """
+    Importa o módulo num processo novo com -X importtime; retorna (segundos do processo,
+    [(módulo, self_us, acumulado_us, nível)], arquivos criados no APPDATA).
+    """
+    inicio = time.perf_counter()
+    processo = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {modulo}'], cwd=RAIZ,
+                              env=dict(os.environ, APPDATA=appdata), capture_output=True, text=True)
+    segundos = time.perf_counter() - inicio
+    if processo.returncode != 0:
+        erro = processo.stderr.strip().splitlines()
+        raise RuntimeError(erro[-1] if erro else f"código de saída {processo.returncode}")
+    importacoes = []
+    for linha in processo.stderr.splitlines():
+        if not linha.startswith('import time:') or 'imported package' in linha:
+            continue
+        self_us, acumulado_us, nome = linha[len('import time:'):].split('|', 2)
+        nivel = (len(nome) - len(nome.lstrip()) - 1) // 2 # 0 = importado pelo -c; o -X importtime indenta os demais
+        importacoes.append((nome.strip(), int(self_us), int(acumulado_us), nivel))
+    criados = [os.path.relpath(os.path.join(pasta, nome), appdata) # Pastas e arquivos; a importação não deve criar nenhum
+               for pasta, subpastas, arquivos in os.walk(appdata) for nome in subpastas + arquivos]
+    return segundos, importacoes, criados
+
+def medir_modulo(modulo, repeticoes):
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as appdata:
+        rodadas = [importar(modulo, appdata) for _ in range(repeticoes)]
+    tempos_importacao = [next(acumulado for nome, _, acumulado, _ in importacoes if nome == modulo) / 1000
+                         for _, importacoes, _ in rodadas]
+    # O -X importtime lista os módulos importados por um módulo logo antes dele, com um nível a mais
+    importacoes = rodadas[-1][1]
+    fim = next(idx for idx, (nome, *_) in enumerate(importacoes) if nome == modulo)
+    inicio = fim
+    while inicio > 0 and importacoes[inicio - 1][3] > 0:
+        inicio -= 1
+    arvore = importacoes[inicio:fim]
+    carregados = {nome for nome, *_ in arvore}
+    mais_pesados = sorted((item for item in arvore if item[3] == 1), key=lambda item: item[2], reverse=True)
+    return {
+        'importacao_ms': round(statistics.median(tempos_importacao), 1),
+        'processo_ms': round(statistics.median(segundos for segundos, _, _ in rodadas) * 1000, 1),
+        'modulos_carregados': len(carregados),
+        'pesados': [nome for nome in MODULOS_PESADOS if nome in carregados],
+        'arquivos_criados': sorted({nome for _, _, criados in rodadas for nome in criados}),
+        'mais_pesados': [[nome, round(acumulado / 1000, 1)] for nome, _, acumulado, _ in mais_pesados[:8]],
+    }
+
+def imprimir(resultados, anteriores=None):
+    for modulo, resultado in resultados.items():
+        if 'erro' in resultado:
+            print(f"{modulo}: não foi possível importar ({resultado['erro']})")
+            continue
+        variacao = ''
+        if anteriores and 'importacao_ms' in anteriores.get(modulo, {}):
+            variacao = f" ({resultado['importacao_ms'] - anteriores[modulo]['importacao_ms']:+.1f} ms)"
+        print(f"{modulo}: importação {resultado['importacao_ms']:.1f} ms{variacao}, processo {resultado['processo_ms']:.1f} ms, "
+              f"{resultado['modulos_carregados']} módulos")
+        for nome, ms in resultado['mais_pesados']:
+            print(f"    {nome:<30}{ms:>8.1f} ms")
+        if resultado['pesados']:
+            print(f"    ATENÇÃO: módulos pesados carregados na importação: {', '.join(resultado['pesados'])}")
+        if resultado['arquivos_criados']:
+            print(f"    ATENÇÃO: arquivos criados no APPDATA na importação: {', '.join(resultado['arquivos_criados'])}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tempo de importação dos módulos do PDF2EXCEL (inicialização a frio).")
+    parser.add_argument('-m', '--modulos', nargs='+', choices=MODULOS, default=MODULOS)
+    parser.add_argument('--repeticoes', type=int, default=7, help="Processos por módulo; vale a mediana (padrão: 7).")
+    parser.add_argument('--limite-ms', type=float, help="Falha se a importação de algum módulo passar deste tempo.")
+    parser.add_argument('-o', '--saida', help="Grava os resultados em JSON (para comparar depois).")
+    parser.add_argument('--comparar', help="JSON de uma medição anterior para mostrar a variação.")
+    args = parser.parse_args(argv)
+
+    resultados = {}
+    for modulo in args.modulos:
+        try:
+            resultados[modulo] = medir_modulo(modulo, max(1, args.repeticoes))
+        except RuntimeError as e: # Ex.: PDF2EXCEL sem tkinter disponível
+            resultados[modulo] = {'erro': str(e)}
+    anteriores = None
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            anteriores = json.load(f)['resultados']
+    imprimir(resultados, anteriores)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump({'python': sys.version.split()[0], 'gerado_em': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'resultados': resultados}, f, ensure_ascii=False, indent=1)
+
+    medidos = [resultado for resultado in resultados.values() if 'erro' not in resultado]
+    if any(resultado['pesados'] or resultado['arquivos_criados'] for resultado in medidos):
+        return 1
+    if args.limite_ms is not None and any(resultado['importacao_ms'] > args.limite_ms for resultado in medidos):
+        print(f"Importação acima do limite de {args.limite_ms:g} ms.", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,322 @@
+"""
+Benchmark do OCR/extração com PDFs sintéticos de boletos e guias de custas.
+
+    python benchmarks/benchmark_ocr.py gerar corpus_bench            # gera os PDFs e o gabarito (gabarito.json)
+    python benchmarks/benchmark_ocr.py medir corpus_bench -o resultado.json
+    python benchmarks/benchmark_ocr.py medir corpus_bench --comparar resultado_anterior.json
+
+O corpus é reproduzível (mesma semente -> mesmos PDFs) e cobre boletos com linha digitável válida
+(DVs módulo 10/11), guias de custas, CNPJs conhecidos e o CNPJ ignorado por padrão, lotes de várias
+páginas com capas/procurações e páginas com ruído e rotação. Cada configuração do motor roda em um
+processo próprio, então o pico de memória medido é só dela; o cache de OCR fica desligado.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageDraw, ImageFont
+
+PAGE_SIZE = (1654, 2339) # A4 a 200 DPI
+PAGE_DPI = 200
+GABARITO_FILE = 'gabarito.json'
+
+BENEFICIARIOS = [
+    ('Banco do Brasil', '001', 'CONDOMÍNIO EDIFÍCIO AURORA', '12.345.678/0001-90'),
+    ('Caixa Econômica Federal', '104', 'IMOBILIÁRIA BOA VISTA LTDA', '23.456.789/0001-01'),
+    ('Banco Itaú', '341', 'COMPANHIA DE SANEAMENTO', '34.567.890/0001-12'),
+    ('Banco Bradesco', '237', 'CARTÓRIO DO 2º OFÍCIO', '45.678.901/0001-23'),
+    ('Santander', '033', 'ASSOCIAÇÃO DOS ADVOGADOS', '56.789.012/0001-34'),
+]
+CNPJ_IGNORADO = '82.519.190/0001-12' # OAB, ignorado pelo Filtro.config padrão
+TRIBUNAL_CNPJ = '21.154.554/0001-13'
+PAGINAS_SEM_DOCUMENTO = [
+    ['EXCELENTÍSSIMO SENHOR DOUTOR JUIZ DE DIREITO', '', 'Processo nº 5001234-56.2024.8.13.0024',
+     '', 'Requer a juntada dos comprovantes anexos.', 'Termos em que pede deferimento.'],
+    ['PROCURAÇÃO AD JUDICIA', '', 'Outorgante: Fulano de Tal, brasileiro, casado.',
+     'Outorgado: Advogado inscrito na seccional.', 'Poderes da cláusula ad judicia et extra.'],
+]
+
+# Configurações do motor comparadas pelo `medir` (campos de pdf2excel_core.BatchConfig)
+ENGINE_CONFIGS = {
+    'padrao': {},
+    'sem_pre_classificacao': {'preclassify': False},
+    'sem_escada': {'retry_ladder': ()},
+    'dpi_300_fixo': {'dpi': 300, 'retry_ladder': ()},
+    'pagina_inteira': {'roi_ocr': False}, # OCR da página inteira, sem as faixas do Layouts.config
+    'subprocesso': {'ocr_engine': 'subprocesso'},
+    # Sem a escada, para a acurácia de cada filtro ser comparada com a de 'sem_escada'
+    'pre_cinza': {'retry_ladder': (), 'preprocess': ('cinza',)},
+    'pre_bordas': {'retry_ladder': (), 'preprocess': ('bordas',)},
+    'pre_alinhamento': {'retry_ladder': (), 'preprocess': ('alinhamento',)},
+    'pre_limiar': {'retry_ladder': (), 'preprocess': ('limiar',)},
+    'pre_todos': {'retry_ladder': (), 'preprocess': ('cinza', 'bordas', 'alinhamento', 'limiar')},
+}
+REFERENCIA_PRE = 'sem_escada'
+
+# *** Geração do corpus ***
+def modulo10(digits):
+    total = 0
+    for idx, digit in enumerate(reversed(digits)):
+        product = int(digit) * (2 if idx % 2 == 0 else 1)
+        total += product // 10 + product % 10
+    return str((10 - total % 10) % 10)
+
+def modulo11_codigo_barras(digits):
+    total = sum(int(digit) * (2 + idx % 8) for idx, digit in enumerate(reversed(digits)))
+    dv = 11 - total % 11
+    return '1' if dv in (0, 10, 11) else str(dv)
+
+def gerar_linha_digitavel(rng, banco, valor_centavos):
+    """Linha digitável de boleto bancário com DVs válidos. Retorna (só dígitos, formatada)."""
+    campo_livre = ''.join(rng.choice('0123456789') for _ in range(25))
+    fator = f"{rng.randint(1000, 9999)}"
+    valor = f"{valor_centavos:010d}"
+    sem_dv = banco + '9' + fator + valor + campo_livre
+    dv_geral = modulo11_codigo_barras(sem_dv)
+    campo1 = banco + '9' + campo_livre[:5]
+    campo2 = campo_livre[5:15]
+    campo3 = campo_livre[15:25]
+    campo1, campo2, campo3 = campo1 + modulo10(campo1), campo2 + modulo10(campo2), campo3 + modulo10(campo3)
+    digitos = campo1 + campo2 + campo3 + dv_geral + fator + valor
+    formatada = f"{campo1[:5]}.{campo1[5:]} {campo2[:5]}.{campo2[5:]} {campo3[:5]}.{campo3[5:]} {dv_geral} {fator}{valor}"
+    return digitos, formatada
+
+def valor_texto(valor_centavos):
+    return f"{valor_centavos / 100:,.2f}".replace(',', '*').replace('.', ',').replace('*', '.')
+
+def carregar_fonte(tamanho):
+    for nome in ('arial.ttf', 'Arial.ttf', 'DejaVuSans.ttf', 'LiberationSans-Regular.ttf'):
+        try:
+            return ImageFont.truetype(nome, tamanho)
+        except OSError:
+            continue
+    return ImageFont.load_default(size=tamanho)
+
+def desenhar_pagina(linhas, rng, ruido=False, rotacao=0.0):
+    fonte = carregar_fonte(34)
+    page = Image.new('L', PAGE_SIZE, 255)
+    draw = ImageDraw.Draw(page)
+    y = 150
+    for linha in linhas:
+        if linha:
+            draw.text((140, y), linha, font=fonte, fill=0)
+        y += 60
+    if ruido: # Pontos e riscos de digitalização
+        for _ in range(2500):
+            x, y = rng.randrange(PAGE_SIZE[0]), rng.randrange(PAGE_SIZE[1])
+            draw.point((x, y), fill=rng.randint(0, 120))
+        for _ in range(8):
+            x, y = rng.randrange(PAGE_SIZE[0]), rng.randrange(PAGE_SIZE[1])
+            draw.line((x, y, x + rng.randint(-200, 200), y + rng.randint(-5, 5)), fill=rng.randint(60, 160), width=2)
+    if rotacao:
+        rotated = page.rotate(rotacao, resample=Image.BICUBIC, expand=False, fillcolor=255)
+        page.close()
+        page = rotated
+    return page
+
+def pagina_boleto(rng):
+    banco_nome, banco, beneficiario, cnpj = rng.choice(BENEFICIARIOS)
+    valor_centavos = rng.choice([rng.randint(1000, 199999), rng.randint(200001, 900000)]) # Alguns acima de R$ 2.000
+    digitos, formatada = gerar_linha_digitavel(rng, banco, valor_centavos)
+    linhas = [f"{banco_nome} | {banco}-9 | {formatada}", '',
+              'Local de pagamento: Pagável em qualquer banco até o vencimento',
+              f"Beneficiário: {beneficiario}  CNPJ: {cnpj}",
+              f"Vencimento: {rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2025",
+              f"Valor do Documento: R$ {valor_texto(valor_centavos)}",
+              f"Pagador: ORDEM DOS ADVOGADOS DO BRASIL  CNPJ: {CNPJ_IGNORADO}",
+              '', 'Autenticação mecânica - Ficha de Compensação', '', formatada]
+    gabarito = {'tipo': 'boleto', 'cnpj': cnpj, 'linhas_digitaveis': [digitos], 'valor': valor_centavos}
+    return linhas, gabarito
+
+def pagina_guia(rng):
+    numero_guia = f"{rng.randint(1, 9)}.{rng.randint(100, 999)}.{rng.randint(100, 999)}/{rng.randint(2020, 2025)}"
+    valor_centavos = rng.randint(500, 150000)
+    linhas = ['PODER JUDICIÁRIO DO ESTADO', 'GUIA ÚNICA DE CUSTAS', '',
+              f"Nº da Guia {numero_guia}",
+              f"Favorecido: TRIBUNAL DE JUSTIÇA  CNPJ: {TRIBUNAL_CNPJ}",
+              'Custas iniciais e taxa judiciária',
+              f"Valor total: R$ {valor_texto(valor_centavos)}"]
+    gabarito = {'tipo': 'guia_custas', 'cnpj': TRIBUNAL_CNPJ, 'numero_guia': numero_guia, 'valor': valor_centavos}
+    return linhas, gabarito
+
+def gerar_corpus(pasta, quantidade, semente):
+    """Gera `quantidade` PDFs em `pasta` e o gabarito com os dados esperados de cada página."""
+    rng = random.Random(semente)
+    os.makedirs(pasta, exist_ok=True)
+    gabarito = {'semente': semente, 'arquivos': {}}
+    for idx in range(1, quantidade + 1):
+        tipo_arquivo = rng.choices(['boleto', 'guia', 'lote', 'ruido'], weights=[4, 2, 2, 2])[0]
+        paginas = []
+        if tipo_arquivo == 'lote': # Capa/procuração + boletos/guias no mesmo PDF
+            paginas.append((rng.choice(PAGINAS_SEM_DOCUMENTO), {'tipo': 'sem_documento'}))
+            for _ in range(rng.randint(1, 3)):
+                paginas.append(pagina_boleto(rng) if rng.random() < 0.7 else pagina_guia(rng))
+        elif tipo_arquivo == 'guia':
+            paginas.append(pagina_guia(rng))
+        else:
+            paginas.append(pagina_boleto(rng))
+        ruido = tipo_arquivo == 'ruido'
+        imagens = [desenhar_pagina(linhas, rng, ruido=ruido, rotacao=rng.uniform(-2.0, 2.0) if ruido else 0.0)
+                   for linhas, _ in paginas]
+        nome = f"{idx:04d}_{tipo_arquivo}.pdf"
+        imagens[0].save(os.path.join(pasta, nome), 'PDF', resolution=PAGE_DPI, save_all=True, append_images=imagens[1:])
+        for imagem in imagens:
+            imagem.close()
+        gabarito['arquivos'][nome] = {'categoria': tipo_arquivo, 'paginas': [pagina for _, pagina in paginas]}
+    with open(os.path.join(pasta, GABARITO_FILE), 'w', encoding='utf-8') as f:
+        json.dump(gabarito, f, ensure_ascii=False, indent=1)
+    return gabarito
+
+# *** Medição ***
+def valor_centavos_extraido(texto):
+    try:
+        return round(float(texto.replace('.', '').replace(',', '.')) * 100) if texto else None
+    except ValueError:
+        return None
+
+def conferir_pagina(esperado, info):
+    """Retorna (campos corretos, campos esperados) de uma página comparando o extraído com o gabarito."""
+    if esperado['tipo'] == 'sem_documento':
+        return int(info['cnpj'] == 'N/A' and not info['linhas_digitaveis'] and info['tipo'] == 'boleto'), 1
+    acertos = int(info['tipo'] == esperado['tipo']) + int(info['cnpj'] == esperado['cnpj'])
+    if esperado['tipo'] == 'guia_custas':
+        acertos += int(info['numero_guia'] == esperado['numero_guia'])
+        acertos += int(valor_centavos_extraido(info['valor']) == esperado['valor'])
+    else: # A linha digitável aparece no recibo e na ficha de compensação; repetições contam uma vez, como no lote
+        linhas = list(dict.fromkeys(info['linhas_digitaveis']))
+        valores = list(dict.fromkeys(info['valores']))
+        acertos += int(linhas == esperado['linhas_digitaveis'])
+        acertos += int([valor_centavos_extraido(valor) for valor in valores] == [esperado['valor']])
+    return acertos, 4
+
+def medir_configuracao(pasta, nome_config):
+    """Roda uma configuração do motor sobre o corpus (no processo atual) e retorna as métricas."""
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as appdata: # O log do core fica aberto até o fim do processo
+        os.environ['APPDATA'] = appdata # Log, cache e índices do benchmark não se misturam com os do usuário
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        import pdf2excel_core as core
+        core.setup_logging()
+        core.OCR_CACHE_ENABLED = False
+
+        with open(os.path.join(pasta, GABARITO_FILE), encoding='utf-8') as f:
+            gabarito = json.load(f)
+        config = core.BatchConfig(**ENGINE_CONFIGS[nome_config])
+        config.ignored_cnpjs = [core.DEFAULT_IGNORED_CNPJ]
+        arquivos = sorted(gabarito['arquivos'])
+        ocr_stats = core.OCRStats()
+
+        with tempfile.TemporaryDirectory() as temp_dir, ThreadPoolExecutor(max_workers=max(1, config.ocr_workers)) as executor:
+            inicio = time.perf_counter()
+            resultados = list(executor.map(lambda nome: core.ocr_pdf(os.path.join(pasta, nome), temp_dir, config, ocr_stats=ocr_stats),
+                                          arquivos))
+            segundos = time.perf_counter() - inicio
+
+        paginas = acertos = campos = 0
+        por_categoria = {}
+        for nome, (textos, num_paginas, _) in zip(arquivos, resultados):
+            esperado = gabarito['arquivos'][nome]
+            paginas += num_paginas
+            categoria = por_categoria.setdefault(esperado['categoria'], [0, 0])
+            for idx, pagina in enumerate(esperado['paginas']):
+                info = core.extract_info(textos[idx] if idx < len(textos) else '', config.ignored_cnpjs)
+                certos, total = conferir_pagina(pagina, info)
+                acertos, campos = acertos + certos, campos + total
+                categoria[0] += certos
+                categoria[1] += total
+        pico = core.peak_rss_bytes()
+        return {
+            'configuracao': nome_config,
+            'arquivos': len(arquivos),
+            'paginas': paginas,
+            'segundos': round(segundos, 3),
+            'paginas_por_segundo': round(paginas / segundos, 3) if segundos else 0,
+            'pico_memoria_mb': round(pico / 1024 / 1024, 1) if pico else None,
+            'acuracia': round(acertos / campos, 4) if campos else 0,
+            'acuracia_por_categoria': {nome: round(certos / total, 4) for nome, (certos, total) in sorted(por_categoria.items()) if total},
+            'pre_processamento': ocr_stats.preprocess_summary(),
+        }
+
+def medir(pasta, configuracoes):
+    """Roda cada configuração em um processo separado (pico de memória isolado) e retorna as métricas."""
+    resultados = []
+    for nome_config in configuracoes:
+        print(f"Medindo '{nome_config}'...", file=sys.stderr)
+        processo = subprocess.run([sys.executable, os.path.abspath(__file__), '_medir_uma', pasta, nome_config],
+                                  capture_output=True, text=True)
+        if processo.returncode != 0:
+            print(f"Erro na configuração '{nome_config}':\n{processo.stderr}", file=sys.stderr)
+            continue
+        resultados.append(json.loads(processo.stdout.strip().splitlines()[-1]))
+    return resultados
+
+def imprimir_tabela(resultados, anteriores=None):
+    anteriores = {resultado['configuracao']: resultado for resultado in (anteriores or [])}
+    print(f"{'Configuração':<24}{'Páginas':>8}{'Pág/s':>9}{'Pico MB':>9}{'Acurácia':>10}")
+    for resultado in resultados:
+        linha = (f"{resultado['configuracao']:<24}{resultado['paginas']:>8}{resultado['paginas_por_segundo']:>9.2f}"
+                 f"{resultado['pico_memoria_mb'] or 0:>9.1f}{resultado['acuracia']:>10.1%}")
+        anterior = anteriores.get(resultado['configuracao'])
+        if anterior and anterior['paginas_por_segundo']:
+            variacao = resultado['paginas_por_segundo'] / anterior['paginas_por_segundo'] - 1
+            linha += f"   (vel. {variacao:+.1%}, acurácia {resultado['acuracia'] - anterior['acuracia']:+.1%} vs anterior)"
+        print(linha)
+
+    # Custo e ganho de cada filtro de pré-processamento, comparado com a mesma configuração sem filtros
+    referencia = next((resultado for resultado in resultados if resultado['configuracao'] == REFERENCIA_PRE), None)
+    filtros = [resultado for resultado in resultados if resultado.get('pre_processamento')]
+    if filtros:
+        print(f"\n{'Pré-processamento':<24}{'Filtro':<14}{'ms/pág':>8}{'Alteradas':>11}{'Acurácia':>10}")
+        for resultado in filtros:
+            configuracao = resultado['configuracao']
+            ganho = f"{resultado['acuracia'] - referencia['acuracia']:+.1%}" if referencia else '-'
+            for nome, filtro in resultado['pre_processamento'].items():
+                print(f"{configuracao:<24}{nome:<14}{filtro['ms_por_pagina']:>8.1f}"
+                      f"{filtro['alteradas']:>6}/{filtro['paginas']:<4}{ganho:>10}")
+                configuracao = ganho = '' # A acurácia é da configuração inteira; aparece só na primeira linha
+        if referencia:
+            print(f"(acurácia: variação em relação a '{REFERENCIA_PRE}')")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do OCR/extração do PDF2EXCEL com PDFs sintéticos.")
+    sub = parser.add_subparsers(dest='comando', required=True)
+    gerar = sub.add_parser('gerar', help="Gera o corpus sintético e o gabarito.")
+    gerar.add_argument('pasta')
+    gerar.add_argument('-n', '--quantidade', type=int, default=40, help="Quantidade de PDFs (padrão: 40).")
+    gerar.add_argument('--semente', type=int, default=42, help="Semente do gerador (padrão: 42).")
+    medir_parser = sub.add_parser('medir', help="Mede páginas/s, pico de memória e acurácia de cada configuração.")
+    medir_parser.add_argument('pasta')
+    medir_parser.add_argument('-c', '--configuracoes', nargs='+', choices=list(ENGINE_CONFIGS), default=list(ENGINE_CONFIGS))
+    medir_parser.add_argument('-o', '--saida', help="Grava os resultados em JSON (para comparar depois).")
+    medir_parser.add_argument('--comparar', help="JSON de uma medição anterior para mostrar a variação.")
+    interno = sub.add_parser('_medir_uma') # Usado pelo próprio `medir`, um processo por configuração
+    interno.add_argument('pasta')
+    interno.add_argument('configuracao', choices=list(ENGINE_CONFIGS))
+    args = parser.parse_args(argv)
+
+    if args.comando == 'gerar':
+        gabarito = gerar_corpus(args.pasta, args.quantidade, args.semente)
+        num_paginas = sum(len(arquivo['paginas']) for arquivo in gabarito['arquivos'].values())
+        print(f"{len(gabarito['arquivos'])} PDFs ({num_paginas} páginas) gerados em {args.pasta}.")
+    elif args.comando == '_medir_uma':
+        print(json.dumps(medir_configuracao(args.pasta, args.configuracao), ensure_ascii=False))
+    else:
+        resultados = medir(args.pasta, args.configuracoes)
+        anteriores = None
+        if args.comparar:
+            with open(args.comparar, encoding='utf-8') as f:
+                anteriores = json.load(f)['resultados']
+        imprimir_tabela(resultados, anteriores)
+        if args.saida:
+            with open(args.saida, 'w', encoding='utf-8') as f:
+                json.dump({'corpus': os.path.abspath(args.pasta), 'gerado_em': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                           'resultados': resultados}, f, ensure_ascii=False, indent=1)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,177 @@
+import os
+import sys
+import re
+import glob
+import argparse
+import logging
+import pdf2excel_core as core
+
+# Códigos de saída (permitem que o agendador de tarefas identifique o resultado do lote)
+EXIT_OK = 0             # Concluído sem divergências
+EXIT_DIVERGENCIAS = 1   # Concluído, mas com divergências para conferência manual
+EXIT_SEM_DADOS = 2      # Concluído sem nenhum registro extraído
+EXIT_ERRO = 3           # Erro de configuração ou erro crítico no processamento
+EXIT_CANCELADO = 130    # Interrompido pelo usuário (Ctrl+C)
+
+def expand_inputs(patterns):
+    """Expande arquivos, pastas (todos os PDFs dentro) e padrões glob, mantendo a ordem e sem repetições."""
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(glob.glob(os.path.join(pattern, '*.pdf')) + glob.glob(os.path.join(pattern, '*.PDF')))
+        elif glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern, recursive=True))
+        else:
+            matches = [pattern]
+        for path in matches:
+            if path not in files:
+                files.append(path)
+    return files
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="pdf2excel_cli",
+        description="Extrai linhas digitáveis, valores e CNPJs de boletos/guias em PDF para uma planilha Excel, sem interface gráfica.")
+    parser.add_argument("entradas", nargs="*", help="Arquivos PDF, pastas ou padrões glob (ex.: \"C:\\Boletos\\*.pdf\").")
+    parser.add_argument("-o", "--saida", required=True, help="Planilha .xlsx de resultado (criada ou acrescentada se já existir). "
+                        "Com --vigiar aceita códigos de data, ex.: custas_%%Y-%%m-%%d.xlsx.")
+    parser.add_argument("--custas", default="", help="Ordem de Custas (até 5 caracteres: números, '.', ':', '/', '\\').")
+    parser.add_argument("--csv", action="store_true", help="Gera também o CSV (separador ponto e vírgula) quando não houver divergências.")
+    parser.add_argument("--ignorar-cnpj", metavar="CNPJS", help="CNPJs ignorados separados por vírgula (padrão: os do Filtro.config).")
+    parser.add_argument("--paralelo", type=int, default=core.DEFAULT_OCR_WORKERS, help=f"PDFs processados em paralelo (padrão: {core.DEFAULT_OCR_WORKERS}).")
+    parser.add_argument("--duplicatas", choices=core.DUPLICATE_POLICIES, default=core.DUPLICATE_POLICY,
+                        help="Linhas digitáveis/guias já exportadas em execuções anteriores: sinalizar (padrão), ignorar ou desativado.")
+    parser.add_argument("--validade-duplicatas", type=int, default=core.DUPLICATE_EXPIRY_DAYS, metavar="DIAS",
+                        help="Dias até uma exportação deixar de contar como duplicata (padrão: 0 = nunca expira).")
+    parser.add_argument("--motor-ocr", choices=core.OCR_ENGINES, default=core.OCR_ENGINE,
+                        help="auto (padrão): tesserocr com o Tesseract residente quando instalado, senão um processo por página; "
+                        "tesserocr ou subprocesso forçam um dos dois.")
+    parser.add_argument("--pre-processamento", nargs="*", choices=core.PREPROCESS_FILTERS, default=list(core.PREPROCESS), metavar="FILTRO",
+                        help=f"Filtros aplicados à imagem antes do OCR, nesta ordem: {', '.join(core.PREPROCESS_FILTERS)} "
+                        "(padrão: nenhum; 'alinhamento' precisa do numpy).")
+    parser.add_argument("--vigiar", metavar="PASTA", help="Monitora a pasta e processa os PDFs conforme chegam, até Ctrl+C. "
+                        f"Os PDFs lançados na planilha são movidos para a subpasta {core.WATCH_PROCESSED_DIR} "
+                        f"e os que falharam no OCR para {core.WATCH_FAILED_DIR}.")
+    parser.add_argument("--intervalo", type=float, default=core.WATCH_POLL_INTERVAL, help=f"Segundos entre as verificações da pasta monitorada (padrão: {core.WATCH_POLL_INTERVAL:g}).")
+    parser.add_argument("--estabilizar", type=float, default=core.WATCH_SETTLE_SECONDS, help=f"Segundos sem alteração para considerar um PDF completamente gravado (padrão: {core.WATCH_SETTLE_SECONDS:g}).")
+    parser.add_argument("--log-json", action="store_true", default=core.LOG_JSON,
+                        help="Grava também o PDF2EXCEL.jsonl (um registro JSON por linha, com o tempo de cada etapa por arquivo e página).")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Mostra apenas avisos e erros no terminal.")
+    return parser
+
+def watch_folder(args, result_file, config, on_batch_event):
+    """Modo pasta monitorada: roda até Ctrl+C, informando as divergências de cada lote no terminal."""
+    watcher = core.FolderWatcher(os.path.abspath(args.vigiar), result_file, config,
+                                 poll_interval=args.intervalo, settle_seconds=args.estabilizar)
+    watcher.add_listener(on_batch_event)
+
+    def on_watch_batch(event, data):
+        if event == 'watch_batch':
+            for message in report_divergencias(data['result']):
+                core.log_message(message, "WARNING")
+    watcher.add_listener(on_watch_batch)
+
+    worker = watcher.start()
+    try:
+        while worker.is_alive():
+            worker.join(timeout=0.5)
+    except KeyboardInterrupt:
+        core.log_message("Encerrando o monitoramento... aguardando os PDFs em andamento.", "WARNING")
+        watcher.cancel()
+        worker.join()
+    return EXIT_OK
+
+def report_divergencias(outcome):
+    """Mensagens de divergência de um lote, no mesmo formato da janela de divergências."""
+    messages = list(outcome['error_messages'])
+    messages += [f"Arquivo com mais de uma página: {name}" for name in outcome['arquivos_com_paginas_a_mais']]
+    messages += [f"Arquivo com informações faltando: {name}" for name in outcome['arquivos_com_dados_incompletos']]
+    return messages
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    core.setup_logging(json_lines=args.log_json)
+
+    console_handler = logging.StreamHandler(sys.stderr)
+    console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    console_handler.setLevel(logging.WARNING if args.quiet else logging.INFO)
+    core.logger.addHandler(console_handler)
+
+    result_file = os.path.abspath(args.saida)
+    if not result_file.lower().endswith('.xlsx'):
+        core.log_message(f"A planilha de saída deve ter extensão .xlsx: {args.saida}", "ERROR")
+        return EXIT_ERRO
+    if not re.match(r'^[0-9\.\:\/\\]{0,5}$', args.custas):
+        core.log_message(f"Valor de custas inválido: {args.custas}", "ERROR")
+        return EXIT_ERRO
+    if args.paralelo < 1:
+        core.log_message(f"Quantidade de PDFs em paralelo inválida: {args.paralelo}", "ERROR")
+        return EXIT_ERRO
+    if not os.path.exists(core.poppler_path):
+        core.log_message(f"Pasta do Poppler não encontrada: {core.poppler_path}", "CRITICAL_ERROR")
+        return EXIT_ERRO
+
+    if args.vigiar and args.entradas:
+        core.log_message("Use arquivos de entrada ou --vigiar, não os dois.", "ERROR")
+        return EXIT_ERRO
+    if args.vigiar and not os.path.isdir(args.vigiar):
+        core.log_message(f"Pasta monitorada não encontrada: {args.vigiar}", "ERROR")
+        return EXIT_ERRO
+    if args.validade_duplicatas < 0:
+        core.log_message(f"Validade das duplicatas inválida: {args.validade_duplicatas}", "ERROR")
+        return EXIT_ERRO
+    if args.intervalo <= 0 or args.estabilizar < 0:
+        core.log_message("Intervalo e tempo de estabilização devem ser positivos.", "ERROR")
+        return EXIT_ERRO
+    input_files = [] if args.vigiar else expand_inputs(args.entradas)
+    if not input_files and not args.vigiar:
+        core.log_message("Nenhum arquivo de entrada encontrado.", "ERROR")
+        return EXIT_ERRO
+    config = core.BatchConfig(custas=args.custas, save_csv=args.csv, ocr_workers=args.paralelo,
+                              duplicate_policy=args.duplicatas, duplicate_expiry_days=args.validade_duplicatas,
+                              ocr_engine=args.motor_ocr, preprocess=tuple(args.pre_processamento))
+    if args.ignorar_cnpj is not None:
+        # Vale apenas para esta execução; o Filtro.config não é alterado
+        config.ignored_cnpjs = [cnpj.strip() for cnpj in args.ignorar_cnpj.split(',') if cnpj.strip()]
+        core.log_message(f"CNPJs ignorados nesta execução: {config.ignored_cnpjs}", "INFO")
+
+    def on_batch_event(event, data):
+        if event == 'file_done':
+            core.log_message(f"[{data['processed']}/{data['total']}] {data['name']}", "INFO")
+
+    if args.vigiar:
+        return watch_folder(args, result_file, config, on_batch_event)
+
+    batch = core.BatchProcessor(input_files, result_file, config)
+    batch.add_listener(on_batch_event)
+    worker = batch.start()
+    try:
+        while worker.is_alive():
+            worker.join(timeout=0.5) # join com timeout para o Ctrl+C ser atendido
+    except KeyboardInterrupt:
+        core.log_message("Cancelando... aguardando os PDFs em andamento.", "WARNING")
+        batch.cancel()
+        worker.join()
+
+    outcome = batch.result
+    if batch.cancel_token.cancelled:
+        return EXIT_CANCELADO
+    if not outcome or outcome['fatal_error'] or outcome['critical_error']:
+        return EXIT_ERRO # Inclui a planilha que não pôde ser salva (ex.: aberta no Excel)
+
+    divergencias = report_divergencias(outcome)
+    num_erros_reportados = len(divergencias)
+    for message in divergencias:
+        print(message, file=sys.stderr)
+
+    if outcome['num_registros_extraidos'] == 0 and num_erros_reportados == 0:
+        core.log_message("Processamento concluído, mas nenhum dado foi extraído.", "WARNING")
+        return EXIT_SEM_DADOS
+    if num_erros_reportados > 0:
+        core.log_message(f"Processamento concluído com {num_erros_reportados} problemas/erros.", "WARNING")
+        return EXIT_DIVERGENCIAS
+    core.log_message("Processamento concluído com sucesso!", "SUCCESS")
+    return EXIT_OK
+
+if __name__ == "__main__":
+    sys.exit(main())
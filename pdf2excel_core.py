@@ -0,0 +1,2734 @@
+import os
+import subprocess
+import sys
+import re
+from threading import Thread
+import threading
+import queue
+import logging
+import csv
+import json
+import tempfile
+import shlex
+import io
+import sqlite3
+import hashlib
+import time
+import zipfile
+import atexit
+import importlib
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from contextlib import contextmanager
+from datetime import datetime
+
+# Importar este módulo não carrega o pdf2image, o openpyxl nem o pytesseract e não toca no disco: a pasta
+# de configuração, o log, as configurações, o cache de OCR e o índice de duplicatas são criados/abertos no
+# primeiro uso ou em segundo plano por `warm_up` enquanto o usuário escolhe os arquivos.
+
+# *** Configuração de Logging ***
+log_dir = os.path.join(os.environ['APPDATA'], 'PDF2EXCEL')
+
+def ensure_log_dir():
+    """Cria a pasta de log/configuração (%APPDATA%/PDF2EXCEL) antes da primeira gravação nela."""
+    os.makedirs(log_dir, exist_ok=True)
+
+log_file_path = os.path.join(log_dir, 'PDF2EXCEL.log')
+log_json_path = os.path.join(log_dir, 'PDF2EXCEL.jsonl')
+LOG_MAX_BYTES = 5 * 1024 * 1024 # Tamanho de cada arquivo de log antes da rotação
+LOG_BACKUP_COUNT = 5 # Arquivos antigos mantidos (PDF2EXCEL.log.1 ... PDF2EXCEL.log.5)
+# Grava também o PDF2EXCEL.jsonl: um objeto JSON por linha, incluindo o tempo de cada etapa por arquivo e página
+LOG_JSON = False
+
+# Logger global (a GUI e a linha de comando adicionam seus próprios handlers depois de `setup_logging`)
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Tempos das etapas (arquivo, página, etapa, segundos) enviados pelo PerformanceReport; só vão para o JSON-lines
+perf_logger = logging.getLogger('PDF2EXCEL.desempenho')
+perf_logger.propagate = False
+perf_logger.disabled = True
+
+class JsonLinesFormatter(logging.Formatter):
+    """Um registro por linha em JSON; os tempos das etapas trazem também arquivo, página, etapa e segundos."""
+    FIELDS = ('arquivo', 'pagina', 'etapa', 'segundos')
+
+    def format(self, record):
+        entry = {'data': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+                 'nivel': record.levelname, 'thread': record.threadName, 'mensagem': record.getMessage()}
+        for name in self.FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        return json.dumps(entry, ensure_ascii=False)
+
+log_queue_handler = None
+log_listener = None
+
+def setup_logging(json_lines=LOG_JSON):
+    """
+    Liga o log em arquivo. Chamado pela GUI e pela linha de comando ao iniciar.
+    O PDF2EXCEL.log é acrescentado e rotacionado por tamanho, mantendo o histórico de vários dias.
+    As threads só enfileiram os registros (QueueHandler); a gravação em disco roda na thread do
+    QueueListener, fora do caminho do OCR.
+    """
+    import logging.handlers # Importa socket/pickle; fica fora da importação do módulo
+    global log_queue_handler, log_listener
+    stop_logging() # Evita duplicação em re-execuções (útil para desenvolvimento)
+    ensure_log_dir()
+
+    file_handler = logging.handlers.RotatingFileHandler(log_file_path, maxBytes=LOG_MAX_BYTES,
+                                                        backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    file_handler.addFilter(lambda record: record.name != perf_logger.name)
+    handlers = [file_handler]
+    if json_lines:
+        json_handler = logging.handlers.RotatingFileHandler(log_json_path, maxBytes=LOG_MAX_BYTES,
+                                                            backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+        json_handler.setFormatter(JsonLinesFormatter())
+        handlers.append(json_handler)
+
+    log_queue = queue.SimpleQueue()
+    log_queue_handler = logging.handlers.QueueHandler(log_queue)
+    log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    log_listener.start()
+    logger.addHandler(log_queue_handler)
+    perf_logger.disabled = not json_lines
+    if json_lines:
+        perf_logger.addHandler(log_queue_handler)
+
+    logger.info("Programa PDF2EXCEL iniciado.") # Primeiro log ao iniciar
+
+def stop_logging():
+    """Grava os registros ainda na fila e fecha os arquivos de log (também na saída do programa)."""
+    global log_queue_handler, log_listener
+    if log_queue_handler is not None:
+        logger.removeHandler(log_queue_handler)
+        perf_logger.removeHandler(log_queue_handler)
+        log_queue_handler = None
+    if log_listener is not None:
+        log_listener.stop() # Esvazia a fila antes de encerrar a thread
+        for handler in log_listener.handlers:
+            handler.close()
+        log_listener = None
+
+atexit.register(stop_logging)
+
+# *** Configuração do Filtro de CNPJ ***
+filtro_config_path = os.path.join(log_dir, 'Filtro.config')
+ignored_cnpjs_list = None # Carregado no primeiro uso (ver get_ignored_cnpjs)
+DEFAULT_IGNORED_CNPJ = "82.519.190/0001-12" # CNPJ da OAB como padrão
+
+def load_ignored_cnpjs():
+    global ignored_cnpjs_list
+    try:
+        if os.path.exists(filtro_config_path):
+            with open(filtro_config_path, 'r', encoding='utf-8') as f:
+                content = f.read().strip()
+                if content:
+                    ignored_cnpjs_list = [cnpj.strip() for cnpj in content.split(',') if cnpj.strip()]
+                else:
+                    # Se o arquivo existe mas está vazio, usa o padrão e salva
+                    ignored_cnpjs_list = [DEFAULT_IGNORED_CNPJ]
+                    save_cnpjs_to_config(DEFAULT_IGNORED_CNPJ) # Salva o padrão se o arquivo estiver vazio
+        else:
+            # Se o arquivo não existe, cria com o padrão
+            ignored_cnpjs_list = [DEFAULT_IGNORED_CNPJ]
+            save_cnpjs_to_config(DEFAULT_IGNORED_CNPJ) # Salva o padrão se o arquivo não existir
+    except Exception as e:
+        logger.error(f"Erro ao carregar CNPJs ignorados: {e}")
+        ignored_cnpjs_list = [DEFAULT_IGNORED_CNPJ] # Fallback para o padrão em caso de erro
+    logger.info(f"CNPJs ignorados carregados: {ignored_cnpjs_list}")
+
+def save_cnpjs_to_config(cnpjs_string):
+    global ignored_cnpjs_list
+    try:
+        ensure_log_dir()
+        with open(filtro_config_path, 'w', encoding='utf-8') as f:
+            f.write(cnpjs_string)
+        # Recarrega a lista após salvar
+        load_ignored_cnpjs()
+        logger.info(f"CNPJs ignorados salvos em {filtro_config_path}: {cnpjs_string}")
+        return True
+    except Exception as e:
+        logger.error(f"Erro ao salvar CNPJs no arquivo de configuração: {e}")
+        return False
+
+def get_ignored_cnpjs():
+    """CNPJs ignorados do Filtro.config, lidos na primeira vez em que são necessários."""
+    if ignored_cnpjs_list is None:
+        load_ignored_cnpjs()
+    return ignored_cnpjs_list
+
+# *** Configuração dos Layouts (OCR por Região de Interesse) ***
+# Cada tipo de documento lista as faixas da página que contêm os dados usados pelo extract_info,
+# em frações da largura/altura da página: [esquerda, topo, direita, base].
+layouts_config_path = os.path.join(log_dir, 'Layouts.config')
+ROI_OCR_ENABLED = True
+# Os layouts são testados na ordem em que aparecem; faixas iguais entre layouts são reconhecidas uma única vez.
+DEFAULT_LAYOUT_TEMPLATES = {
+    # Recibo do pagador (beneficiário/CNPJ) e topo da ficha de compensação (linha digitável)
+    'boleto': [[0.0, 0.0, 1.0, 0.25], [0.0, 0.45, 1.0, 0.70]],
+    # Cabeçalho da guia: título "GUIA ÚNICA DE CUSTAS", Nº da Guia, valor e CNPJ
+    'guia_custas': [[0.0, 0.0, 1.0, 0.25], [0.0, 0.25, 1.0, 0.40]],
+}
+layout_templates = None # Carregado no primeiro uso (ver get_layout_templates)
+
+def load_layout_templates():
+    global layout_templates
+    try:
+        if os.path.exists(layouts_config_path):
+            with open(layouts_config_path, 'r', encoding='utf-8') as f:
+                templates = json.load(f)
+            for doc_type, bands in templates.items():
+                for left, top, right, bottom in bands:
+                    if not (0 <= left < right <= 1 and 0 <= top < bottom <= 1):
+                        raise ValueError(f"faixa inválida em '{doc_type}': {[left, top, right, bottom]}")
+            layout_templates = templates
+        else:
+            # Se o arquivo não existe, cria com o padrão
+            layout_templates = DEFAULT_LAYOUT_TEMPLATES
+            ensure_log_dir()
+            with open(layouts_config_path, 'w', encoding='utf-8') as f:
+                json.dump(DEFAULT_LAYOUT_TEMPLATES, f, indent=4)
+    except Exception as e:
+        logger.error(f"Erro ao carregar layouts de OCR por região, usando o padrão: {e}")
+        layout_templates = DEFAULT_LAYOUT_TEMPLATES # Fallback para o padrão em caso de erro
+    logger.info(f"Layouts de OCR por região carregados: {', '.join(layout_templates) or 'nenhum'}")
+
+def get_layout_templates():
+    """Layouts do Layouts.config, lidos na primeira vez em que são necessários."""
+    if layout_templates is None:
+        load_layout_templates()
+    return layout_templates
+
+# Definir o caminho do Poppler (apenas para a versão .exe)
+poppler_path = os.path.join(sys._MEIPASS, 'poppler', 'bin') if getattr(sys, 'frozen', False) else r"C:\Program Files\poppler\bin"
+
+# Se o Poppler não estiver na pasta padrão do executável, verifica se está instalado em C:\Program Files\poppler\bin
+if getattr(sys, 'frozen', False) and not os.path.exists(poppler_path):
+    poppler_path = r"C:\Program Files\poppler\bin"  # Define o caminho alternativo
+
+# pdf2image importado só na primeira renderização (os nomes continuam disponíveis em pdf2excel_core)
+def convert_from_path(*args, **kwargs):
+    from pdf2image import convert_from_path as pdf2image_convert_from_path
+    return pdf2image_convert_from_path(*args, **kwargs)
+
+def pdfinfo_from_path(*args, **kwargs):
+    from pdf2image import pdfinfo_from_path as pdf2image_pdfinfo_from_path
+    return pdf2image_pdfinfo_from_path(*args, **kwargs)
+
+# Definir o caminho do Tesseract OCR (apenas para a versão .exe)
+tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+
+# Evita que cada chamada ao Poppler/Tesseract abra uma janela de console no Windows
+SUBPROCESS_FLAGS = subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
+
+# Quantidade padrão de PDFs processados em paralelo (cada um dispara seus próprios processos do Poppler/Tesseract)
+DEFAULT_OCR_WORKERS = os.cpu_count() or 1
+
+# Quantidade máxima de páginas já renderizadas aguardando o Tesseract dentro de um mesmo PDF
+PAGE_QUEUE_SIZE = 2
+
+# Limite global de páginas decodificadas (imagens PIL) vivas ao mesmo tempo, somando todos os PDFs em paralelo.
+# Com o limite, um PDF de 200 páginas ocupa a mesma memória que um de 2.
+MAX_LIVE_PAGE_IMAGES = 2 * DEFAULT_OCR_WORKERS
+
+# Grava a planilha de resultado em modo write-only, numa única passada (ver StreamingSheetWriter)
+STREAMING_OUTPUT = True
+# Acrescenta as linhas novas a uma planilha gravada pelo programa sem reler o histórico (ver IncrementalSheetWriter)
+INCREMENTAL_OUTPUT = True
+
+# Pré-classificação das páginas de PDFs com mais de uma página: antes do OCR completo, uma miniatura
+# (~PRECLASSIFY_DPI) passa pelo Tesseract e a página só segue se tiver alguma palavra
+# típica de boleto ou guia. Capas, procurações e ofícios deixam de passar pelo OCR completo.
+PRECLASSIFY_PAGES = True
+PRECLASSIFY_DPI = 70 # Resolução aproximada da miniatura (reduzida da renderização no DPI base)
+PRECLASSIFY_ANCHORS = re.compile(r'guia|custas|boleto|banco|benefici|cedente|pagador|sacado|vencimento|cnpj|'
+                                 r'nosso\s*n|valor\s*do\s*doc|autentica|digit|\d{5}[.,\s]?\d{5}', re.IGNORECASE)
+
+# Linhas digitáveis/guias já exportadas em execuções anteriores (ver DuplicateIndex):
+# 'sinalizar' lança a linha pintada de amarelo com aviso, 'ignorar' não lança a linha, 'desativado' não verifica
+DUPLICATE_POLICIES = ('sinalizar', 'ignorar', 'desativado')
+DUPLICATE_POLICY = 'sinalizar'
+DUPLICATE_EXPIRY_DAYS = 0 # Dias até uma exportação deixar de contar como duplicata (0 = nunca expira)
+
+# Relatório de desempenho (tempo de cada etapa por arquivo e por página) gravado ao lado da planilha
+# como <planilha>.desempenho.json e <planilha>.desempenho.csv (ver PerformanceReport)
+PERFORMANCE_REPORT = True
+
+def image_nbytes(image):
+    """Tamanho aproximado de uma imagem PIL decodificada na memória."""
+    return image.width * image.height * len(image.getbands())
+
+def peak_rss_bytes():
+    """Pico de memória residente do processo até agora, ou None se não for possível medir."""
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            from ctypes import wintypes
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                            ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                            ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            get_current_process = ctypes.windll.kernel32.GetCurrentProcess
+            get_current_process.restype = wintypes.HANDLE
+            get_process_memory_info = ctypes.windll.psapi.GetProcessMemoryInfo
+            get_process_memory_info.argtypes = [wintypes.HANDLE, ctypes.c_void_p, wintypes.DWORD]
+            if not get_process_memory_info(get_current_process(), ctypes.byref(counters), counters.cb):
+                return None
+            return counters.PeakWorkingSetSize
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024 # Linux informa em KB
+    except Exception:
+        return None
+
+class PageImageBudget:
+    """
+    Controla quantas páginas decodificadas estão vivas ao mesmo tempo. O renderizador reserva
+    uma vaga antes de renderizar cada página e o OCR a devolve ao liberar a imagem, então a
+    memória usada por imagens fica limitada independentemente do tamanho dos PDFs.
+    Também registra o pico de imagens/bytes vivos para o log.
+    """
+    def __init__(self, max_images):
+        self.max_images = max(1, max_images)
+        self.condition = threading.Condition()
+        self.live_images = 0
+        self.live_bytes = 0
+        self.peak_images = 0
+        self.peak_bytes = 0
+
+    def acquire(self, cancel_token):
+        """Reserva uma vaga, aguardando se necessário. Retorna False se o lote for cancelado durante a espera."""
+        with self.condition:
+            while self.live_images >= self.max_images:
+                if cancel_token.cancelled:
+                    return False
+                self.condition.wait(timeout=0.5)
+            self.live_images += 1
+            self.peak_images = max(self.peak_images, self.live_images)
+            return True
+
+    def add_bytes(self, nbytes):
+        with self.condition:
+            self.live_bytes += nbytes
+            self.peak_bytes = max(self.peak_bytes, self.live_bytes)
+
+    def release(self, nbytes=0):
+        with self.condition:
+            self.live_images -= 1
+            self.live_bytes -= nbytes
+            self.condition.notify()
+
+    def reset_peaks(self):
+        with self.condition:
+            self.peak_images = self.live_images
+            self.peak_bytes = self.live_bytes
+
+page_image_budget = PageImageBudget(MAX_LIVE_PAGE_IMAGES)
+
+# Parâmetros do OCR (também fazem parte da chave do cache de resultados)
+OCR_DPI = 150 # DPI base: rápido, suficiente para a maioria dos boletos/guias
+TESSERACT_LANG = 'por'
+TESSERACT_CONFIG = ''
+
+# Motor do OCR: 'tesserocr' mantém workers do Tesseract residentes (modelo carregado uma vez por worker,
+# ver TesserocrPool); 'subprocesso' abre um tesseract.exe por imagem; 'auto' usa o tesserocr se estiver instalado
+OCR_ENGINES = ('auto', 'tesserocr', 'subprocesso')
+OCR_ENGINE = 'auto'
+
+# Escada de novas tentativas para páginas cujo texto no DPI base não passa na validação (CNPJ e linha
+# digitável/guia completa). Cada degrau só é tentado se os anteriores falharem; o melhor texto é mantido.
+# 'binarize' aplica limiar fixo (preto e branco) e 'psm' troca o modo de segmentação de página do Tesseract.
+OCR_RETRY_LADDER = (
+    {'dpi': 300, 'binarize': False, 'psm': None},
+    {'dpi': 300, 'binarize': True, 'psm': None},
+    {'dpi': 300, 'binarize': True, 'psm': 6}, # PSM 6: bloco único de texto uniforme
+)
+BINARIZE_THRESHOLD = 160
+
+# Pré-processamento das páginas entre a renderização e o OCR (ver preprocess_image). Filtros, aplicados nesta ordem:
+# 'cinza' renderiza/converte em tons de cinza; 'bordas' pinta de branco a moldura escura deixada pelo scanner;
+# 'alinhamento' corrige a inclinação pelo perfil de projeção das linhas (requer numpy); 'limiar' binariza
+# comparando cada pixel com a média da vizinhança (fundos cinza, sombras, carimbos claros).
+# Desligado por padrão: as configurações pre_* do benchmark (benchmarks/benchmark_ocr.py) mostram o ganho
+# de acurácia e o custo por página de cada filtro antes de ligá-lo. Os filtros fazem parte da chave do cache.
+PREPROCESS_FILTERS = ('cinza', 'bordas', 'alinhamento', 'limiar')
+PREPROCESS = ()
+DARK_PIXEL_THRESHOLD = 100 # Abaixo disso o pixel conta como escuro (moldura e perfil de projeção)
+BORDER_DARK_FRACTION = 0.6 # Linhas/colunas da borda com mais pixels escuros que isso são moldura do scanner
+BORDER_MAX_FRACTION = 0.1 # A moldura ocupa no máximo 10% da página de cada lado
+DESKEW_MAX_ANGLE = 5.0 # Inclinação máxima procurada, em graus
+DESKEW_STEP = 0.25
+DESKEW_MIN_ANGLE = 0.5 # Inclinações menores não compensam a rotação (o Tesseract tolera)
+DESKEW_SAMPLE_PIXELS = 20000 # Pixels escuros usados na estimativa (amostra uniforme)
+ADAPTIVE_THRESHOLD_WINDOW = 0.1 # Raio da vizinhança do limiar adaptativo, em polegadas (15 px a 150 DPI)
+ADAPTIVE_THRESHOLD_OFFSET = 12 # Quanto o pixel precisa ser mais escuro que a vizinhança para virar preto
+
+# *** Cache de Resultados do OCR ***
+ocr_cache_path = os.path.join(log_dir, 'OCR.cache')
+OCR_CACHE_MAX_BYTES = 200 * 1024 * 1024 # Limite do cache; as páginas usadas há mais tempo são descartadas primeiro
+
+class OCRCache:
+    """
+    Cache persistente (SQLite) do texto reconhecido por página.
+    A chave é o hash do conteúdo do PDF, o número da página, o DPI e o idioma/configuração do
+    Tesseract, então arquivos renomeados ou movidos continuam aproveitando o cache.
+    Quando o tamanho total passa de `max_bytes`, as páginas usadas há mais tempo são removidas (LRU).
+    """
+    def __init__(self, db_path, max_bytes=OCR_CACHE_MAX_BYTES):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS paginas (
+                pdf_hash TEXT NOT NULL, pagina INTEGER NOT NULL, dpi INTEGER NOT NULL,
+                lang TEXT NOT NULL, config TEXT NOT NULL, texto TEXT NOT NULL,
+                tamanho INTEGER NOT NULL, ultimo_uso REAL NOT NULL,
+                PRIMARY KEY (pdf_hash, pagina, dpi, lang, config)) WITHOUT ROWID""")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_paginas_uso ON paginas (ultimo_uso)")
+
+    def get_pages(self, pdf_hash, dpi, lang, config):
+        """Retorna um dict {número da página: texto} com as páginas do PDF já presentes no cache."""
+        with self.lock, self.conn:
+            rows = self.conn.execute("SELECT pagina, texto FROM paginas WHERE pdf_hash=? AND dpi=? AND lang=? AND config=?",
+                                     (pdf_hash, dpi, lang, config)).fetchall()
+            if rows: # Marca as páginas como usadas agora (ordem do LRU)
+                self.conn.execute("UPDATE paginas SET ultimo_uso=? WHERE pdf_hash=? AND dpi=? AND lang=? AND config=?",
+                                  (time.time(), pdf_hash, dpi, lang, config))
+        return dict(rows)
+
+    def put_page(self, pdf_hash, page_number, dpi, lang, config, text):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO paginas VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                              (pdf_hash, page_number, dpi, lang, config, text, len(text.encode('utf-8')), time.time()))
+
+    def evict(self):
+        """Remove as páginas menos usadas recentemente até o cache voltar ao limite de tamanho."""
+        with self.lock, self.conn:
+            total = self.conn.execute("SELECT COALESCE(SUM(tamanho), 0) FROM paginas").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            removed = 0
+            for pdf_hash, pagina, dpi, lang, config, tamanho in self.conn.execute(
+                    "SELECT pdf_hash, pagina, dpi, lang, config, tamanho FROM paginas ORDER BY ultimo_uso").fetchall():
+                if total <= self.max_bytes:
+                    break
+                self.conn.execute("DELETE FROM paginas WHERE pdf_hash=? AND pagina=? AND dpi=? AND lang=? AND config=?",
+                                  (pdf_hash, pagina, dpi, lang, config))
+                total -= tamanho
+                removed += 1
+        logger.info(f"Cache de OCR: {removed} páginas antigas removidas para respeitar o limite de tamanho.")
+        return removed
+
+    def clear(self):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM paginas")
+        with self.lock:
+            self.conn.execute("VACUUM") # Devolve o espaço em disco
+        logger.info("Cache de OCR limpo.")
+
+ocr_cache = None # Aberto no primeiro uso (ver get_ocr_cache)
+OCR_CACHE_ENABLED = True # False desliga o cache (também fica False se o arquivo não puder ser aberto)
+storage_lock = threading.Lock() # Evita que duas threads de OCR abram o mesmo banco ao mesmo tempo
+
+def get_ocr_cache():
+    """Cache de OCR, aberto na primeira vez em que é necessário; None se estiver desativado."""
+    global ocr_cache, OCR_CACHE_ENABLED
+    with storage_lock:
+        if ocr_cache is None and OCR_CACHE_ENABLED:
+            try:
+                ensure_log_dir()
+                ocr_cache = OCRCache(ocr_cache_path)
+            except Exception as e:
+                logger.error(f"Cache de OCR desativado, não foi possível abrir {ocr_cache_path}: {e}")
+                OCR_CACHE_ENABLED = False
+        return ocr_cache
+
+duplicate_index_path = os.path.join(log_dir, 'Exportados.index')
+
+class DuplicateIndex:
+    """
+    Índice persistente (SQLite) de todas as linhas digitáveis e números de guia já exportados para
+    alguma planilha, para que o mesmo boleto processado em dias diferentes não seja pago duas vezes.
+    A chave primária (tabela WITHOUT ROWID) mantém a consulta rápida com centenas de milhares de registros;
+    o caminho da planilha fica numa tabela à parte para não se repetir em cada registro.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS planilhas (id INTEGER PRIMARY KEY, caminho TEXT NOT NULL UNIQUE)")
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS exportados (
+                chave TEXT NOT NULL PRIMARY KEY, arquivo TEXT NOT NULL, planilha INTEGER NOT NULL,
+                exportado_em REAL NOT NULL) WITHOUT ROWID""")
+            # Sem índice por data: a expiração é rara e uma varredura completa é barata; o índice dobraria o arquivo
+
+    @staticmethod
+    def linha_key(linha_digitavel):
+        return f"L{linha_digitavel}"
+
+    @staticmethod
+    def guia_key(numero_guia):
+        return f"G{numero_guia}"
+
+    def lookup(self, key, expiry_days=0):
+        """Retorna (arquivo, planilha, data da exportação) se a chave já foi exportada dentro da validade, senão None."""
+        cutoff = time.time() - expiry_days * 86400 if expiry_days else 0
+        with self.lock:
+            return self.conn.execute("""SELECT e.arquivo, p.caminho, e.exportado_em FROM exportados e
+                                        JOIN planilhas p ON p.id = e.planilha WHERE e.chave=? AND e.exportado_em>=?""",
+                                     (key, cutoff)).fetchone()
+
+    def add_many(self, entries, result_file):
+        """Registra [(chave, arquivo)] como exportados para `result_file` agora."""
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO planilhas (caminho) VALUES (?)", (result_file,))
+            planilha_id = self.conn.execute("SELECT id FROM planilhas WHERE caminho=?", (result_file,)).fetchone()[0]
+            self.conn.executemany("INSERT OR REPLACE INTO exportados VALUES (?, ?, ?, ?)",
+                                  [(key, arquivo, planilha_id, now) for key, arquivo in entries])
+
+    def purge(self, expiry_days):
+        """Remove as exportações mais antigas que `expiry_days` dias."""
+        if not expiry_days:
+            return 0
+        with self.lock, self.conn:
+            removed = self.conn.execute("DELETE FROM exportados WHERE exportado_em<?", (time.time() - expiry_days * 86400,)).rowcount
+        if removed:
+            logger.info(f"Índice de duplicatas: {removed} exportações expiradas removidas.")
+        return removed
+
+    def clear(self):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM exportados")
+            self.conn.execute("DELETE FROM planilhas")
+        with self.lock:
+            self.conn.execute("VACUUM")
+        logger.info("Índice de duplicatas limpo.")
+
+duplicate_index = None # Aberto no primeiro uso (ver get_duplicate_index)
+DUPLICATE_INDEX_ENABLED = True # False desliga o índice (também fica False se o arquivo não puder ser aberto)
+
+def get_duplicate_index():
+    """Índice de duplicatas, aberto na primeira vez em que é necessário; None se estiver desativado."""
+    global duplicate_index, DUPLICATE_INDEX_ENABLED
+    with storage_lock:
+        if duplicate_index is None and DUPLICATE_INDEX_ENABLED:
+            try:
+                ensure_log_dir()
+                duplicate_index = DuplicateIndex(duplicate_index_path)
+            except Exception as e:
+                logger.error(f"Verificação de duplicatas entre execuções desativada, não foi possível abrir {duplicate_index_path}: {e}")
+                DUPLICATE_INDEX_ENABLED = False
+        return duplicate_index
+
+def file_sha256(path):
+    """Hash SHA-256 do conteúdo do arquivo, lido em blocos para não carregar o PDF inteiro na memória."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class CancellationToken:
+    """Sinal de cancelamento de um lote, compartilhado entre a thread do lote e as threads de OCR."""
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def wait(self, timeout):
+        """Aguarda até `timeout` segundos; retorna True se o cancelamento ocorrer antes."""
+        return self._event.wait(timeout)
+
+@dataclass
+class BatchConfig:
+    """
+    Configuração de um lote. Cada BatchProcessor tem a sua, então lotes diferentes podem rodar ao
+    mesmo tempo no mesmo processo com filtros, layouts e parâmetros de OCR próprios.
+    Os valores padrão vêm da configuração global (Filtro.config, Layouts.config e constantes acima).
+    """
+    custas: str = ''
+    save_csv: bool = False
+    ocr_workers: int = DEFAULT_OCR_WORKERS
+    ignored_cnpjs: list = field(default_factory=lambda: list(get_ignored_cnpjs()))
+    layout_templates: dict = field(default_factory=lambda: dict(get_layout_templates()))
+    roi_ocr: bool = ROI_OCR_ENABLED
+    use_text_layer: bool = True
+    poppler_path: str = poppler_path
+    dpi: int = OCR_DPI
+    tesseract_lang: str = TESSERACT_LANG
+    tesseract_config: str = TESSERACT_CONFIG
+    ocr_engine: str = OCR_ENGINE
+    streaming_output: bool = STREAMING_OUTPUT
+    incremental_output: bool = INCREMENTAL_OUTPUT
+    preclassify: bool = PRECLASSIFY_PAGES
+    retry_ladder: tuple = OCR_RETRY_LADDER
+    preprocess: tuple = PREPROCESS
+    duplicate_policy: str = DUPLICATE_POLICY
+    duplicate_expiry_days: int = DUPLICATE_EXPIRY_DAYS
+    performance_report: bool = PERFORMANCE_REPORT
+
+# Origem do texto de cada página, informada no log/relatório
+PAGE_SOURCE_TEXT_LAYER = 'camada de texto'
+PAGE_SOURCE_CACHE = 'cache'
+PAGE_SOURCE_OCR = 'OCR'
+PAGE_SOURCE_SKIPPED = 'pré-classificação (sem boleto/guia, OCR dispensado)'
+
+def extract_text_layer(pdf_path, num_pages, poppler_dir=poppler_path):
+    """
+    Extrai a camada de texto embutida no PDF com o `pdftotext` do Poppler (uma única chamada
+    para o arquivo inteiro). Retorna uma lista com o texto de cada página, ou None se a
+    ferramenta não estiver disponível ou falhar.
+    """
+    pdftotext_cmd = os.path.join(poppler_dir, 'pdftotext.exe' if sys.platform == "win32" else 'pdftotext')
+    if not os.path.exists(pdftotext_cmd):
+        pdftotext_cmd = 'pdftotext' # Tenta o que estiver no PATH
+    try:
+        result = subprocess.run([pdftotext_cmd, '-enc', 'UTF-8', '-l', str(num_pages), pdf_path, '-'],
+                                capture_output=True, timeout=60, creationflags=SUBPROCESS_FLAGS)
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.debug(f"pdftotext indisponível para {os.path.basename(pdf_path)}: {e}")
+        return None
+    if result.returncode != 0:
+        logger.debug(f"pdftotext falhou para {os.path.basename(pdf_path)}: {result.stderr.decode('utf-8', 'replace').strip()}")
+        return None
+    # O pdftotext separa as páginas com form feed
+    pages = result.stdout.decode('utf-8', 'replace').split('\f')
+    return pages[:num_pages]
+
+def text_layer_is_usable(text):
+    """
+    Verifica se o texto da camada embutida tem o mínimo que o `extract_info` precisa:
+    um CNPJ e, para guias, o número e o valor; para boletos, uma linha de 47/48 dígitos.
+    Páginas reprovadas seguem para o OCR. Usa as mesmas regras (padrões compilados) do `extract_info`,
+    sem o filtro de CNPJs e sem conferir os dígitos verificadores.
+    """
+    if not text:
+        return False
+    info = _extract_info(text, frozenset())
+    if info['cnpj'] == 'N/A':
+        return False
+    if info['tipo'] == 'guia_custas':
+        return bool(info['numero_guia'] and info['valor'])
+    return bool(info['linhas_digitaveis'])
+
+def ocr_cache_config(config):
+    """Configuração do Tesseract usada na chave do cache; inclui os layouts (OCR por região) e a escada de tentativas."""
+    cache_config = config.tesseract_config
+    if config.roi_ocr:
+        layouts_hash = hashlib.sha256(json.dumps(config.layout_templates, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        cache_config += f"|roi:{layouts_hash}"
+    if resolve_ocr_engine(config.ocr_engine) == 'tesserocr': # A biblioteca pode ser de outra versão que o tesseract.exe
+        cache_config += "|motor:tesserocr"
+    if config.preprocess:
+        cache_config += "|pre:" + ",".join(name for name in PREPROCESS_FILTERS if name in config.preprocess)
+    if config.retry_ladder:
+        ladder_hash = hashlib.sha256(json.dumps(list(config.retry_ladder), sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        cache_config += f"|escada:{ladder_hash}"
+    return cache_config
+
+def roi_text_is_usable(text, doc_type, ignored_cnpjs):
+    """Verifica se o texto das faixas de um layout trouxe todos os dados do tipo de documento esperado."""
+    info = extract_info(text, ignored_cnpjs)
+    if info['tipo'] != doc_type or info['cnpj'] == 'N/A':
+        return False
+    if doc_type == 'guia_custas':
+        return bool(info['numero_guia'] and info['valor'])
+    return bool(info['linhas_digitaveis'])
+
+# Muda para False na primeira vez que o Tesseract instalado recusar imagens via stdin
+tesseract_stdin_supported = True
+
+def tesseract_image_to_string(image, spill_dir, lang=TESSERACT_LANG, tesseract_config=TESSERACT_CONFIG):
+    """
+    Reconhece o texto de uma imagem PIL chamando o Tesseract diretamente.
+    A imagem é codificada sem compressão (PNM) na memória e enviada pelo stdin, sem passar por
+    JPEG nem por arquivos temporários. Se o Tesseract não aceitar stdin, grava um único PNM sem
+    perdas em `spill_dir` e passa o caminho do arquivo.
+    """
+    global tesseract_stdin_supported
+    if image.mode not in ('1', 'L', 'RGB'):
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, format='PPM') # O PIL grava PBM/PGM/PPM conforme o modo da imagem
+    options = ['-l', lang] + shlex.split(tesseract_config, posix=sys.platform != "win32")
+
+    if tesseract_stdin_supported:
+        result = subprocess.run([tesseract_cmd, 'stdin', 'stdout'] + options, input=buffer.getvalue(),
+                                capture_output=True, creationflags=SUBPROCESS_FLAGS)
+        if result.returncode == 0:
+            return result.stdout.decode('utf-8', 'replace')
+        tesseract_stdin_supported = False
+        logger.warning(f"Tesseract não aceitou a imagem via stdin, usando arquivo temporário: {result.stderr.decode('utf-8', 'replace').strip()}")
+
+    fd, spill_path = tempfile.mkstemp(suffix='.pnm', dir=spill_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(buffer.getvalue())
+        result = subprocess.run([tesseract_cmd, spill_path, 'stdout'] + options,
+                                capture_output=True, creationflags=SUBPROCESS_FLAGS)
+    finally:
+        os.remove(spill_path)
+    if result.returncode != 0:
+        from pytesseract import TesseractError # Só no caminho de erro
+        raise TesseractError(result.returncode, result.stderr.decode('utf-8', 'replace').strip())
+    return result.stdout.decode('utf-8', 'replace')
+
+class UnsupportedTesseractOption(ValueError):
+    """Opção de TESSERACT_CONFIG que o worker residente não sabe aplicar; a imagem vai para o subprocesso."""
+
+class TesserocrPool:
+    """
+    Workers do Tesseract residentes, pela API C (binding tesserocr): cada worker carrega o traineddata uma
+    única vez e é reaproveitado página após página, sem abrir um processo nem reler o modelo a cada imagem.
+    Os workers livres ficam guardados por (idioma, oem, variáveis); cada thread de OCR pega um livre ou
+    cria um novo, então há no máximo um por thread de OCR simultânea. O tesserocr libera o GIL durante o
+    reconhecimento, então threads diferentes reconhecem em paralelo.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.created = 0
+        self.module = None
+        self.available = None # None = ainda não verificado
+        self.tessdata = None
+
+    def is_available(self):
+        with self.lock:
+            if self.available is None:
+                try:
+                    import tesserocr
+                    self.module = tesserocr
+                    tessdata = os.path.join(os.path.dirname(tesseract_cmd), 'tessdata')
+                    self.tessdata = tessdata if os.path.isdir(tessdata) else None
+                    self.available = True
+                    logger.info("Motor de OCR: tesserocr (workers residentes do Tesseract).")
+                except Exception as e:
+                    self.available = False
+                    logger.info(f"tesserocr indisponível ({e}); OCR por subprocesso do Tesseract.")
+            return self.available
+
+    def disable(self, reason):
+        with self.lock:
+            self.available = False
+        logger.warning(f"Workers residentes do Tesseract desativados, usando subprocesso: {reason}")
+
+    @staticmethod
+    def parse_config(tesseract_config):
+        """Converte as opções de linha de comando do Tesseract em (oem, psm, variáveis)."""
+        args = shlex.split(tesseract_config, posix=sys.platform != "win32")
+        oem = psm = None
+        variables = []
+        idx = 0
+        while idx < len(args):
+            arg = args[idx]
+            if arg in ('--oem', '--psm', '-c') and idx + 1 < len(args):
+                value = args[idx + 1]
+                idx += 2
+            elif arg.startswith(('--oem=', '--psm=')):
+                arg, value = arg.split('=', 1)
+                idx += 1
+            else:
+                raise UnsupportedTesseractOption(arg)
+            if arg == '-c':
+                name, sep, var_value = value.partition('=')
+                if not sep:
+                    raise UnsupportedTesseractOption(value)
+                variables.append((name, var_value))
+            elif arg == '--oem':
+                oem = int(value)
+            else:
+                psm = int(value)
+        return oem, psm, tuple(variables)
+
+    def image_to_string(self, image, lang, tesseract_config):
+        oem, psm, variables = self.parse_config(tesseract_config)
+        tesserocr = self.module
+        key = (lang, oem, variables)
+        with self.lock:
+            api = self.idle.get(key, []).pop() if self.idle.get(key) else None
+        if api is None:
+            api = tesserocr.PyTessBaseAPI(path=self.tessdata, lang=lang, init=True,
+                                          oem=tesserocr.OEM(oem) if oem is not None else tesserocr.OEM.DEFAULT)
+            for name, value in variables:
+                api.SetVariable(name, value)
+            with self.lock:
+                self.created += 1
+            logger.debug(f"Worker do Tesseract criado ({lang}, total {self.created}).")
+        try:
+            api.SetPageSegMode(tesserocr.PSM(psm) if psm is not None else tesserocr.PSM.AUTO) # Mesmo padrão do tesseract.exe
+            api.SetImage(image)
+            text = api.GetUTF8Text()
+            api.Clear()
+        except Exception:
+            api.End()
+            raise
+        with self.lock:
+            self.idle.setdefault(key, []).append(api)
+        return text
+
+    def close(self):
+        with self.lock:
+            apis = [api for apis in self.idle.values() for api in apis]
+            self.idle = {}
+        for api in apis:
+            api.End()
+
+tesserocr_pool = TesserocrPool()
+atexit.register(tesserocr_pool.close)
+
+def resolve_ocr_engine(engine):
+    """Motor efetivo ('tesserocr' ou 'subprocesso') para o valor configurado."""
+    if engine == 'subprocesso':
+        return 'subprocesso'
+    if tesserocr_pool.is_available():
+        return 'tesserocr'
+    if engine == 'tesserocr':
+        logger.warning("Motor de OCR 'tesserocr' pedido, mas o tesserocr não está disponível; usando subprocesso.")
+    return 'subprocesso'
+
+def image_to_string(image, spill_dir, config):
+    """Reconhece uma imagem com o motor configurado: worker residente (tesserocr) ou subprocesso do Tesseract."""
+    if config.ocr_engine != 'subprocesso' and resolve_ocr_engine(config.ocr_engine) == 'tesserocr':
+        try:
+            return tesserocr_pool.image_to_string(image, config.tesseract_lang, config.tesseract_config)
+        except UnsupportedTesseractOption as e:
+            logger.debug(f"Opção '{e}' não suportada pelo worker residente; usando subprocesso.")
+        except RuntimeError as e: # Falha ao iniciar o worker (ex.: traineddata ausente)
+            tesserocr_pool.disable(e)
+    return tesseract_image_to_string(image, spill_dir, config.tesseract_lang, config.tesseract_config)
+
+def recognize_page(image, spill_dir, config):
+    """
+    Reconhece o texto de uma página renderizada.
+    Com o OCR por região ativo, cada layout em `config.layout_templates` é testado recortando só as
+    suas faixas; o primeiro que trouxer todos os dados é usado. Se nenhum layout servir, a página
+    inteira passa pelo Tesseract.
+    """
+    if config.roi_ocr and config.layout_templates:
+        width, height = image.size
+        band_texts = {} # Faixas repetidas entre layouts são reconhecidas uma única vez
+        for doc_type, bands in config.layout_templates.items():
+            for band in bands:
+                band_key = tuple(band)
+                if band_key not in band_texts:
+                    left, top, right, bottom = band
+                    crop = image.crop((int(left * width), int(top * height), int(right * width), int(bottom * height)))
+                    band_texts[band_key] = image_to_string(crop, spill_dir, config)
+            roi_text = "\n".join(band_texts[tuple(band)] for band in bands)
+            if roi_text_is_usable(roi_text, doc_type, config.ignored_cnpjs):
+                return roi_text
+        logger.debug("Nenhum layout de região encontrou os dados; usando OCR da página inteira.")
+    return image_to_string(image, spill_dir, config)
+
+class OCRStats:
+    """Tempos da pré-classificação e do OCR completo e degraus da escada usados em um lote, somados entre as threads de OCR."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thumbnails = 0
+        self.thumbnail_seconds = 0.0
+        self.skipped = 0
+        self.full_pages = 0
+        self.full_seconds = 0.0
+        self.ladder_steps = {} # Degrau em que a página foi validada (0 = DPI base, None = nenhum) -> páginas
+        self.filters = {} # Filtro de pré-processamento -> [páginas, segundos, páginas alteradas, alteradas e validadas]
+
+    def add_ladder_result(self, step):
+        with self.lock:
+            self.ladder_steps[step] = self.ladder_steps.get(step, 0) + 1
+
+    def add_preprocess(self, applied, validated):
+        """`applied` vem de preprocess_image; `validated` diz se o texto final da página passou na validação."""
+        with self.lock:
+            for name, (seconds, changed) in applied.items():
+                entry = self.filters.setdefault(name, [0, 0, 0, 0])
+                entry[0] += 1
+                entry[1] += seconds
+                entry[2] += int(changed)
+                entry[3] += int(changed and validated)
+
+    def preprocess_summary(self):
+        """Custo por página de cada filtro e quantas páginas ele alterou (e destas, quantas tiveram os dados validados)."""
+        with self.lock:
+            return {name: {'paginas': pages, 'ms_por_pagina': round(seconds / pages * 1000, 2), 'alteradas': changed,
+                           'alteradas_validadas': validated}
+                    for name, (pages, seconds, changed, validated) in self.filters.items()}
+
+    def add_thumbnail(self, seconds, skipped):
+        with self.lock:
+            self.thumbnails += 1
+            self.thumbnail_seconds += seconds
+            self.skipped += int(skipped)
+
+    def add_full_page(self, seconds):
+        with self.lock:
+            self.full_pages += 1
+            self.full_seconds += seconds
+
+    def saved_seconds(self):
+        """Estimativa do tempo de OCR economizado: páginas ignoradas x tempo médio do OCR completo, menos o custo das miniaturas."""
+        with self.lock:
+            if not self.full_pages:
+                return 0.0
+            return self.skipped * (self.full_seconds / self.full_pages) - self.thumbnail_seconds
+
+class PerformanceReport:
+    """
+    Tempo gasto em cada etapa do lote (Poppler, Tesseract, regex de extração, gravação da planilha...),
+    por arquivo e por página, somado entre as threads de OCR. As etapas de arquivos diferentes rodam em
+    paralelo, então a soma das etapas passa do tempo total do lote quando há mais de um PDF simultâneo.
+    """
+    STAGE_LABELS = {
+        'leitura_pdf': 'Leitura do PDF (pdfinfo)',
+        'camada_texto': 'Camada de texto (pdftotext)',
+        'cache': 'Cache de OCR',
+        'renderizacao': 'Renderização (Poppler)',
+        'pre_classificacao': 'Pré-classificação',
+        'pre_processamento': 'Pré-processamento da imagem',
+        'ocr': 'OCR (Tesseract e novas tentativas)',
+        'extracao': 'Extração (regex)',
+        'abertura_planilha': 'Abertura da planilha',
+        'gravacao_planilha': 'Formatação e gravação da planilha',
+        'csv': 'CSV',
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.files = {} # Nome do PDF -> {'paginas': n, 'etapas': {etapa: s}, 'por_pagina': {página: {etapa: s}}}
+        self.batch_stages = {} # Etapas do lote inteiro (planilha, CSV)
+
+    def add(self, stage, seconds, file_name=None, page_number=None):
+        perf_logger.info(f"{stage}: {seconds:.3f}s",
+                         extra={'arquivo': file_name, 'pagina': page_number, 'etapa': stage, 'segundos': round(seconds, 4)})
+        with self.lock:
+            if file_name is None:
+                self.batch_stages[stage] = self.batch_stages.get(stage, 0.0) + seconds
+                return
+            entry = self.files.setdefault(file_name, {'paginas': 0, 'etapas': {}, 'por_pagina': {}})
+            entry['etapas'][stage] = entry['etapas'].get(stage, 0.0) + seconds
+            if page_number is not None:
+                page = entry['por_pagina'].setdefault(page_number, {})
+                page[stage] = page.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def measure(self, stage, file_name=None, page_number=None):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started, file_name, page_number)
+
+    def page_seconds(self, file_name, page_number, stage):
+        with self.lock:
+            return self.files.get(file_name, {}).get('por_pagina', {}).get(page_number, {}).get(stage, 0.0)
+
+    def set_pages(self, file_name, num_pages):
+        with self.lock:
+            self.files.setdefault(file_name, {'paginas': 0, 'etapas': {}, 'por_pagina': {}})['paginas'] = num_pages
+
+    def stage_totals(self):
+        """Segundos por etapa somando arquivos e lote, na ordem de STAGE_LABELS."""
+        with self.lock:
+            totals = dict(self.batch_stages)
+            for entry in self.files.values():
+                for stage, seconds in entry['etapas'].items():
+                    totals[stage] = totals.get(stage, 0.0) + seconds
+        return {stage: totals[stage] for stage in sorted(totals, key=lambda s: list(self.STAGE_LABELS).index(s) if s in self.STAGE_LABELS else len(self.STAGE_LABELS))}
+
+    def summary(self, slowest=3):
+        """Linhas curtas para o log e os popups: tempo total, páginas/s, etapas mais caras e PDFs mais lentos."""
+        elapsed = time.perf_counter() - self.started
+        totals = self.stage_totals()
+        with self.lock:
+            num_pages = sum(entry['paginas'] for entry in self.files.values())
+            file_totals = sorted(((sum(entry['etapas'].values()), name) for name, entry in self.files.items()), reverse=True)
+        lines = [f"Tempo total: {elapsed:.1f}s para {num_pages} páginas ({num_pages / elapsed if elapsed else 0:.2f} páginas/s)."]
+        stages_seconds = sum(totals.values())
+        if stages_seconds:
+            top_stages = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:3]
+            lines.append("Etapas mais demoradas: " + ", ".join(
+                f"{self.STAGE_LABELS.get(stage, stage)} {seconds:.1f}s ({seconds / stages_seconds:.0%})" for stage, seconds in top_stages) + ".")
+        if len(file_totals) > 1:
+            lines.append("PDFs mais lentos: " + ", ".join(f"{name} ({seconds:.1f}s)" for seconds, name in file_totals[:slowest]) + ".")
+        return lines
+
+    def save(self, result_file, config, ocr_stats=None):
+        """Grava <planilha>.desempenho.json (completo) e <planilha>.desempenho.csv (arquivo;página;etapa;segundos)."""
+        base = os.path.splitext(result_file)[0] + '.desempenho'
+        elapsed = time.perf_counter() - self.started
+        with self.lock:
+            files = {name: {'paginas': entry['paginas'], 'etapas': dict(entry['etapas']),
+                            'por_pagina': {page: dict(stages) for page, stages in sorted(entry['por_pagina'].items())}}
+                     for name, entry in self.files.items()}
+            batch_stages = dict(self.batch_stages)
+        rounded = lambda stages: {stage: round(seconds, 4) for stage, seconds in stages.items()}
+        num_pages = sum(entry['paginas'] for entry in files.values())
+        report = {
+            'gerado_em': datetime.now().isoformat(timespec='seconds'),
+            'planilha': result_file,
+            'tempo_total_s': round(elapsed, 3),
+            'paginas': num_pages,
+            'paginas_por_segundo': round(num_pages / elapsed, 3) if elapsed else 0,
+            'configuracao': {'dpi': config.dpi, 'ocr_workers': config.ocr_workers, 'roi_ocr': config.roi_ocr,
+                             'use_text_layer': config.use_text_layer, 'preclassify': config.preclassify,
+                             'retry_ladder': list(config.retry_ladder), 'preprocess': list(config.preprocess),
+                             'tesseract_config': config.tesseract_config},
+            'etapas': {stage: round(seconds, 4) for stage, seconds in self.stage_totals().items()},
+            'etapas_lote': rounded(batch_stages),
+            'pre_processamento': ocr_stats.preprocess_summary() if ocr_stats else {},
+            'arquivos': [{'arquivo': name, 'paginas': entry['paginas'], 'total_s': round(sum(entry['etapas'].values()), 4),
+                          'etapas': rounded(entry['etapas']),
+                          'por_pagina': [{'pagina': page, 'etapas': rounded(stages)} for page, stages in entry['por_pagina'].items()]}
+                         for name, entry in files.items()],
+        }
+        with open(base + '.json', 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        with open(base + '.csv', 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f, delimiter=';')
+            writer.writerow(['Arquivo', 'Página', 'Etapa', 'Segundos'])
+            seconds_text = lambda seconds: f"{seconds:.4f}".replace('.', ',') # Vírgula decimal, como o Excel em português espera
+            for stage, seconds in batch_stages.items():
+                writer.writerow(['', '', stage, seconds_text(seconds)])
+            for name, entry in files.items():
+                page_stages = {}
+                for page, stages in entry['por_pagina'].items():
+                    for stage, seconds in stages.items():
+                        writer.writerow([name, page, stage, seconds_text(seconds)])
+                        page_stages[stage] = page_stages.get(stage, 0.0) + seconds
+                for stage, seconds in entry['etapas'].items(): # Etapas do arquivo inteiro (sem página)
+                    if stage not in page_stages or seconds - page_stages[stage] > 1e-9:
+                        writer.writerow([name, '', stage, seconds_text(seconds - page_stages.get(stage, 0.0))])
+        return base + '.json', base + '.csv'
+
+def page_may_have_document(image, spill_dir, config):
+    """Pré-classificação barata: OCR de uma miniatura em tons de cinza procurando palavras típicas de boleto/guia."""
+    thumbnail = image.convert('L')
+    reduce_factor = round(config.dpi / PRECLASSIFY_DPI)
+    if reduce_factor > 1:
+        reduced = thumbnail.reduce(reduce_factor)
+        thumbnail.close()
+        thumbnail = reduced
+    try:
+        text = image_to_string(thumbnail, spill_dir, config)
+    finally:
+        thumbnail.close()
+    return bool(PRECLASSIFY_ANCHORS.search(text))
+
+def extraction_score(text, ignored_cnpjs):
+    """Validação do texto de uma página: 2 se trouxe CNPJ e linha digitável (ou guia completa), 1 se só um deles, 0 se nada."""
+    info = extract_info(text, ignored_cnpjs)
+    if info['tipo'] == 'guia_custas':
+        has_document = bool(info['numero_guia'] and info['valor'])
+    else:
+        has_document = len(info['linhas_digitaveis']) > len(info['linhas_invalidas']) # Ao menos uma linha com DVs corretos
+    return int(info['cnpj'] != 'N/A') + int(has_document)
+
+def binarize_image(image):
+    """Converte para preto e branco com limiar fixo (remove fundos coloridos e marcas d'água claras)."""
+    return image.convert('L').point(lambda value: 255 if value > BINARIZE_THRESHOLD else 0)
+
+def _dark_border_size(profile, max_size):
+    """Quantas posições seguidas, a partir do início do perfil, são moldura (maioria de pixels escuros)."""
+    size = 0
+    while size < max_size and profile[size] > BORDER_DARK_FRACTION:
+        size += 1
+    return size
+
+def whiten_dark_border(gray, dpi):
+    """
+    Pinta com a cor do fundo (a mediana da página) a moldura escura das bordas: tampa do scanner, sombra
+    da encadernação. A página não é cortada, então as faixas do OCR por região continuam nas mesmas posições.
+    """
+    from PIL import Image
+    width, height = gray.size
+    dark = gray.point(lambda value: 255 if value < DARK_PIXEL_THRESHOLD else 0)
+    # Fração de pixels escuros por linha e por coluna: redimensionar para 1 pixel de largura/altura tira a média
+    rows = [value / 255 for value in dark.resize((1, height), Image.BOX).getdata()]
+    cols = [value / 255 for value in dark.resize((width, 1), Image.BOX).getdata()]
+    dark.close()
+    top = _dark_border_size(rows, int(height * BORDER_MAX_FRACTION))
+    bottom = _dark_border_size(rows[::-1], int(height * BORDER_MAX_FRACTION))
+    left = _dark_border_size(cols, int(width * BORDER_MAX_FRACTION))
+    right = _dark_border_size(cols[::-1], int(width * BORDER_MAX_FRACTION))
+    if not (top or bottom or left or right):
+        return gray
+    histogram = gray.histogram()
+    background, count = 0, histogram[0]
+    while count < width * height / 2:
+        background += 1
+        count += histogram[background]
+    gray = gray.copy()
+    for box in ((0, 0, width, top), (0, height - bottom, width, height), (0, 0, left, height), (width - right, 0, width, height)):
+        if box[2] > box[0] and box[3] > box[1]:
+            gray.paste(background, box)
+    return gray
+
+def estimate_skew(gray, np):
+    """
+    Inclinação do texto em graus (positiva = linhas descendo para a direita), pelo perfil de projeção:
+    para cada ângulo candidato, os pixels escuros são projetados nas linhas da página girada e o ângulo
+    com o perfil mais concentrado (texto alinhado em poucas linhas) vence. Todos os ângulos são avaliados
+    de uma vez, com um único bincount sobre a matriz ângulos x pixels.
+    """
+    reduce_factor = max(1, gray.width // 800) # A estimativa não precisa da resolução toda
+    small = gray.reduce(reduce_factor) if reduce_factor > 1 else gray
+    ys, xs = np.nonzero(np.asarray(small) < DARK_PIXEL_THRESHOLD)
+    if small is not gray:
+        small.close()
+    if len(ys) < 100: # Página praticamente em branco
+        return 0.0
+    if len(ys) > DESKEW_SAMPLE_PIXELS:
+        sample = np.linspace(0, len(ys) - 1, DESKEW_SAMPLE_PIXELS).astype(np.int64)
+        ys, xs = ys[sample], xs[sample]
+    angles = np.arange(-DESKEW_MAX_ANGLE, DESKEW_MAX_ANGLE + DESKEW_STEP / 2, DESKEW_STEP)
+    # Linha de cada pixel depois de desfazer cada inclinação candidata (para ângulos pequenos, um cisalhamento)
+    rows = np.rint(ys[None, :] - xs[None, :] * np.tan(np.radians(angles))[:, None]).astype(np.int64)
+    rows -= rows.min()
+    num_rows = int(rows.max()) + 1
+    rows += np.arange(len(angles))[:, None] * num_rows # Cada ângulo conta num trecho próprio do bincount
+    profiles = np.bincount(rows.ravel(), minlength=len(angles) * num_rows).reshape(len(angles), num_rows)
+    scores = (np.diff(profiles, axis=1).astype(np.float64) ** 2).sum(axis=1)
+    return float(angles[int(np.argmax(scores))])
+
+def deskew(gray, dpi):
+    """Gira a página para alinhar o texto (sem mudar o tamanho; os cantos descobertos ficam brancos)."""
+    np = _numpy()
+    if np is None:
+        return gray
+    angle = estimate_skew(gray, np)
+    if abs(angle) < DESKEW_MIN_ANGLE:
+        return gray
+    from PIL import Image
+    return gray.rotate(angle, resample=Image.BILINEAR, fillcolor=255)
+
+def adaptive_threshold(gray, dpi):
+    """Preto onde o pixel é mais escuro que a média da vizinhança; remove fundos cinza e sombras irregulares."""
+    from PIL import ImageChops, ImageFilter
+    local_mean = gray.filter(ImageFilter.BoxBlur(max(1, round(ADAPTIVE_THRESHOLD_WINDOW * dpi))))
+    darker = ImageChops.subtract(local_mean, gray) # Quanto cada pixel é mais escuro que a vizinhança (0 se mais claro)
+    local_mean.close()
+    binary = darker.point(lambda value: 0 if value > ADAPTIVE_THRESHOLD_OFFSET else 255)
+    darker.close()
+    return binary
+
+PREPROCESS_FUNCTIONS = {'bordas': whiten_dark_border, 'alinhamento': deskew, 'limiar': adaptive_threshold}
+
+def preprocess_image(image, filters, dpi):
+    """
+    Aplica os filtros de `filters` na ordem de PREPROCESS_FILTERS. Todos trabalham em tons de cinza, então a
+    página sempre é convertida (o filtro 'cinza' sozinho faz só isso). Retorna a imagem resultante (a original,
+    se nenhum filtro a alterou) e {filtro: (segundos, alterou a página)} para o OCRStats.
+    """
+    applied = {}
+    started = time.perf_counter()
+    result = image if image.mode == 'L' else image.convert('L')
+    if 'cinza' in filters:
+        applied['cinza'] = (time.perf_counter() - started, result is not image)
+    for name in PREPROCESS_FILTERS:
+        if name not in filters or name not in PREPROCESS_FUNCTIONS:
+            continue
+        started = time.perf_counter()
+        filtered = PREPROCESS_FUNCTIONS[name](result, dpi)
+        if filtered is not result and result is not image:
+            result.close()
+        applied[name] = (time.perf_counter() - started, filtered is not result)
+        result = filtered
+    return result, applied
+
+def recognize_page_adaptive(pdf_path, page_number, image, spill_dir, config, ocr_stats=None):
+    """
+    Reconhece a página no DPI base e sobe a escada `config.retry_ladder` (DPI maior, binarização,
+    outro PSM) só enquanto o texto não passar na validação de `extraction_score`. Retorna o melhor
+    texto obtido. As renderizações extras ocupam a mesma vaga de `page_image_budget` da imagem base
+    (só os bytes são contabilizados), então a escada nunca espera por vagas presas na fila.
+    """
+    best_text = recognize_page(image, spill_dir, config)
+    best_score = extraction_score(best_text, config.ignored_cnpjs)
+    validated_step = 0 if best_score == 2 else None
+    rendered_dpi, rendered_image, rendered_bytes = config.dpi, image, 0
+    try:
+        for step_idx, step in enumerate(config.retry_ladder, start=1):
+            if validated_step is not None:
+                break
+            if step['dpi'] != rendered_dpi: # Renderiza de novo só quando o DPI do degrau muda
+                if rendered_image is not image:
+                    rendered_image.close()
+                    page_image_budget.add_bytes(-rendered_bytes)
+                rendered_image, rendered_bytes = image, 0
+                images = convert_from_path(pdf_path, dpi=step['dpi'], poppler_path=config.poppler_path,
+                                           first_page=page_number, last_page=page_number, fmt='ppm',
+                                           grayscale=bool(config.preprocess))
+                if not images:
+                    break
+                rendered_dpi, rendered_image = step['dpi'], images[0]
+                if config.preprocess: # Mesmo pré-processamento da imagem base, na resolução do degrau
+                    rendered_image, _ = preprocess_image(images[0], config.preprocess, step['dpi'])
+                    if rendered_image is not images[0]:
+                        images[0].close()
+                rendered_bytes = image_nbytes(rendered_image)
+                page_image_budget.add_bytes(rendered_bytes)
+            step_image = binarize_image(rendered_image) if step['binarize'] else rendered_image
+            step_config = config.tesseract_config + (f" --psm {step['psm']}" if step['psm'] else "")
+            try:
+                text = recognize_page(step_image, spill_dir, replace(config, dpi=step['dpi'], tesseract_config=step_config.strip()))
+            finally:
+                if step_image is not rendered_image:
+                    step_image.close()
+            score = extraction_score(text, config.ignored_cnpjs)
+            if score > best_score:
+                best_text, best_score = text, score
+            if score == 2:
+                validated_step = step_idx
+                logger.info(f"{os.path.basename(pdf_path)}, página {page_number}: dados validados na tentativa {step_idx + 1} "
+                            f"({step['dpi']} DPI{', binarizada' if step['binarize'] else ''}{', PSM ' + str(step['psm']) if step['psm'] else ''}).")
+    finally:
+        if rendered_image is not image:
+            rendered_image.close()
+            page_image_budget.add_bytes(-rendered_bytes)
+    if ocr_stats:
+        ocr_stats.add_ladder_result(validated_step)
+    return best_text
+
+def render_pages(pdf_path, page_numbers, page_queue, stop_event, config, cancel_token, report):
+    """
+    Produtor do pipeline de OCR: renderiza as páginas `page_numbers` do PDF uma a uma (first_page/last_page)
+    e as coloca na fila limitada `page_queue` como tuplas (número da página, imagem, bytes da imagem).
+    As páginas são renderizadas direto para a memória (PPM sem compressão), sem passar pelo disco,
+    e cada uma ocupa uma vaga de `page_image_budget` até o consumidor liberá-la.
+    Erros são repassados pela própria fila e um None sempre sinaliza o fim da renderização.
+    """
+    try:
+        for page_number in page_numbers:
+            if cancel_token.cancelled or stop_event.is_set(): # Lote cancelado ou erro no consumidor
+                break
+            if not page_image_budget.acquire(cancel_token):
+                break
+            try:
+                with report.measure('renderizacao', os.path.basename(pdf_path), page_number):
+                    images = convert_from_path(pdf_path, dpi=config.dpi, poppler_path=config.poppler_path, first_page=page_number, last_page=page_number,
+                                               fmt='ppm', grayscale=bool(config.preprocess)) # O Poppler já entrega em tons de cinza
+            except Exception:
+                page_image_budget.release()
+                raise
+            if not images:
+                page_image_budget.release()
+                continue
+            image = images[0] # first_page == last_page: sempre uma única imagem
+            image_bytes = image_nbytes(image)
+            page_image_budget.add_bytes(image_bytes)
+            page_queue.put((page_number, image, image_bytes)) # Bloqueia enquanto a fila estiver cheia
+    except Exception as e:
+        page_queue.put(e)
+    finally:
+        page_queue.put(None)
+
+def ocr_pdf(pdf_path, temp_dir, config=None, cancel_token=None, ocr_stats=None, report=None):
+    """
+    Realiza OCR em cada página do PDF e retorna uma lista de textos, um para cada página.
+    Também retorna o número total de páginas e a origem do texto de cada página
+    (camada de texto, cache ou OCR).
+
+    Páginas geradas digitalmente com uma camada de texto válida dispensam o OCR. Páginas já
+    reconhecidas em execuções anteriores (mesmo conteúdo, DPI e configuração do Tesseract)
+    vêm do cache. As demais passam por um pipeline: enquanto a página N passa pelo
+    Tesseract, a página N+1 já está sendo renderizada em outra thread. As imagens trafegam
+    apenas em memória; `temp_dir` só recebe arquivos se o Tesseract não aceitar stdin.
+    Cada imagem é liberada logo após o OCR e o total de imagens vivas é limitado por
+    `page_image_budget`, então PDFs longos não acumulam páginas na memória.
+
+    Em PDFs com mais de uma página, cada página passa antes pela pré-classificação
+    (`page_may_have_document`); as que não parecem boleto/guia ficam com texto vazio e não vão para
+    o cache. As demais passam pelos filtros de `config.preprocess` (`preprocess_image`) e por
+    `recognize_page_adaptive`, que só sobe o DPI/muda o pré-processamento quando a extração falha. Tempos e degraus usados são somados em `ocr_stats`, se informado, e o
+    tempo de cada etapa (por página) em `report` (PerformanceReport).
+
+    `config` (BatchConfig) define os parâmetros do OCR e `cancel_token` permite interromper o PDF
+    entre páginas; sem eles, valem a configuração global e um lote que nunca é cancelado.
+    """
+    config = config or BatchConfig()
+    cancel_token = cancel_token or CancellationToken()
+    report = report or PerformanceReport()
+    file_name = os.path.basename(pdf_path)
+    if cancel_token.cancelled: # PDF ainda na fila quando o lote foi cancelado
+        return [], 0, []
+    try:
+        with report.measure('leitura_pdf', file_name):
+            num_pages_in_pdf = pdfinfo_from_path(pdf_path, poppler_path=config.poppler_path)["Pages"]
+
+        texts_by_page = {}
+        sources_by_page = {}
+        text_layer_pages = None
+        if config.use_text_layer:
+            with report.measure('camada_texto', file_name):
+                text_layer_pages = extract_text_layer(pdf_path, num_pages_in_pdf, config.poppler_path)
+        text_layer_pages = text_layer_pages or []
+        for page_number, page_text in enumerate(text_layer_pages, start=1):
+            if text_layer_is_usable(page_text):
+                texts_by_page[page_number] = page_text
+                sources_by_page[page_number] = PAGE_SOURCE_TEXT_LAYER
+
+        pdf_hash = None
+        cache_config = ocr_cache_config(config)
+        ocr_cache = get_ocr_cache()
+        if ocr_cache and len(texts_by_page) < num_pages_in_pdf:
+            try:
+                with report.measure('cache', file_name):
+                    pdf_hash = file_sha256(pdf_path)
+                    cached_pages = ocr_cache.get_pages(pdf_hash, config.dpi, config.tesseract_lang, cache_config)
+                for page_number, page_text in cached_pages.items():
+                    if page_number not in texts_by_page:
+                        texts_by_page[page_number] = page_text
+                        sources_by_page[page_number] = PAGE_SOURCE_CACHE
+            except Exception as e:
+                logger.warning(f"Cache de OCR indisponível para {os.path.basename(pdf_path)}: {e}")
+                pdf_hash = None
+        pages_to_ocr = [page_number for page_number in range(1, num_pages_in_pdf + 1) if page_number not in texts_by_page]
+        if len(pages_to_ocr) < num_pages_in_pdf:
+            logger.info(f"{os.path.basename(pdf_path)}: {num_pages_in_pdf - len(pages_to_ocr)} de {num_pages_in_pdf} páginas dispensaram o OCR (camada de texto ou cache).")
+
+        render_error = None
+        ocr_error = None
+        cancelled = False
+        if pages_to_ocr:
+            page_queue = queue.Queue(maxsize=PAGE_QUEUE_SIZE)
+            stop_event = threading.Event()
+            renderer = Thread(target=render_pages, args=(pdf_path, pages_to_ocr, page_queue, stop_event, config, cancel_token, report), daemon=True)
+            renderer.start()
+
+            # Consome a fila até o sinal de fim, mesmo após cancelamento ou erro, para nunca deixar o
+            # produtor bloqueado nem vagas de imagem presas
+            while (item := page_queue.get()) is not None:
+                if isinstance(item, Exception):
+                    render_error = item
+                    continue
+                page_number, image, image_bytes = item
+                try:
+                    if cancelled or render_error or ocr_error:
+                        continue
+                    if cancel_token.cancelled: # Checa o cancelamento do lote
+                        logger.info(f"Processamento OCR de {os.path.basename(pdf_path)} cancelado na página {page_number}.")
+                        cancelled = True
+                        stop_event.set()
+                        continue
+                    try:
+                        if config.preclassify and num_pages_in_pdf > 1:
+                            started = time.perf_counter()
+                            relevant = page_may_have_document(image, temp_dir, config)
+                            elapsed = time.perf_counter() - started
+                            report.add('pre_classificacao', elapsed, file_name, page_number)
+                            if ocr_stats:
+                                ocr_stats.add_thumbnail(elapsed, not relevant)
+                            if not relevant:
+                                logger.info(f"{os.path.basename(pdf_path)}, página {page_number}: sem indícios de boleto/guia na miniatura; OCR completo dispensado.")
+                                texts_by_page[page_number] = ""
+                                sources_by_page[page_number] = PAGE_SOURCE_SKIPPED
+                                continue
+                        page_image, applied = image, {}
+                        if config.preprocess:
+                            with report.measure('pre_processamento', file_name, page_number):
+                                page_image, applied = preprocess_image(image, config.preprocess, config.dpi)
+                        try:
+                            started = time.perf_counter()
+                            page_text = recognize_page_adaptive(pdf_path, page_number, page_image, temp_dir, config, ocr_stats)
+                            elapsed = time.perf_counter() - started
+                        finally:
+                            if page_image is not image:
+                                page_image.close()
+                        report.add('ocr', elapsed, file_name, page_number)
+                        if ocr_stats:
+                            ocr_stats.add_full_page(elapsed)
+                            if applied:
+                                ocr_stats.add_preprocess(applied, extraction_score(page_text, config.ignored_cnpjs) == 2)
+                    except Exception as e:
+                        ocr_error = e
+                        stop_event.set()
+                        continue
+                    texts_by_page[page_number] = page_text
+                    sources_by_page[page_number] = PAGE_SOURCE_OCR
+                    if pdf_hash:
+                        try:
+                            with report.measure('cache', file_name, page_number):
+                                ocr_cache.put_page(pdf_hash, page_number, config.dpi, config.tesseract_lang, cache_config, page_text)
+                        except Exception as e:
+                            logger.warning(f"Não foi possível gravar a página {page_number} de {os.path.basename(pdf_path)} no cache de OCR: {e}")
+                finally:
+                    # Libera a imagem decodificada assim que a página é reconhecida (ou descartada)
+                    image.close()
+                    page_image_budget.release(image_bytes)
+            renderer.join()
+
+            if pdf_hash:
+                try:
+                    ocr_cache.evict()
+                except Exception as e:
+                    logger.warning(f"Erro ao reduzir o cache de OCR: {e}")
+
+        if render_error or ocr_error:
+            raise render_error or ocr_error
+        done_pages = [page_number for page_number in range(1, num_pages_in_pdf + 1) if page_number in texts_by_page]
+        texts_per_page = [texts_by_page[page_number] for page_number in done_pages]
+        page_sources = [sources_by_page[page_number] for page_number in done_pages]
+        return texts_per_page, num_pages_in_pdf, page_sources
+    except Exception as e:
+        logger.exception(f"Erro ao processar OCR do PDF: {pdf_path}")
+        return [], 0, [] # Retorna lista vazia e 0 páginas em caso de erro
+
+# *** Extração dos Dados ***
+# Padrões compilados uma única vez; a extração percorre o texto da página uma só vez (linha a linha)
+CNPJ_PATTERN = re.compile(r'(\d{2}\.\d{3}\.\d{3}\/\d{4}\-\d{2})')
+GUIA_MARKER = "GUIA ÚNICA DE CUSTAS"
+NUMERO_GUIA_PATTERN = re.compile(r"Nº da Guia\s*([\d\.]+/\d+)")
+VALOR_GUIA_PATTERN = re.compile(r"R\$\s*([\d,.]+)")
+AGENCIA_DV_PATTERN = re.compile(r'\d{3}-\d') # Padrões como "123-4" (banco/agência com DV) que confundem a linha digitável
+NON_DIGIT_PATTERN = re.compile(r'[^0-9]')
+ASCII_DIGITS = '0123456789'
+LINHA_DIGITAVEL_MIN_DIGITS = 47 # Boleto bancário (47) ou arrecadação (48)
+LINHA_DIGITAVEL_MAX_DIGITS = 48
+
+# *** Validação das Linhas Digitáveis (FEBRABAN) ***
+# Boleto bancário (47 dígitos): DV módulo 10 em cada um dos três primeiros campos e DV geral módulo 11 do
+# código de barras. Arrecadação/convênios (48 dígitos, começa com 8): DV de cada bloco de 11 dígitos e DV geral,
+# em módulo 10 ou 11 conforme o terceiro dígito. Linhas que não fecham passam por correções de um único dígito
+# com as trocas mais comuns do OCR; a correção só é aceita se exatamente uma variante fechar os DVs.
+VALIDATE_LINHAS_DIGITAVEIS = True
+OCR_DIGIT_CONFUSIONS = {'0': '689', '1': '7', '2': '7', '3': '8', '4': '9',
+                        '5': '68', '6': '058', '7': '12', '8': '03569', '9': '048'}
+_numpy_module = None
+
+def _numpy():
+    """numpy carregado só na primeira validação; None se não estiver instalado (usa a validação em Python puro)."""
+    global _numpy_module
+    if _numpy_module is None:
+        try:
+            import numpy
+            _numpy_module = numpy
+        except ImportError:
+            logger.info("numpy não instalado; validação das linhas digitáveis em Python puro.")
+            _numpy_module = False
+    return _numpy_module or None
+
+def _boleto_barcode_without_dv(linha):
+    """Código de barras (sem o DV geral) de uma linha digitável de boleto: banco/moeda, fator/valor e campo livre."""
+    return linha[0:4] + linha[33:47] + linha[4:9] + linha[10:20] + linha[21:31]
+
+def _arrecadacao_barcode_without_dv(linha):
+    barcode = linha[0:11] + linha[12:23] + linha[24:35] + linha[36:47]
+    return barcode[:3] + barcode[4:]
+
+def _mod10_dv(digits):
+    total = 0
+    for idx, digit in enumerate(reversed(digits)):
+        product = int(digit) * (2 if idx % 2 == 0 else 1)
+        total += product // 10 + product % 10
+    return (10 - total % 10) % 10
+
+def _mod11_remainder(digits):
+    return sum(int(digit) * (2 + idx % 8) for idx, digit in enumerate(reversed(digits))) % 11
+
+def _linha_is_valid(linha):
+    """Validação de uma linha em Python puro (usada quando o numpy não está disponível)."""
+    if len(linha) == 47:
+        fields_ok = all(_mod10_dv(linha[start:end]) == int(linha[end]) for start, end in ((0, 9), (10, 20), (21, 31)))
+        dv = 11 - _mod11_remainder(_boleto_barcode_without_dv(linha))
+        return fields_ok and (1 if dv in (0, 10, 11) else dv) == int(linha[32])
+    if len(linha) != 48 or linha[0] != '8' or linha[2] not in '6789':
+        return False
+    if linha[2] in '67':
+        dv_of = _mod10_dv
+    else:
+        dv_of = lambda digits: 0 if _mod11_remainder(digits) <= 1 else 11 - _mod11_remainder(digits)
+    blocks_ok = all(dv_of(linha[start:start + 11]) == int(linha[start + 11]) for start in (0, 12, 24, 36))
+    return blocks_ok and dv_of(_arrecadacao_barcode_without_dv(linha)) == int(linha[3])
+
+def _linhas_are_valid_numpy(np, linhas):
+    """Valida de uma vez linhas do mesmo tamanho (47 ou 48), com a aritmética dos DVs em matrizes de dígitos."""
+    digits = np.frombuffer(''.join(linhas).encode('ascii'), dtype=np.uint8).reshape(len(linhas), -1).astype(np.int32) - 48
+
+    def mod10_dv(block):
+        weights = np.where(np.arange(block.shape[1])[::-1] % 2 == 0, 2, 1)
+        products = block * weights
+        return (10 - (products // 10 + products % 10).sum(axis=1) % 10) % 10
+
+    def mod11_remainder(block):
+        return (block * (2 + np.arange(block.shape[1])[::-1] % 8)).sum(axis=1) % 11
+
+    if digits.shape[1] == 47:
+        valid = ((mod10_dv(digits[:, 0:9]) == digits[:, 9]) & (mod10_dv(digits[:, 10:20]) == digits[:, 20])
+                 & (mod10_dv(digits[:, 21:31]) == digits[:, 31]))
+        barcode = np.concatenate([digits[:, 0:4], digits[:, 33:47], digits[:, 4:9], digits[:, 10:20], digits[:, 21:31]], axis=1)
+        dv = 11 - mod11_remainder(barcode)
+        return valid & (np.where((dv == 0) | (dv >= 10), 1, dv) == digits[:, 32])
+
+    use_mod10 = (digits[:, 2] == 6) | (digits[:, 2] == 7)
+    def block_dv(block):
+        remainder = mod11_remainder(block)
+        return np.where(use_mod10, mod10_dv(block), np.where(remainder <= 1, 0, 11 - remainder))
+    valid = (digits[:, 0] == 8) & (digits[:, 2] >= 6)
+    for start in (0, 12, 24, 36):
+        valid &= block_dv(digits[:, start:start + 11]) == digits[:, start + 11]
+    barcode = np.concatenate([digits[:, 0:11], digits[:, 12:23], digits[:, 24:35], digits[:, 36:47]], axis=1)
+    return valid & (block_dv(np.delete(barcode, 3, axis=1)) == barcode[:, 3])
+
+def linhas_are_valid(linhas):
+    """Lista de booleanos: se cada linha digitável (47 ou 48 dígitos) fecha todos os dígitos verificadores."""
+    np = _numpy()
+    if np is None:
+        return [_linha_is_valid(linha) for linha in linhas]
+    result = [False] * len(linhas)
+    for size in (47, 48):
+        positions = [idx for idx, linha in enumerate(linhas) if len(linha) == size]
+        if positions:
+            for idx, valid in zip(positions, _linhas_are_valid_numpy(np, [linhas[idx] for idx in positions]).tolist()):
+                result[idx] = valid
+    return result
+
+def validate_linhas_digitaveis(linhas):
+    """
+    Valida as linhas (de uma página ou de um lote inteiro, numa única operação) e tenta corrigir as inválidas
+    trocando um dígito pelos que o OCR costuma confundir. Retorna, para cada linha, (linha final, situação),
+    com situação 'valida', 'corrigida' ou 'invalida' (a linha inválida volta como foi lida).
+    """
+    valid = linhas_are_valid(linhas)
+    variants = [] # (índice da linha, variante)
+    for idx, linha in enumerate(linhas):
+        if not valid[idx]:
+            for pos, digit in enumerate(linha):
+                for replacement in OCR_DIGIT_CONFUSIONS[digit]:
+                    variants.append((idx, linha[:pos] + replacement + linha[pos + 1:]))
+    corrections = {}
+    if variants:
+        for (idx, variant), variant_valid in zip(variants, linhas_are_valid([variant for _, variant in variants])):
+            if variant_valid:
+                corrections.setdefault(idx, []).append(variant)
+    results = []
+    for idx, linha in enumerate(linhas):
+        if valid[idx]:
+            results.append((linha, 'valida'))
+        elif len(corrections.get(idx, [])) == 1: # Mais de uma variante válida: ambíguo, não corrige
+            results.append((corrections[idx][0], 'corrigida'))
+        else:
+            results.append((linha, 'invalida'))
+    return results
+
+def valor_linha_digitavel(linha, arrecadacao=False):
+    """Valor (texto 12345678,90) da linha digitável: últimos 10 dígitos no boleto; posições 5-15 do código de barras na arrecadação."""
+    if arrecadacao:
+        barcode_value = linha[4:11] + linha[12:16]
+        return f"{barcode_value[:-2]},{barcode_value[-2:]}"
+    return f"{linha[-10:-2]},{linha[-2:]}"
+
+def apply_linha_validation(infos):
+    """Valida as linhas digitáveis de várias páginas (resultados de `_extract_info`) numa única chamada e atualiza cada uma."""
+    linhas = [linha for info in infos for linha in info['linhas_digitaveis']]
+    if not linhas:
+        return infos
+    results = iter(validate_linhas_digitaveis(linhas))
+    for info in infos:
+        if not info['linhas_digitaveis']:
+            continue
+        linhas_finais, valores = [], []
+        for linha in info['linhas_digitaveis']:
+            final, status = next(results)
+            if status == 'corrigida':
+                info['linhas_corrigidas'].append((linha, final))
+            elif status == 'invalida':
+                info['linhas_invalidas'].append(final)
+            # Valor da arrecadação só quando a linha fecha como arrecadação (valor efetivo: 3º dígito 6 ou 8)
+            arrecadacao = status != 'invalida' and len(final) == 48 and final[2] in '68'
+            linhas_finais.append(final)
+            valores.append(valor_linha_digitavel(final, arrecadacao))
+        info['linhas_digitaveis'], info['valores'] = linhas_finais, valores
+    return infos
+
+def _extract_info(text, ignored_cnpjs):
+    """Núcleo de `extract_info`; `ignored_cnpjs` já é um conjunto."""
+    cnpj = 'N/A'
+    for match in CNPJ_PATTERN.finditer(text): # O primeiro CNPJ que não estiver no filtro
+        if match.group(1) not in ignored_cnpjs:
+            cnpj = match.group(1)
+            break
+
+    if GUIA_MARKER in text:
+        numero_guia_match = NUMERO_GUIA_PATTERN.search(text)
+        valor_match = VALOR_GUIA_PATTERN.search(text)
+        return {
+            'cnpj': cnpj,
+            'numero_guia': numero_guia_match.group(1) if numero_guia_match else None,
+            'valor': valor_match.group(1) if valor_match else None,
+            'linhas_digitaveis': [],
+            'valores': [],
+            'linhas_invalidas': [],
+            'linhas_corrigidas': [],
+            'tipo': 'guia_custas'
+        }
+
+    linhas_digitaveis = []
+    valores_monetarios = []
+    for line in text.splitlines():
+        # Descarta sem regex as linhas que não têm dígitos suficientes (a grande maioria): primeiro pelo
+        # tamanho, depois contando os dígitos (remover "123-4" só diminui a contagem)
+        if len(line) < LINHA_DIGITAVEL_MIN_DIGITS or sum(map(line.count, ASCII_DIGITS)) < LINHA_DIGITAVEL_MIN_DIGITS:
+            continue
+        if '-' in line:
+            line = AGENCIA_DV_PATTERN.sub('', line)
+        cleaned_line = NON_DIGIT_PATTERN.sub('', line) # Remove tudo que não é número
+        if LINHA_DIGITAVEL_MIN_DIGITS <= len(cleaned_line) <= LINHA_DIGITAVEL_MAX_DIGITS:
+            linhas_digitaveis.append(cleaned_line)
+            # Extrai o valor monetário dos últimos 10 dígitos (considerando os 2 decimais)
+            valores_monetarios.append(f"{cleaned_line[-10:-2]},{cleaned_line[-2:]}")
+    return {
+        'cnpj': cnpj,
+        'linhas_digitaveis': linhas_digitaveis,
+        'valores': valores_monetarios,
+        'numero_guia': None,
+        'valor': None,
+        'linhas_invalidas': [],
+        'linhas_corrigidas': [],
+        'tipo': 'boleto'
+    }
+
+def extract_info(text, ignored_cnpjs=None, validate=VALIDATE_LINHAS_DIGITAVEIS):
+    """Extrai CNPJ, linhas digitáveis/valores (boleto) ou número/valor da guia de custas do texto de uma página.
+    `ignored_cnpjs` substitui a lista global do Filtro.config. Com `validate`, as linhas digitáveis passam
+    pelos dígitos verificadores: as corrigidas ficam em 'linhas_corrigidas' (original, corrigida) e as que
+    não fecham continuam na lista, repetidas em 'linhas_invalidas'."""
+    info = _extract_info(text, frozenset(get_ignored_cnpjs() if ignored_cnpjs is None else ignored_cnpjs))
+    if validate:
+        apply_linha_validation([info])
+    return info
+
+def extract_info_batch(texts, ignored_cnpjs=None, validate=VALIDATE_LINHAS_DIGITAVEIS):
+    """`extract_info` para várias páginas de uma vez (filtro de CNPJs e validação das linhas feitos uma única vez)."""
+    ignored = frozenset(get_ignored_cnpjs() if ignored_cnpjs is None else ignored_cnpjs)
+    infos = [_extract_info(text, ignored) for text in texts]
+    if validate:
+        apply_linha_validation(infos)
+    return infos
+
+def log_message(message, level="INFO"):
+    """Registra uma mensagem no log usando os mesmos níveis da GUI (SUCCESS e CRITICAL_ERROR inclusos)."""
+    if level == "INFO": logger.info(message)
+    elif level == "WARNING": logger.warning(message)
+    elif level == "ERROR": logger.error(message)
+    elif level == "CRITICAL_ERROR": logger.critical(message)
+    elif level == "DEBUG": logger.debug(message)
+    elif level == "SUCCESS": logger.info(message) # SUCCESS é tratado como INFO no arquivo de log
+
+def save_to_csv(result_file, rows):
+    """Grava as linhas da planilha (cabeçalho incluso) em um CSV com separador ponto e vírgula ao lado do .xlsx."""
+    csv_file = os.path.splitext(result_file)[0] + ".csv"
+    with open(csv_file, 'w', newline='', encoding='utf-8-sig') as file:
+        writer = csv.writer(file, delimiter=';')
+        for row in rows:
+            writer.writerow(row)
+    return csv_file
+
+# *** Gravação da Planilha de Resultado ***
+RESULT_HEADER = ['Obeservação', 'Fornecedor', 'Código de Barras', 'Valor', 'Nome do Titulo']
+VALOR_LIMITE_BOLETO = 2000 # Valores acima disso são destacados para conferência manual
+CURRENCY_FORMAT = 'R$ #,##0.00'
+# Caracteres de controle que o Excel não aceita em células (o mesmo filtro do openpyxl)
+ILLEGAL_CHARACTERS_RE = re.compile(r'[\000-\010]|[\013-\014]|[\016-\037]')
+_cell_styles = None
+
+def cell_styles():
+    """(preenchimento amarelo, fonte preta, alinhamento à esquerda, à direita), criados na primeira gravação pelo openpyxl."""
+    global _cell_styles
+    if _cell_styles is None:
+        from openpyxl.styles import Alignment, PatternFill, Font
+        _cell_styles = (PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid'), Font(color='000000'),
+                        Alignment(horizontal='left'), Alignment(horizontal='right'))
+    return _cell_styles
+
+def xml_escape(text):
+    """Escapa &, < e > como o xml.sax.saxutils.escape, que importaria o urllib inteiro."""
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+def column_letter(col):
+    """Letra da coluna (1 -> A, 27 -> AA), sem importar o openpyxl."""
+    letters = ''
+    while col > 0:
+        col, remainder = divmod(col - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+def custas_number(cell_value):
+    """Número da sequência de Custas no final de um 'Nome do Titulo' (ex.: 'Custas12:07' -> 7), ou None."""
+    if isinstance(cell_value, str):
+        match = re.search(r':(\d+)$', cell_value) # Procura o número após o ':' no final
+        if match:
+            return int(match.group(1))
+    return None
+
+def valor_centavos(valor_texto):
+    """Valor em centavos de um texto no formato 1.234,56; -1 se não for um número (vazio ou ilegível)."""
+    if valor_texto and isinstance(valor_texto, str):
+        try:
+            # Remove pontos e substitui vírgula por ponto para conversão para float
+            return round(float(valor_texto.replace('.', '').replace(',', '.')) * 100)
+        except ValueError:
+            pass # Erros de valor inválido já são tratados no loop de extração
+    return -1
+
+@dataclass(slots=True)
+class ResultRecord:
+    """Um registro (linha) da planilha de resultado, com a origem e a validação dos dados."""
+    arquivo: str                 # Nome do PDF
+    pagina: int                  # Página do PDF (0 quando o PDF inteiro falhou)
+    tipo: str                    # 'boleto', 'guia_custas' ou 'sem_dados'
+    observacao: str              # Coluna "Obeservação"
+    cnpj: str = ''
+    codigo: str = ''             # Linha digitável ou número da guia
+    valor: str = ''              # Valor como lançado na planilha (1.234,56)
+    valor_centavos: int = -1     # -1 quando não há valor numérico
+    nome_titulo: str = ''        # Coluna "Nome do Titulo" (Custas<ordem>:<sequência>)
+    validacao: str = ''          # Dígitos verificadores da linha digitável: 'valida', 'corrigida' ou 'invalida'
+    segundos_ocr: float = 0.0    # Tempo do OCR da página
+    amarelo: bool = False        # Linha destacada para conferência
+
+    def sheet_row(self):
+        return (self.observacao, self.cnpj, self.codigo, self.valor, self.nome_titulo)
+
+class ResultBatch:
+    """
+    Registros de um lote guardados por coluna: uma lista por campo de texto e arrays compactos para os
+    campos numéricos, em vez de um objeto por linha. Os gravadores da planilha consomem as colunas direto
+    (`sheet_rows`) e a verificação do limite de valor roda sobre a coluna de centavos inteira de uma vez.
+    """
+    TEXT_FIELDS = ('arquivo', 'tipo', 'observacao', 'cnpj', 'codigo', 'valor', 'nome_titulo', 'validacao')
+    SHEET_FIELDS = ('observacao', 'cnpj', 'codigo', 'valor', 'nome_titulo')
+
+    def __init__(self):
+        self.columns = {name: [] for name in self.TEXT_FIELDS}
+        self.pagina = array('i')
+        self.valor_centavos = array('q')
+        self.segundos_ocr = array('d')
+        self.amarelo = bytearray()
+
+    def __len__(self):
+        return len(self.amarelo)
+
+    def append(self, record):
+        for name in self.TEXT_FIELDS:
+            self.columns[name].append(getattr(record, name))
+        self.pagina.append(record.pagina)
+        self.valor_centavos.append(record.valor_centavos)
+        self.segundos_ocr.append(record.segundos_ocr)
+        self.amarelo.append(int(record.amarelo))
+
+    def mark_last_yellow(self):
+        self.amarelo[-1] = 1
+
+    def record(self, idx):
+        return ResultRecord(pagina=self.pagina[idx], valor_centavos=self.valor_centavos[idx], segundos_ocr=self.segundos_ocr[idx],
+                            amarelo=bool(self.amarelo[idx]), **{name: self.columns[name][idx] for name in self.TEXT_FIELDS})
+
+    def __iter__(self):
+        return (self.record(idx) for idx in range(len(self)))
+
+    def sheet_rows(self):
+        """Linhas da planilha (tuplas na ordem de RESULT_HEADER) com o destaque amarelo: [(linha, amarelo)]."""
+        return zip(zip(*(self.columns[name] for name in self.SHEET_FIELDS)), map(bool, self.amarelo))
+
+    def flag_high_values(self, limit=VALOR_LIMITE_BOLETO):
+        """Pinta de amarelo os registros com valor acima de `limit` (reais) e os retorna como [(observação, valor)]."""
+        limit_centavos = limit * 100
+        np = _numpy()
+        if np is not None and len(self):
+            indices = np.flatnonzero(np.frombuffer(self.valor_centavos, dtype=np.int64) > limit_centavos).tolist()
+        else:
+            indices = [idx for idx, centavos in enumerate(self.valor_centavos) if centavos > limit_centavos]
+        for idx in indices:
+            self.amarelo[idx] = 1
+        return [(self.columns['observacao'][idx], self.columns['valor'][idx]) for idx in indices]
+
+# *** Índice da Planilha (modo incremental) ***
+# Arquivo ao lado da planilha com o necessário para acrescentar linhas sem reler o histórico: último número
+# de Custas, quantidade de registros, larguras das colunas e estilos. O tamanho do índice não depende da
+# quantidade de linhas (as duplicatas entre execuções ficam no índice SQLite de exportados).
+# Só vale enquanto a planilha tiver exatamente o tamanho/data gravados; se alguém salvar a planilha no Excel,
+# o índice é descartado e a próxima execução lê a planilha inteira (e grava um índice novo).
+SHEET_INDEX_VERSION = 2 # A versão 1 guardava também as linhas digitáveis
+SHEET_XML_PATH = 'xl/worksheets/sheet1.xml'
+STYLES_XML_PATH = 'xl/styles.xml'
+
+def sheet_index_path(result_file):
+    return os.path.splitext(result_file)[0] + '.indice.json'
+
+def save_sheet_index(result_file, data):
+    """Grava o índice com o tamanho e a data atuais da planilha. Falhas só desativam o modo incremental."""
+    try:
+        stat = os.stat(result_file)
+        data = dict(data, versao=SHEET_INDEX_VERSION, tamanho=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        with open(sheet_index_path(result_file), 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+    except Exception as e:
+        log_message(f"Não foi possível gravar o índice da planilha: {e}", "WARNING")
+        remove_sheet_index(result_file)
+
+def load_sheet_index(result_file):
+    """Retorna o índice da planilha se ele ainda corresponder ao arquivo; senão None."""
+    index_path = sheet_index_path(result_file)
+    if not os.path.exists(index_path):
+        return None
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        stat = os.stat(result_file)
+        if (index.get('versao') != SHEET_INDEX_VERSION or not index.get('estilos')
+                or index.get('tamanho') != stat.st_size or index.get('mtime_ns') != stat.st_mtime_ns):
+            log_message("Índice da planilha desatualizado (planilha alterada fora do programa); relendo a planilha.", "INFO")
+            return None
+        num_styles = sheet_style_count(result_file)
+        if any(not 0 <= style_id < num_styles for style_id in index['estilos'].values()):
+            log_message("Estilos do índice não existem na planilha; relendo e regravando a planilha.", "WARNING")
+            return None
+        return index
+    except Exception as e:
+        log_message(f"Índice da planilha inválido, relendo a planilha: {e}", "WARNING")
+        return None
+
+def sheet_style_count(result_file):
+    """Quantidade de estilos de célula (<cellXfs>) da planilha; só o styles.xml é lido."""
+    with zipfile.ZipFile(result_file) as zf:
+        styles_xml = zf.read(STYLES_XML_PATH)
+    cell_xfs = re.search(rb'<cellXfs\b[^>]*?(?:/>|>(.*?)</cellXfs>)', styles_xml, re.S)
+    return len(re.findall(rb'<xf\b', cell_xfs.group(1) or b'')) if cell_xfs else 0
+
+def remove_sheet_index(result_file):
+    try:
+        os.remove(sheet_index_path(result_file))
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        log_message(f"Não foi possível remover o índice da planilha: {e}", "WARNING")
+
+class WorkbookSheetWriter:
+    """
+    Planilha de resultado montada em memória pelo openpyxl. A formatação final (largura das colunas e
+    moeda) é feita em `save`, percorrendo a aba inteira.
+    Preserva as demais abas e a formatação de um arquivo existente.
+    """
+    def __init__(self):
+        self.wb = None
+        self.ws = None
+
+    def open(self, result_file):
+        """Cria ou carrega a planilha; retorna o último número da sequência de Custas já usado."""
+        import openpyxl
+        if not os.path.exists(result_file):
+            self.wb = openpyxl.Workbook()
+            self.ws = self.wb.active
+            self.ws.title = "Boletos"
+            self.ws.append(RESULT_HEADER)
+            self.ws.freeze_panes = 'A2' # Congela a primeira linha (cabeçalho)
+            log_message("Novo arquivo Excel criado para resultados.", "INFO")
+            return 0
+        self.wb = openpyxl.load_workbook(result_file)
+        self.ws = self.wb.active
+        self.ws.freeze_panes = 'A2' # Garante o congelamento da primeira linha ao abrir
+        log_message(f"Arquivo Excel existente carregado: {result_file}", "INFO")
+        numbers = (custas_number(self.ws.cell(row=row_idx, column=5).value) for row_idx in range(2, self.ws.max_row + 1))
+        return max((num for num in numbers if num is not None), default=0)
+
+    @property
+    def row_count(self):
+        """Quantidade de registros (linhas sem o cabeçalho)."""
+        return self.ws.max_row - 1
+
+    def add_batch(self, batch):
+        """Acrescenta os registros de um ResultBatch, pintando de amarelo os destacados."""
+        yellow_fill, black_font, _, _ = cell_styles()
+        for row, yellow in batch.sheet_rows():
+            self.ws.append(row)
+            if yellow:
+                for cell in self.ws[self.ws.max_row]:
+                    cell.fill = yellow_fill
+                    cell.font = black_font
+
+    def save(self, result_file):
+        """Formata e salva a planilha."""
+        ws = self.ws
+        _, _, align_left, align_right = cell_styles()
+        # Ajusta a largura das colunas
+        for col in range(1, ws.max_column + 1):
+            letter = column_letter(col)
+            # Calcula a largura máxima baseada no conteúdo, com um mínimo de 10
+            column_width = max(len(str(cell.value)) if cell.value else 0 for cell in ws[letter]) + 2
+            ws.column_dimensions[letter].width = max(column_width, 10)
+
+        # Formata a coluna "Valor" como moeda e alinha à direita
+        for cell in ws['D']:
+            cell.number_format = CURRENCY_FORMAT
+            cell.alignment = align_right
+        ws['D1'].alignment = align_left # Garante que o cabeçalho não alinhe à direita
+        self.wb.save(result_file)
+        remove_sheet_index(result_file) # O layout gravado aqui não é o esperado pelo modo incremental
+
+    def iter_rows(self):
+        return self.ws.iter_rows(values_only=True)
+
+class StreamingSheetWriter:
+    """
+    Planilha de resultado gravada em modo write-only do openpyxl.
+
+    As linhas são guardadas como tuplas simples (bem mais leves que as células do openpyxl) e, à medida
+    que chegam, já atualizam a largura das colunas. Em `save` a planilha é escrita numa única passada,
+    sem reler a aba para formatar.
+    Uma planilha existente é lida em modo read-only (valores e destaque amarelo) e reescrita com as
+    novas linhas; arquivos com mais de uma aba devem usar o WorkbookSheetWriter (ver `open_result_sheet`).
+    """
+    def __init__(self):
+        self.title = "Boletos"
+        self.rows = []
+        self.yellow_rows = set() # Índices (em self.rows) das linhas pintadas de amarelo
+        self.widths = []
+        self.last_custas = 0     # Maior número da sequência de Custas entre as linhas
+
+    def open(self, result_file):
+        """Cria ou lê a planilha existente; retorna o último número da sequência de Custas já usado."""
+        if not os.path.exists(result_file):
+            self._add_row(RESULT_HEADER)
+            log_message("Novo arquivo Excel criado para resultados.", "INFO")
+            return 0
+        import openpyxl
+        wb = openpyxl.load_workbook(result_file, read_only=True)
+        try:
+            ws = wb.active
+            self.title = ws.title
+            for row in ws.iter_rows():
+                values = [cell.value for cell in row]
+                is_yellow = any(getattr(cell, 'fill', None) is not None and cell.fill.fill_type == 'solid'
+                                and str(cell.fill.fgColor.rgb).endswith('FFFF00') for cell in row)
+                if not self.rows: # Cabeçalho
+                    self._add_row(values)
+                    continue
+                self.append(values)
+                if is_yellow:
+                    self.yellow_rows.add(len(self.rows) - 1)
+        finally:
+            wb.close()
+        if not self.rows:
+            self._add_row(RESULT_HEADER)
+        log_message(f"Arquivo Excel existente carregado: {result_file}", "INFO")
+        return self.last_custas
+
+    @property
+    def row_count(self):
+        return len(self.rows) - 1
+
+    def _add_row(self, row):
+        row = tuple(row)
+        for col, value in enumerate(row):
+            if col >= len(self.widths):
+                self.widths.append(0)
+            length = len(str(value)) if value else 0
+            if length > self.widths[col]:
+                self.widths[col] = length
+        self.rows.append(row)
+
+    def append(self, row):
+        self._add_row(row)
+        if len(row) > 4:
+            num = custas_number(row[4])
+            if num is not None and num > self.last_custas:
+                self.last_custas = num
+
+    def add_batch(self, batch):
+        """Acrescenta os registros de um ResultBatch, pintando de amarelo os destacados."""
+        for row, yellow in batch.sheet_rows():
+            self.append(row)
+            if yellow:
+                self.yellow_rows.add(len(self.rows) - 1)
+
+    def save(self, result_file):
+        """Escreve a planilha numa passada."""
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        yellow_fill, black_font, align_left, align_right = cell_styles()
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(self.title)
+        ws.freeze_panes = 'A2' # Congela a primeira linha (cabeçalho)
+        # No modo write-only as larguras precisam ser definidas antes da primeira linha
+        for col, width in enumerate(self.widths, start=1):
+            ws.column_dimensions[column_letter(col)].width = max(width + 2, 10)
+
+        # Uma célula-modelo por coluna e estilo, reaproveitada em todas as linhas: o write-only grava cada
+        # linha no momento do append, então só o valor muda. Evita criar e estilizar milhares de células.
+        num_cols = len(self.widths)
+        def styled_cells(yellow, header=False):
+            cells = []
+            for col in range(num_cols):
+                cell = WriteOnlyCell(ws)
+                if col == 3: # Coluna "Valor": moeda, alinhada à direita (o cabeçalho fica à esquerda)
+                    cell.number_format = CURRENCY_FORMAT
+                    cell.alignment = align_left if header else align_right
+                if yellow:
+                    cell.fill = yellow_fill
+                    cell.font = black_font
+                cells.append(cell)
+            return cells
+        plain_cells = styled_cells(False)
+        yellow_cells = styled_cells(True)
+
+        for row_idx, row in enumerate(self.rows):
+            if row_idx == 0:
+                cells = styled_cells(row_idx in self.yellow_rows, header=True)
+            elif row_idx in self.yellow_rows:
+                cells = yellow_cells
+            else:
+                # Linha comum: só a coluna "Valor" tem estilo, as demais vão como valores simples
+                if len(row) > 3:
+                    plain_cells[3].value = row[3]
+                    row = row[:3] + (plain_cells[3],) + row[4:]
+                ws.append(row)
+                continue
+            for cell, value in zip(cells, row):
+                cell.value = value
+            ws.append(cells[:len(row)])
+        # Estilos usados pelo modo incremental para acrescentar linhas sem reabrir a planilha. Ler o style_id
+        # registra o estilo no workbook, então isso vem antes do `save`: sem linhas amarelas nesta gravação,
+        # os estilos amarelos não estariam no styles.xml e o modo incremental apontaria para estilos inexistentes.
+        styles = {'valor': plain_cells[3].style_id, 'amarelo': yellow_cells[0].style_id, 'amarelo_valor': yellow_cells[3].style_id} if num_cols > 3 else None
+        wb.save(result_file)
+        save_sheet_index(result_file, {
+            'aba': SHEET_XML_PATH,
+            'registros': self.row_count,
+            'colunas': num_cols,
+            'ultima_custas': self.last_custas,
+            'larguras': self.widths,
+            'estilos': styles,
+        })
+
+    def iter_rows(self):
+        return iter(self.rows)
+
+class IncrementalSheetWriter(StreamingSheetWriter):
+    """
+    Acrescenta linhas a uma planilha gravada pelo próprio programa, usando o índice ao lado dela em vez de
+    reler o histórico. Só as linhas novas ficam na memória; em `save` elas são convertidas em XML e
+    inseridas no fim da aba, e o .xlsx é regravado sem passar pelo openpyxl. O custo depende das
+    linhas novas, não do tamanho do relatório.
+    """
+    def __init__(self, index):
+        super().__init__()
+        self.index = index
+        self.widths = list(index['larguras'])
+        self.last_custas = index['ultima_custas']
+        self.result_file = None
+
+    def open(self, result_file):
+        self.result_file = result_file
+        log_message(f"Planilha existente aberta em modo incremental ({self.index['registros']} registros): {result_file}", "INFO")
+        return self.last_custas
+
+    @property
+    def row_count(self):
+        return self.index['registros'] + len(self.rows)
+
+    def _cell_xml(self, ref, value, style_id):
+        style = f' s="{style_id}"' if style_id else ''
+        if value is None or value == '':
+            return f'<c r="{ref}"{style}/>' if style_id else ''
+        if isinstance(value, bool):
+            return f'<c r="{ref}"{style} t="b"><v>{int(value)}</v></c>'
+        if isinstance(value, (int, float)):
+            return f'<c r="{ref}"{style} t="n"><v>{value}</v></c>'
+        text = xml_escape(ILLEGAL_CHARACTERS_RE.sub('', str(value)))
+        space = ' xml:space="preserve"' if text != text.strip() else ''
+        return f'<c r="{ref}"{style} t="inlineStr"><is><t{space}>{text}</t></is></c>'
+
+    def _rows_xml(self):
+        styles = self.index['estilos']
+        letters = [column_letter(col) for col in range(1, len(self.widths) + 1)]
+        parts = []
+        for offset, row in enumerate(self.rows):
+            row_number = self.index['registros'] + 2 + offset # +1 do cabeçalho, +1 porque começa em 1
+            is_yellow = offset in self.yellow_rows
+            cells = []
+            for col, value in enumerate(row):
+                if col == 3:
+                    style_id = styles['amarelo_valor'] if is_yellow else styles['valor']
+                else:
+                    style_id = styles['amarelo'] if is_yellow else 0
+                cells.append(self._cell_xml(f"{letters[col]}{row_number}", value, style_id))
+            parts.append(f'<row r="{row_number}">{"".join(cells)}</row>')
+        return "".join(parts).encode('utf-8')
+
+    def _cols_xml(self):
+        cols = "".join(f'<col width="{max(width + 2, 10)}" customWidth="1" min="{col}" max="{col}" />'
+                       for col, width in enumerate(self.widths, start=1))
+        return f'<cols>{cols}</cols>'.encode('utf-8')
+
+    def save(self, result_file):
+        """Insere as linhas novas no fim da aba."""
+        sheet_path = self.index['aba']
+        temp_file = result_file + '.tmp'
+        try:
+            with zipfile.ZipFile(result_file) as zin, zipfile.ZipFile(temp_file, 'w', zipfile.ZIP_DEFLATED) as zout:
+                for item in zin.infolist():
+                    data = zin.read(item.filename)
+                    if item.filename == sheet_path and self.rows:
+                        data = self._append_to_sheet_xml(data)
+                    zout.writestr(item, data)
+            os.replace(temp_file, result_file)
+        finally:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+        save_sheet_index(result_file, dict(
+            self.index,
+            registros=self.row_count,
+            ultima_custas=self.last_custas,
+            larguras=self.widths,
+            colunas=len(self.widths),
+        ))
+
+    def _append_to_sheet_xml(self, data):
+        end = data.rfind(b'</sheetData>')
+        if end >= 0:
+            data = data[:end] + self._rows_xml() + data[end:]
+        else: # Aba sem linhas: <sheetData/>
+            empty = data.find(b'<sheetData')
+            close = data.find(b'/>', empty)
+            data = data[:empty] + b'<sheetData>' + self._rows_xml() + b'</sheetData>' + data[close + 2:]
+        # Larguras e dimensão ficam antes do <sheetData>; só esse trecho (pequeno) é reescrito
+        head_end = data.find(b'<sheetData')
+        head, body = data[:head_end], data[head_end:]
+        if b'<cols>' in head:
+            head = re.sub(rb'<cols>.*?</cols>', lambda m: self._cols_xml(), head, count=1, flags=re.S)
+        else:
+            head = head + self._cols_xml()
+        last_ref = f"A1:{column_letter(len(self.widths))}{self.row_count + 1}".encode('ascii')
+        head = re.sub(rb'<dimension ref="[^"]*"', b'<dimension ref="' + last_ref + b'"', head, count=1)
+        return head + body
+
+    def iter_rows(self):
+        """Todas as linhas da planilha (usado pelo CSV), lidas em modo read-only após o `save`."""
+        import openpyxl
+        wb = openpyxl.load_workbook(self.result_file, read_only=True)
+        try:
+            yield from wb.active.iter_rows(values_only=True)
+        finally:
+            wb.close()
+
+def open_result_sheet(result_file, streaming=STREAMING_OUTPUT, incremental=INCREMENTAL_OUTPUT):
+    """
+    Abre a planilha de resultado com o gravador adequado e retorna (gravador, último número de Custas).
+    Planilhas existentes com mais de uma aba usam o WorkbookSheetWriter para não perder as outras abas;
+    com o índice da planilha válido, o IncrementalSheetWriter só acrescenta as linhas novas.
+    """
+    if streaming and incremental and os.path.exists(result_file):
+        index = load_sheet_index(result_file)
+        if index:
+            writer = IncrementalSheetWriter(index)
+            return writer, writer.open(result_file)
+    if streaming and os.path.exists(result_file):
+        import openpyxl
+        wb = openpyxl.load_workbook(result_file, read_only=True)
+        try:
+            multiple_sheets = len(wb.sheetnames) > 1
+        finally:
+            wb.close()
+        if multiple_sheets:
+            log_message("Planilha com mais de uma aba: gravação em memória para preservar as demais abas.", "INFO")
+            streaming = False
+    writer = StreamingSheetWriter() if streaming else WorkbookSheetWriter()
+    return writer, writer.open(result_file)
+
+class BatchProcessor:
+    """
+    Processa um lote de PDFs e grava (ou acrescenta) a planilha de resultado: OCR, extração e formatação.
+    Não depende da GUI e pode ser usado por outros programas; cada instância tem a sua configuração
+    (BatchConfig) e o seu CancellationToken, então vários lotes podem rodar ao mesmo tempo.
+
+    O OCR dos PDFs é distribuído entre `config.ocr_workers` threads, mas os resultados são consumidos
+    na ordem de `input_files`, mantendo a ordem das linhas e a numeração de Custas.
+
+    O progresso é informado aos ouvintes registrados com `add_listener`, chamados na thread do lote
+    como `callback(evento, dados)`:
+      'batch_started'  -> {'total': quantidade de arquivos}
+      'file_started'   -> {'name': nome do PDF}
+      'file_done'      -> {'processed': arquivos concluídos, 'total': quantidade de arquivos, 'name': nome,
+                           'ok': False se o OCR falhou ou o PDF estava vazio}
+      'batch_finished' -> o dict retornado por `run()`
+    """
+    def __init__(self, input_files, result_file, config=None, cancel_token=None):
+        self.input_files = list(input_files)
+        self.result_file = result_file
+        self.config = config or BatchConfig()
+        self.cancel_token = cancel_token or CancellationToken()
+        self.result = None
+        self.listeners = []
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+        return callback
+
+    def remove_listener(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def _emit(self, event, data):
+        for callback in list(self.listeners):
+            try:
+                callback(event, data)
+            except Exception:
+                # Um ouvinte com erro não pode interromper o lote
+                logger.exception(f"Erro no ouvinte do evento '{event}'")
+
+    def cancel(self):
+        """Pede o cancelamento; os PDFs em andamento param na próxima página e os da fila são descartados."""
+        self.cancel_token.cancel()
+
+    def start(self):
+        """Executa `run()` em uma thread própria e a retorna; o resultado fica em `self.result`."""
+        worker = Thread(target=self.run, daemon=True)
+        worker.start()
+        return worker
+
+    def run(self):
+        """
+        Processa o lote na thread atual e retorna um dict com as divergências encontradas, o número de
+        registros da planilha, se a planilha e o CSV foram salvos, se o lote foi cancelado e, se a
+        planilha não pôde ser aberta, a mensagem do erro em 'fatal_error'. Um erro inesperado durante o
+        processamento ou ao salvar (ex.: planilha aberta no Excel) fica em 'critical_error'.
+        """
+        self._emit('batch_started', {'total': len(self.input_files)})
+        result = self._process()
+        result['cancelled'] = self.cancel_token.cancelled
+        self.result = result
+        self._emit('batch_finished', result)
+        return result
+
+    def _process(self):
+        config = self.config
+        cancel_token = self.cancel_token
+        input_files_list = self.input_files
+        result_file_str = self.result_file
+        custas_str = config.custas
+
+        log_message("Processamento do lote iniciado.", "DEBUG")
+
+        total_files = len(input_files_list)
+        processed_files_count = 0
+
+        error_messages = []
+        arquivos_com_paginas_a_mais = set()
+        arquivos_com_dados_incompletos = set()
+        linhas_digitaveis_processadas = set() # Inicializado por lote para evitar duplicatas entre PDFs
+        pending_exports = [] # (chave, arquivo) lançados nesta execução, registrados no índice de duplicatas após salvar
+        duplicate_index = get_duplicate_index()
+        check_duplicates = duplicate_index is not None and config.duplicate_policy != 'desativado'
+        page_source_counts = {} # Quantas páginas foram lidas por cada caminho (camada de texto, cache, OCR)
+        ocr_stats = OCRStats()
+        report = PerformanceReport()
+        records = ResultBatch() # Registros lançados nesta execução, gravados na planilha no final
+        desempenho = [] # Resumo do relatório de desempenho para os popups
+        num_registros_extraidos = 0
+        csv_criado = False
+        planilha_salva = False
+        fatal_error = None
+        critical_error = None
+
+        def batch_result():
+            return {
+                'error_messages': error_messages,
+                'arquivos_com_paginas_a_mais': list(arquivos_com_paginas_a_mais),
+                'arquivos_com_dados_incompletos': list(arquivos_com_dados_incompletos),
+                'num_registros_extraidos': num_registros_extraidos,
+                'csv_criado': csv_criado,
+                'planilha_salva': planilha_salva,
+                'fatal_error': fatal_error,
+                'critical_error': critical_error,
+                'desempenho': desempenho,
+            }
+
+        def file_done(name, ok=True):
+            nonlocal processed_files_count
+            processed_files_count += 1
+            self._emit('file_done', {'processed': processed_files_count, 'total': total_files, 'name': name, 'ok': ok})
+
+        temp_dir_obj = tempfile.TemporaryDirectory()
+        temp_dir = temp_dir_obj.name
+        log_message(f"Pasta temporária criada para OCR (usada só como área de transbordo): {temp_dir}", "DEBUG")
+
+        # Pool de OCR: cada thread renderiza e reconhece um PDF inteiro em paralelo com as demais
+        ocr_executor = ThreadPoolExecutor(max_workers=max(1, config.ocr_workers), thread_name_prefix="OCR")
+        ocr_futures = {}
+
+        try:
+            custas_seq_counter = 0 # Contador sequencial para a coluna "Nome do Titulo"
+            try:
+                # Se o arquivo existe, o contador continua do último número da sequência de "Custas"
+                with report.measure('abertura_planilha'):
+                    sheet, custas_seq_counter = open_result_sheet(result_file_str, config.streaming_output, config.incremental_output)
+                if custas_seq_counter:
+                    log_message(f"Contador de custas reiniciado de {custas_seq_counter} (baseado em arquivo existente).", "DEBUG")
+            except Exception as e:
+                log_message(f"Erro ao abrir arquivo Excel existente: {result_file_str} - {e}", "ERROR")
+                fatal_error = f"Não foi possível abrir o arquivo Excel: {e}"
+                return batch_result() # Sai do processamento
+
+            def add_record(observacao, tipo, page_number, cnpj='', codigo='', valor='', validacao=''):
+                """Registra uma linha da planilha com o número de Custas atual."""
+                records.append(ResultRecord(arquivo=n_processo, pagina=page_number, tipo=tipo, observacao=observacao,
+                                            cnpj=cnpj, codigo=codigo, valor=valor, valor_centavos=valor_centavos(valor),
+                                            nome_titulo=f"Custas{custas_str}:{custas_seq_counter:02}", validacao=validacao,
+                                            segundos_ocr=report.page_seconds(n_processo, page_number, 'ocr')))
+
+            page_image_budget.reset_peaks()
+            if check_duplicates:
+                duplicate_index.purge(config.duplicate_expiry_days)
+
+            def already_exported(key, description, n_processo, page_idx):
+                """Consulta o índice de duplicatas entre execuções; registra o aviso e retorna True se já foi exportado."""
+                if not check_duplicates:
+                    return False
+                previous = duplicate_index.lookup(key, config.duplicate_expiry_days)
+                if not previous:
+                    return False
+                arquivo, planilha, exportado_em = previous
+                quando = time.strftime('%d/%m/%Y', time.localtime(exportado_em))
+                acao = "linha não lançada" if config.duplicate_policy == 'ignorar' else "verificar antes de pagar"
+                message = (f"Arquivo {n_processo}, Página {page_idx+1}: {description} já exportada em {quando} "
+                           f"(arquivo {arquivo}, planilha {os.path.basename(planilha)}) - {acao}.")
+                error_messages.append(message)
+                log_message(message, "WARNING")
+                return True
+
+            # Enfileira o OCR de todos os PDFs de uma vez; o pool limita quantos rodam simultaneamente
+            for file_idx, pdf_path in enumerate(input_files_list):
+                if pdf_path.lower().endswith('.pdf'):
+                    ocr_futures[file_idx] = ocr_executor.submit(ocr_pdf, pdf_path, temp_dir, config, cancel_token, ocr_stats, report)
+            log_message(f"OCR distribuído em até {max(1, config.ocr_workers)} PDFs simultâneos.", "DEBUG")
+
+            for file_idx, pdf_path in enumerate(input_files_list):
+                if cancel_token.cancelled: # Checa o cancelamento antes de cada PDF
+                    log_message("Processamento cancelado antes de concluir todos os PDFs.", "INFO")
+                    break
+
+                n_processo = os.path.basename(pdf_path)
+                base_name_for_excel = os.path.splitext(n_processo)[0]
+
+                if not n_processo.lower().endswith('.pdf'):
+                    log_message(f"Pulando arquivo não PDF: {n_processo}", "INFO")
+                    # Atualiza o progresso mesmo para arquivos pulados para não travar a barra
+                    file_done(n_processo)
+                    continue
+
+                log_message(f"Processando documento: {n_processo}", "INFO")
+                self._emit('file_started', {'name': n_processo})
+
+                # Aguarda o OCR deste PDF (executado no pool) para gravar as linhas na ordem original
+                texts_per_page, num_pages_in_current_pdf, page_sources = ocr_futures[file_idx].result()
+                report.set_pages(n_processo, num_pages_in_current_pdf)
+
+                if cancel_token.cancelled: # Checa o cancelamento novamente após OCR
+                    log_message(f"Processamento de {n_processo} cancelado durante o OCR.", "INFO")
+                    break
+
+                # Caso o OCR falhe ou o PDF esteja vazio/inválido
+                if num_pages_in_current_pdf == 0 or not texts_per_page:
+                    error_messages.append(f"Arquivo {n_processo}: Falha no processamento do OCR ou PDF vazio.")
+                    arquivos_com_dados_incompletos.add(base_name_for_excel) # Adiciona à lista de incompletos
+
+                    custas_seq_counter += 1 # Incrementa o contador mesmo para linhas sem dados
+                    add_record(base_name_for_excel, 'sem_dados', 0) # Adiciona linha para o PDF
+                    records.mark_last_yellow() # Pinta de amarelo
+                    log_message(f"Arquivo {n_processo}: Falha no processamento do OCR ou PDF vazio.", "ERROR")
+                    # Atualiza progresso e continua para o próximo PDF
+                    file_done(n_processo, ok=False)
+                    continue # Pula para o próximo PDF na lista
+
+                # Adiciona à lista de arquivos com mais de uma página se aplicável
+                if num_pages_in_current_pdf > 1:
+                    arquivos_com_paginas_a_mais.add(base_name_for_excel)
+                    log_message(f"Arquivo {n_processo}: Possui {num_pages_in_current_pdf} páginas.", "WARNING")
+
+                pdf_extracted_any_data = False # Flag para verificar se algum dado foi extraído deste PDF
+                with report.measure('extracao', n_processo):
+                    infos = extract_info_batch(texts_per_page, config.ignored_cnpjs)
+
+                # Itera sobre o texto de cada página
+                for page_idx, info in enumerate(infos):
+                    if cancel_token.cancelled: # Checa cancelamento entre páginas
+                        log_message(f"Processamento de {n_processo} cancelado na página {page_idx+1}.", "INFO")
+                        break # Sai do loop de páginas
+
+                    page_source_counts[page_sources[page_idx]] = page_source_counts.get(page_sources[page_idx], 0) + 1
+                    log_message(f"Arquivo {n_processo}, Página {page_idx+1}: texto obtido via {page_sources[page_idx]}.", "INFO")
+
+                    # Define o nome da observação na planilha, adicionando o número da página se for multi-página
+                    excel_obs_name = base_name_for_excel
+                    if num_pages_in_current_pdf > 1:
+                        excel_obs_name = f"{base_name_for_excel} - Página {page_idx + 1}"
+
+                    row_needs_yellow_due_to_data_issue = False # Flag para problemas de dados nesta linha/página
+
+                    cnpj = info['cnpj'] if info['cnpj'] != 'N/A' else ''
+                    if not any(info.values()) and info['cnpj'] == 'N/A' and not info['linhas_digitaveis']:
+                        row_needs_yellow_due_to_data_issue = True
+                        log_message(f"Arquivo {n_processo}, Página {page_idx+1}: Nenhuma informação encontrada.", "WARNING")
+                        custas_seq_counter += 1 # Incrementa o contador
+                        add_record(excel_obs_name, 'sem_dados', page_idx + 1)
+                    elif info['tipo'] == 'guia_custas':
+                        custas_seq_counter += 1 # Incrementa o contador
+                        guia_key = DuplicateIndex.guia_key(info['numero_guia']) if info['numero_guia'] else None
+                        guia_duplicada = guia_key is not None and already_exported(guia_key, f"Guia {info['numero_guia']}", n_processo, page_idx)
+                        if guia_duplicada and config.duplicate_policy == 'ignorar':
+                            # Guia já exportada: lança só a identificação, sem número/valor para pagamento
+                            row_needs_yellow_due_to_data_issue = True
+                            guia_key = None
+                            add_record(excel_obs_name, 'guia_custas', page_idx + 1, cnpj)
+                        elif info['cnpj'] != 'N/A' and info['numero_guia'] and info['valor']:
+                            add_record(excel_obs_name, 'guia_custas', page_idx + 1, cnpj, info['numero_guia'], info['valor'])
+                            log_message(f"Arquivo {n_processo}, Página {page_idx+1}: Guia de Custas processada com sucesso.", "INFO")
+                            pdf_extracted_any_data = True
+                            row_needs_yellow_due_to_data_issue = guia_duplicada
+                        else:
+                            row_needs_yellow_due_to_data_issue = True
+                            add_record(excel_obs_name, 'guia_custas', page_idx + 1, info['cnpj'] or '', info['numero_guia'] or '', info['valor'] or '')
+                            log_message(f"Arquivo {n_processo}, Página {page_idx+1}: Guia de Custas com dados incompletos.", "WARNING")
+                        if guia_key:
+                            pending_exports.append((guia_key, n_processo))
+                    else: # Tipo boleto
+                        for lida, corrigida in info['linhas_corrigidas']:
+                            log_message(f"Arquivo {n_processo}, Página {page_idx+1}: linha digitável corrigida pelos dígitos "
+                                        f"verificadores ({lida} -> {corrigida}).", "WARNING")
+                        num_linhas_digitaveis = len(info['linhas_digitaveis'])
+                        if num_linhas_digitaveis == 0:
+                            row_needs_yellow_due_to_data_issue = True
+                            custas_seq_counter += 1 # Incrementa o contador
+                            add_record(excel_obs_name, 'boleto', page_idx + 1, cnpj)
+                            log_message(f"Arquivo {n_processo}, Página {page_idx+1}: Nenhuma linha digitável encontrada.", "WARNING")
+                        else:
+                            page_extracted_any_data = False # Flag para esta página
+                            for i in range(num_linhas_digitaveis):
+                                linha_digitavel = info['linhas_digitaveis'][i]
+                                valor_monetario = info['valores'][i]
+                                if linha_digitavel in linhas_digitaveis_processadas:
+                                    log_message(f"Linha digitável duplicada encontrada para {n_processo}, Página {page_idx+1}: {linha_digitavel}", "DEBUG")
+                                    continue
+                                linhas_digitaveis_processadas.add(linha_digitavel)
+                                if linha_digitavel in info['linhas_invalidas']:
+                                    message = (f"Arquivo {n_processo}, Página {page_idx+1}: Linha digitável {linha_digitavel} "
+                                               f"com dígito verificador inválido (possível erro de OCR). Verificar manual.")
+                                    error_messages.append(message)
+                                    log_message(message, "WARNING")
+                                    row_needs_yellow_due_to_data_issue = True
+                                linha_key = DuplicateIndex.linha_key(linha_digitavel)
+                                if already_exported(linha_key, f"Linha digitável {linha_digitavel}", n_processo, page_idx):
+                                    if config.duplicate_policy == 'ignorar':
+                                        continue
+                                    row_needs_yellow_due_to_data_issue = True
+                                try:
+                                    valor_float = float(valor_monetario.replace(',', '.'))
+                                    valor_formatado = "{:,.2f}".format(valor_float).replace(',', '*').replace('.', ',').replace('*', '.')
+                                except ValueError:
+                                    valor_formatado = valor_monetario
+                                    error_messages.append(f"Arquivo {n_processo}, Página {page_idx+1}: Valor monetário inválido '{valor_monetario}' na linha digitável '{linha_digitavel}'.")
+                                    log_message(f"Arquivo {n_processo}, Página {page_idx+1}: Valor monetário inválido '{valor_monetario}'.", "WARNING")
+                                    row_needs_yellow_due_to_data_issue = True
+
+                                # Adapta a observação para múltiplas linhas digitáveis na mesma página
+                                obs_for_row = excel_obs_name
+                                if num_linhas_digitaveis > 1:
+                                    obs_for_row = f"{excel_obs_name} (Linha {i + 1})"
+
+                                custas_seq_counter += 1 # Incrementa para cada linha digitável
+                                validacao = ('invalida' if linha_digitavel in info['linhas_invalidas'] else
+                                             'corrigida' if any(linha_digitavel == corrigida for _, corrigida in info['linhas_corrigidas']) else 'valida')
+                                add_record(obs_for_row, 'boleto', page_idx + 1, cnpj, linha_digitavel, valor_formatado, validacao)
+                                pending_exports.append((linha_key, n_processo))
+                                page_extracted_any_data = True
+                                pdf_extracted_any_data = True
+
+                            if not page_extracted_any_data: # Se não extraiu nenhuma linha válida/nova desta página
+                                row_needs_yellow_due_to_data_issue = True
+                                custas_seq_counter += 1 # Incrementa mesmo se não extraiu linha válida
+                                add_record(excel_obs_name, 'boleto', page_idx + 1, cnpj)
+                                log_message(f"Arquivo {n_processo}, Página {page_idx+1}: Nenhuma linha digitável válida/nova encontrada.", "WARNING")
+
+                    if info['cnpj'] == 'N/A':
+                        arquivos_com_dados_incompletos.add(base_name_for_excel)
+                        row_needs_yellow_due_to_data_issue = True
+                        error_messages.append(f"Arquivo {n_processo}, Página {page_idx+1}: CNPJ não encontrado ou ignorado.")
+                        log_message(f"Arquivo {n_processo}, Página {page_idx+1}: CNPJ não encontrado ou ignorado.", "WARNING")
+
+                    # Aplica a cor amarela às linhas recém-adicionadas desta página
+                    # Se houver problema de dados OU se o PDF tiver múltiplas páginas
+                    if row_needs_yellow_due_to_data_issue or num_pages_in_current_pdf > 1:
+                        # Itera sobre as linhas adicionadas para esta página
+                        # A partir da linha que acabou de ser adicionada (a última linha) até a linha anterior,
+                        # dependendo de quantas linhas foram adicionadas para esta página.
+                        # Para simplificar, aplicaremos à última linha adicionada por esta iteração de página.
+                        # NOTA: Se uma página gerar múltiplas linhas (ex: 2 linhas digitáveis),
+                        # a última linha adicionada é a última da planilha. Para colorir todas as linhas
+                        # geradas por uma única página, precisaríamos saber o número de linhas ANTES e DEPOIS.
+                        # O comportamento atual é colorir a(s) última(s) linha(s) adicionada(s) por essa "ação".
+                        records.mark_last_yellow()
+
+                # Após processar todas as páginas do PDF atual, verifica se algum dado foi extraído.
+                if not pdf_extracted_any_data:
+                    arquivos_com_dados_incompletos.add(base_name_for_excel)
+
+                # Atualiza o progresso por PDF processado
+                file_done(n_processo)
+
+            # --- Verificação de valores acima do limite, formatação e gravação da planilha ---
+            # Só os registros desta execução: os já existentes foram destacados quando lançados
+            high_values = records.flag_high_values(VALOR_LIMITE_BOLETO)
+            with report.measure('gravacao_planilha'):
+                sheet.add_batch(records)
+                sheet.save(result_file_str)
+            for obs_name, valor_boleto in high_values:
+                # Adiciona mensagem de erro (a linha já foi pintada de amarelo pelo gravador)
+                error_messages.append(f"Arquivo {obs_name}: Valor do boleto (R$ {valor_boleto}) acima de R$ {VALOR_LIMITE_BOLETO}. Verificar manual.")
+                log_message(f"Arquivo {obs_name}: Valor do boleto (R$ {valor_boleto}) acima de R$ {VALOR_LIMITE_BOLETO}. Verificar manual.", "WARNING")
+            planilha_salva = True
+            if duplicate_index is not None and pending_exports:
+                duplicate_index.add_many(pending_exports, result_file_str)
+            log_message(f"Arquivo Excel salvo em: {result_file_str}", "INFO")
+            peak_rss = peak_rss_bytes()
+            log_message(f"Memória: pico de {page_image_budget.peak_images} páginas decodificadas simultâneas "
+                        f"(limite {page_image_budget.max_images}, {page_image_budget.peak_bytes / 1024 / 1024:.1f} MB em imagens)"
+                        + (f", pico de memória do processo {peak_rss / 1024 / 1024:.1f} MB." if peak_rss else "."), "INFO")
+            if page_source_counts:
+                log_message("Origem do texto das páginas: " + ", ".join(f"{source}: {count}" for source, count in page_source_counts.items()), "INFO")
+            if ocr_stats.thumbnails:
+                log_message(f"Pré-classificação: {ocr_stats.skipped} de {ocr_stats.thumbnails} páginas de PDFs com várias páginas "
+                            f"dispensaram o OCR completo; miniaturas custaram {ocr_stats.thumbnail_seconds:.1f}s, "
+                            f"economia estimada de {ocr_stats.saved_seconds():.1f}s de OCR.", "INFO")
+            if ocr_stats.ladder_steps:
+                steps = ", ".join(f"tentativa {step + 1}: {count}" for step, count in sorted(
+                    (step, count) for step, count in ocr_stats.ladder_steps.items() if step is not None))
+                log_message(f"Escada de OCR (páginas validadas por tentativa) - {steps or 'nenhuma'}; "
+                            f"sem validação: {ocr_stats.ladder_steps.get(None, 0)}.", "INFO")
+            for name, summary in ocr_stats.preprocess_summary().items():
+                log_message(f"Pré-processamento '{name}': {summary['ms_por_pagina']:.1f} ms/página, alterou {summary['alteradas']} de "
+                            f"{summary['paginas']} páginas ({summary['alteradas_validadas']} com os dados validados).", "INFO")
+
+            num_erros_reportados = len(error_messages) + len(arquivos_com_paginas_a_mais) + len(arquivos_com_dados_incompletos)
+            num_registros_extraidos = sheet.row_count
+
+            if config.save_csv and num_erros_reportados == 0 and num_registros_extraidos > 0:
+                with report.measure('csv'):
+                    csv_file = save_to_csv(result_file_str, sheet.iter_rows())
+                csv_criado = True
+                log_message(f"Arquivo CSV salvo em: {csv_file}", "INFO")
+            elif config.save_csv:
+                log_message("CSV automático não criado devido a divergências ou falta de dados.", "WARNING")
+
+            if config.performance_report:
+                desempenho.extend(report.summary())
+                for line in desempenho:
+                    log_message(f"Desempenho: {line}", "INFO")
+                try:
+                    json_file, _ = report.save(result_file_str, config, ocr_stats)
+                    log_message(f"Relatório de desempenho salvo em: {json_file} (e .csv)", "INFO")
+                except Exception as e:
+                    log_message(f"Não foi possível gravar o relatório de desempenho: {e}", "WARNING")
+
+        except Exception as e:
+            logger.exception("Erro crítico durante o processamento dos PDFs")
+            log_message(f"Erro crítico durante o processamento: {e}", "CRITICAL_ERROR")
+            error_messages.append(f"Erro crítico: {e}")
+            critical_error = str(e)
+        finally:
+            # Descarta os PDFs ainda na fila e aguarda os que estão em andamento (eles checam o `cancel_token`)
+            ocr_executor.shutdown(wait=True, cancel_futures=True)
+            temp_dir_obj.cleanup()
+            log_message("Pasta temporária de OCR removida.", "DEBUG")
+
+        return batch_result()
+
+# *** Pasta Monitorada ***
+WATCH_POLL_INTERVAL = 5.0    # Segundos entre as verificações da pasta
+WATCH_SETTLE_SECONDS = 10.0  # Tempo sem alteração de tamanho/data para considerar um PDF completamente gravado
+WATCH_PROCESSED_DIR = 'Processados' # Subpasta para onde os PDFs já lançados na planilha são movidos
+WATCH_FAILED_DIR = 'Falhas' # Subpasta dos PDFs cujo OCR falhou (ou vazios); devolvê-los à pasta os processa de novo
+
+def pdf_is_complete(pdf_path):
+    """Verifica se o arquivo começa com %PDF e termina com %%EOF (scanners e cópias gravam o trailer por último)."""
+    try:
+        with open(pdf_path, 'rb') as file:
+            if file.read(5) != b'%PDF-':
+                return False
+            file.seek(0, os.SEEK_END)
+            file.seek(max(0, file.tell() - 1024))
+            return b'%%EOF' in file.read()
+    except OSError: # Arquivo bloqueado pelo programa que ainda está gravando
+        return False
+
+class FolderWatcher:
+    """
+    Monitora uma pasta e processa os PDFs que chegam, em pequenos lotes, acrescentando as linhas à
+    planilha de resultado. A numeração de Custas continua da planilha existente (mesma recuperação
+    feita pelo BatchProcessor ao abrir um arquivo já existente).
+
+    Um PDF só entra no lote depois de ficar `settle_seconds` sem mudar de tamanho/data e com o trailer
+    %%EOF gravado, evitando ler arquivos ainda em cópia. Depois que a planilha é salva, os PDFs do lote
+    são movidos para a subpasta `WATCH_PROCESSED_DIR`, e os que falharam no OCR (ou estavam vazios) para
+    `WATCH_FAILED_DIR`, separados dos processados; se a planilha não puder ser salva (ex.: aberta no
+    Excel), os PDFs ficam na pasta e são tentados novamente na próxima verificação.
+
+    `result_file` aceita códigos do strftime (ex.: "custas_%Y-%m-%d.xlsx") para uma planilha por dia.
+    Os ouvintes recebem os eventos de cada BatchProcessor e também 'watch_batch' -> {'files': [...], 'result': dict}.
+    """
+    def __init__(self, folder, result_file, config=None, cancel_token=None,
+                 poll_interval=WATCH_POLL_INTERVAL, settle_seconds=WATCH_SETTLE_SECONDS):
+        self.folder = folder
+        self.result_file = result_file
+        self.config = config or BatchConfig()
+        self.cancel_token = cancel_token or CancellationToken()
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self.processed_dir = os.path.join(folder, WATCH_PROCESSED_DIR)
+        self.failed_dir = os.path.join(folder, WATCH_FAILED_DIR)
+        self.listeners = []
+        self.pending = {} # caminho -> (tamanho, data de modificação, momento da última alteração observada)
+        self.unmovable = set() # PDFs já lançados que não puderam ser movidos (não reprocessar)
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+        return callback
+
+    def _emit(self, event, data):
+        for callback in list(self.listeners):
+            try:
+                callback(event, data)
+            except Exception:
+                logger.exception(f"Erro no ouvinte do evento '{event}'")
+
+    def cancel(self):
+        self.cancel_token.cancel()
+
+    def scan(self):
+        """Retorna, em ordem alfabética, os PDFs da pasta que já estão estáveis e completos."""
+        now = time.monotonic()
+        ready = []
+        seen = set()
+        for entry in sorted(os.scandir(self.folder), key=lambda e: e.name.lower()):
+            if not entry.is_file() or not entry.name.lower().endswith('.pdf') or entry.path in self.unmovable:
+                continue
+            seen.add(entry.path)
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            previous = self.pending.get(entry.path)
+            if previous is None or previous[:2] != (stat.st_size, stat.st_mtime):
+                self.pending[entry.path] = (stat.st_size, stat.st_mtime, now) # Novo ou ainda sendo gravado
+                continue
+            if now - previous[2] >= self.settle_seconds and stat.st_size > 0 and pdf_is_complete(entry.path):
+                ready.append(entry.path)
+        for path in list(self.pending): # Esquece arquivos removidos/renomeados por outra pessoa
+            if path not in seen:
+                del self.pending[path]
+        return ready
+
+    def _move_to(self, pdf_path, target_dir):
+        os.makedirs(target_dir, exist_ok=True)
+        base, ext = os.path.splitext(os.path.basename(pdf_path))
+        target = os.path.join(target_dir, base + ext)
+        suffix = 1
+        while os.path.exists(target): # Não sobrescreve um PDF de mesmo nome já movido
+            target = os.path.join(target_dir, f"{base} ({suffix}){ext}")
+            suffix += 1
+        try:
+            os.replace(pdf_path, target)
+        except OSError as e:
+            self.unmovable.add(pdf_path)
+            log_message(f"Não foi possível mover {pdf_path} para {target_dir}: {e}", "WARNING")
+        self.pending.pop(pdf_path, None)
+
+    def process_ready(self, ready):
+        """Processa um lote de PDFs prontos e move os concluídos (para Processados ou, se o OCR falhou, para Falhas)."""
+        result_file = time.strftime(self.result_file)
+        log_message(f"Pasta monitorada: {len(ready)} PDF(s) novo(s), gravando em {result_file}", "INFO")
+        done = {} # nome -> True se o PDF foi lido, False se o OCR falhou
+        batch = BatchProcessor(ready, result_file, self.config, self.cancel_token)
+        batch.listeners.extend(self.listeners)
+
+        def on_file_done(event, data):
+            if event == 'file_done':
+                done[data['name']] = data['ok']
+        batch.add_listener(on_file_done)
+        result = batch.run()
+        if result['planilha_salva']:
+            for pdf_path in ready:
+                ok = done.get(os.path.basename(pdf_path))
+                if ok:
+                    self._move_to(pdf_path, self.processed_dir)
+                elif ok is not None:
+                    log_message(f"OCR de {os.path.basename(pdf_path)} falhou; PDF movido para {self.failed_dir} "
+                                "(devolva-o à pasta monitorada para tentar de novo).", "WARNING")
+                    self._move_to(pdf_path, self.failed_dir)
+        else:
+            log_message("Planilha não salva; os PDFs continuam na pasta monitorada para nova tentativa.", "WARNING")
+        self._emit('watch_batch', {'files': ready, 'result': result})
+        return result
+
+    def run(self):
+        """Monitora a pasta até o cancelamento."""
+        if not os.path.isdir(self.folder):
+            raise FileNotFoundError(f"Pasta monitorada não encontrada: {self.folder}")
+        log_message(f"Monitorando a pasta {self.folder} (verificação a cada {self.poll_interval:g}s).", "INFO")
+        while not self.cancel_token.cancelled:
+            try:
+                ready = self.scan()
+                if ready:
+                    self.process_ready(ready)
+            except Exception as e:
+                logger.exception("Erro ao processar a pasta monitorada")
+                log_message(f"Erro na pasta monitorada: {e}", "ERROR")
+            if self.cancel_token.wait(self.poll_interval):
+                break
+        log_message("Monitoramento da pasta encerrado.", "INFO")
+
+    def start(self):
+        worker = Thread(target=self.run, daemon=True)
+        worker.start()
+        return worker
+
+# *** Aquecimento da Inicialização ***
+# Módulos pesados importados em segundo plano logo depois que a janela aparece, para o primeiro lote não
+# pagar a importação. O Python serializa a importação de cada módulo, então um lote iniciado durante o
+# aquecimento apenas aguarda o módulo terminar de carregar.
+WARM_UP_MODULES = ('pdf2image', 'openpyxl', 'openpyxl.styles', 'openpyxl.cell')
+
+def warm_up(modules=WARM_UP_MODULES):
+    """Lê as configurações, abre o cache e o índice de duplicatas e importa os módulos pesados numa thread daemon; retorna a thread."""
+    def run():
+        start = time.perf_counter()
+        get_ignored_cnpjs()
+        get_layout_templates()
+        get_ocr_cache()
+        get_duplicate_index()
+        for name in modules:
+            try:
+                importlib.import_module(name)
+            except Exception as e:
+                logger.warning(f"Não foi possível carregar o módulo {name} em segundo plano: {e}")
+        resolve_ocr_engine(OCR_ENGINE)
+        _numpy()
+        logger.info(f"Módulos de OCR e planilha carregados em segundo plano em {time.perf_counter() - start:.2f}s.")
+    worker = Thread(target=run, daemon=True)
+    worker.start()
+    return worker
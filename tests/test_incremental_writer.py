@@ -0,0 +1,91 @@
+"""
+Ida e volta do modo incremental da planilha: gravar com o StreamingSheetWriter, acrescentar linhas com o
+IncrementalSheetWriter e reabrir o .xlsx com o openpyxl.
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import json
+import tempfile
+import unittest
+
+# O core guarda log, cache e índices em %APPDATA%/PDF2EXCEL; os testes usam uma pasta temporária
+os.environ.setdefault('APPDATA', tempfile.mkdtemp(prefix='pdf2excel_testes_'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import openpyxl
+import pdf2excel_core as core
+
+LINHA_COMUM = ('boleto.pdf', 'Página 1', '0' * 47, 150.25, 'Custas:01', 'Beneficiário 12.345.678/0001-90')
+LINHA_AMARELA = ('guia.pdf', 'Página 1', '1' * 47, 3500.0, 'Custas:02', 'Valor acima do limite')
+
+def acrescentar(writer, row, yellow=False):
+    """Acrescenta a linha como o `add_batch` faz, pintando de amarelo se pedido."""
+    writer.append(row)
+    if yellow:
+        writer.yellow_rows.add(len(writer.rows) - 1)
+
+def is_yellow(cell):
+    return cell.fill.fill_type == 'solid' and str(cell.fill.fgColor.rgb).endswith('FFFF00')
+
+class IncrementalSheetWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.result_file = os.path.join(self.temp_dir.name, 'resultado.xlsx')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def gravar_sem_destaque(self):
+        writer, _ = core.open_result_sheet(self.result_file, streaming=True, incremental=True)
+        self.assertIsInstance(writer, core.StreamingSheetWriter)
+        acrescentar(writer, LINHA_COMUM)
+        writer.save(self.result_file)
+
+    def test_linha_amarela_acrescentada_a_planilha_sem_destaque(self):
+        self.gravar_sem_destaque()
+
+        writer, last_custas = core.open_result_sheet(self.result_file, streaming=True, incremental=True)
+        self.assertIsInstance(writer, core.IncrementalSheetWriter)
+        self.assertEqual(last_custas, 1)
+        acrescentar(writer, LINHA_AMARELA, yellow=True)
+        writer.save(self.result_file)
+
+        wb = openpyxl.load_workbook(self.result_file)
+        try:
+            ws = wb.active
+            self.assertEqual(ws.max_row, 3)
+            self.assertEqual(tuple(cell.value for cell in ws[2]), LINHA_COMUM)
+            self.assertEqual(tuple(cell.value for cell in ws[3]), LINHA_AMARELA)
+            self.assertFalse(any(is_yellow(cell) for cell in ws[2]))
+            self.assertTrue(all(is_yellow(cell) for cell in ws[3]))
+            self.assertEqual(ws['D2'].number_format, core.CURRENCY_FORMAT)
+            self.assertEqual(ws['D3'].number_format, core.CURRENCY_FORMAT)
+        finally:
+            wb.close()
+        self.assertEqual(core.load_sheet_index(self.result_file)['registros'], 2)
+
+    def test_indice_com_estilo_inexistente_regrava_a_planilha(self):
+        self.gravar_sem_destaque()
+        index_path = core.sheet_index_path(self.result_file)
+        with open(index_path, encoding='utf-8') as f:
+            index = json.load(f)
+        index['estilos']['amarelo_valor'] = core.sheet_style_count(self.result_file) # Um além do último
+        with open(index_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+
+        self.assertIsNone(core.load_sheet_index(self.result_file))
+        writer, _ = core.open_result_sheet(self.result_file, streaming=True, incremental=True)
+        self.assertNotIsInstance(writer, core.IncrementalSheetWriter)
+        acrescentar(writer, LINHA_AMARELA, yellow=True)
+        writer.save(self.result_file)
+
+        wb = openpyxl.load_workbook(self.result_file)
+        try:
+            self.assertTrue(all(is_yellow(cell) for cell in wb.active[3]))
+        finally:
+            wb.close()
+
+if __name__ == '__main__':
+    unittest.main()